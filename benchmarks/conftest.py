@@ -0,0 +1,136 @@
+"""Замеры view на наполненной БД SQLite.
+
+По умолчанию pytest собирает только tests/, замеры запускаются явно
+из корня репозитория (yatube/ попадает в путь через python_paths
+из pytest.ini):
+
+    python -m pytest benchmarks --bench-scales=small,medium \\
+        --bench-json=bench.json --bench-baseline=old.json
+
+Каждый масштаб наполняется posts.seeding.Seeder один раз на сессию,
+тесты одного масштаба идут подряд. Итоги выводятся таблицей, с
+--bench-json сохраняются в JSON, с --bench-baseline сравниваются с
+сохранённым ранее прогоном.
+"""
+import json
+import platform
+import sqlite3
+from datetime import datetime, timezone
+
+import django
+import pytest
+from django.core.management import call_command
+
+from posts.seeding import Seeder
+
+SCALES = {
+    'small': dict(users=50, groups=5, posts=2_000, comments=4_000,
+                  follows=10),
+    'medium': dict(users=300, groups=20, posts=20_000, comments=60_000,
+                   follows=20),
+    'large': dict(users=1_000, groups=50, posts=100_000, comments=300_000,
+                  follows=20),
+}
+# {масштаб: {view: итоги}}
+RESULTS = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('benchmarks', 'Замеры view')
+    group.addoption('--bench-scales', default='small',
+                    help=f'Масштабы через запятую: {", ".join(SCALES)}.')
+    group.addoption('--bench-requests', type=int, default=30,
+                    help='Запросов на каждый замер.')
+    group.addoption('--bench-json', default=None,
+                    help='Файл для итогов в JSON.')
+    group.addoption('--bench-baseline', default=None,
+                    help='JSON прошлого прогона для сравнения.')
+
+
+def pytest_generate_tests(metafunc):
+    if 'scale' in metafunc.fixturenames:
+        scales = metafunc.config.getoption('bench_scales').split(',')
+        unknown = set(scales) - set(SCALES)
+        if unknown:
+            raise pytest.UsageError(
+                f'Неизвестные масштабы: {", ".join(sorted(unknown))}.'
+            )
+        metafunc.parametrize('scale', scales, indirect=True,
+                             scope='session')
+
+
+@pytest.fixture(scope='session')
+def scale(request, django_db_setup, django_db_blocker):
+    """Имя масштаба; БД очищена и наполнена под него."""
+    with django_db_blocker.unblock():
+        call_command('flush', interactive=False, verbosity=0)
+        Seeder(prefix='bench', **SCALES[request.param]).run()
+    return request.param
+
+
+@pytest.fixture
+def bench_requests(request):
+    return request.config.getoption('bench_requests')
+
+
+@pytest.fixture
+def bench_record():
+    """record(scale, view, **итоги) - сохранить итоги замера."""
+    def record(scale, view, **results):
+        RESULTS.setdefault(scale, {})[view] = results
+    return record
+
+
+def environment():
+    return {
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'scales': SCALES,
+    }
+
+
+def load_baseline(config):
+    path = config.getoption('bench_baseline')
+    if not path:
+        return {}
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)['results']
+
+
+def change(current, previous):
+    if not previous:
+        return ''
+    return f'{(current - previous) / previous:+.0%}'
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not RESULTS:
+        return
+    baseline = load_baseline(config)
+    write = terminalreporter.write_line
+    terminalreporter.section('Замеры view')
+    write(f'{"масштаб":<8}{"view":<14}{"SQL":>5}{"бюджет":>8}'
+          f'{"p50, мс":>9}{"p95, мс":>9}{"p99, мс":>9}{"в с":>8}'
+          f'{"p50 было":>10}')
+    for scale, views in RESULTS.items():
+        for view, result in views.items():
+            cold = result['cold']
+            previous = baseline.get(scale, {}).get(view, {}).get('cold', {})
+            write(
+                f'{scale:<8}{view:<14}{result["queries"]:>5}'
+                f'{result["budget"]:>8}{cold["p50"]:>9.1f}'
+                f'{cold["p95"]:>9.1f}{cold["p99"]:>9.1f}'
+                f'{cold["throughput"]:>8.0f}'
+                f'{change(cold["p50"], previous.get("p50")):>10}'
+            )
+
+
+def pytest_sessionfinish(session):
+    path = session.config.getoption('bench_json')
+    if not path or not RESULTS:
+        return
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'environment': environment(), 'results': RESULTS},
+                  file, ensure_ascii=False, indent=2)
@@ -0,0 +1,110 @@
+"""Время ответа и бюджеты SQL-запросов основных view.
+
+Бюджет - предел числа запросов к БД на один ответ вошедшему читателю
+при пустом кеше. Он не зависит от масштаба: запрос на каждую запись
+или комментарий (N+1) выходит за бюджет уже на small.
+"""
+from http import HTTPStatus
+
+import pytest
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.bench import measure, summary
+from posts.models import Follow, Group, Post, User
+
+BUDGETS = {
+    'index': 8,
+    'group_posts': 9,
+    'profile': 10,
+    'post_view': 8,
+    'follow_index': 10,
+    'add_comment': 16,
+}
+
+
+class Targets:
+    """Самые тяжёлые на масштабе страницы: популярная подборка, автор
+    с наибольшим числом записей, запись с наибольшим числом
+    комментариев, читатель с наибольшим числом подписок."""
+
+    def __init__(self):
+        self.group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        self.author = User.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        self.post = Post.objects.select_related('author').order_by(
+            '-comments_count'
+        ).first()
+        reader_id = Follow.objects.values('user_id').annotate(
+            total=Count('pk')
+        ).order_by('-total')[0]['user_id']
+        self.reader = User.objects.get(pk=reader_id)
+
+    def request(self, view):
+        """(метод, адрес, данные, ожидаемый код ответа)."""
+        post = self.post
+        urls = {
+            'index': reverse('index'),
+            'group_posts': reverse('group', args=(self.group.slug,)),
+            'profile': reverse('profile', args=(self.author.username,)),
+            'post_view': reverse('post', args=(post.author.username,
+                                               post.pk)),
+            'follow_index': reverse('follow_index'),
+        }
+        if view == 'add_comment':
+            url = reverse('add_comment', args=(post.author.username,
+                                               post.pk))
+            return 'post', url, {'text': 'Замер'}, HTTPStatus.FOUND
+        return 'get', urls[view], None, HTTPStatus.OK
+
+
+@pytest.fixture(scope='session')
+def targets(scale, django_db_blocker):
+    with django_db_blocker.unblock():
+        return Targets()
+
+
+def timings(send, count, cold):
+    def request():
+        if cold:
+            cache.clear()
+        send()
+    return summary(measure(request, count))
+
+
+@pytest.mark.parametrize('view', [
+    'index', 'group_posts', 'profile', 'post_view', 'follow_index',
+    'add_comment',
+])
+def test_view(view, scale, targets, db, bench_requests, bench_record):
+    client = Client()
+    client.force_login(targets.reader)
+    method, url, data, status = targets.request(view)
+
+    def send():
+        return getattr(client, method)(url, data)
+
+    cache.clear()
+    reset_queries()
+    with CaptureQueriesContext(connection) as captured:
+        response = send()
+    assert response.status_code == status
+    # Следующие запросы клиента очищают журнал, из которого читает
+    # CaptureQueriesContext
+    queries = [query['sql'] for query in captured]
+
+    results = {'queries': len(queries), 'budget': BUDGETS[view]}
+    for mode, cold in (('cold', True), ('warm', False)):
+        stats = timings(send, bench_requests, cold)
+        stats['throughput'] = 1000 / stats['mean']
+        results[mode] = stats
+    bench_record(scale, view, **results)
+
+    assert len(queries) <= BUDGETS[view], '\n'.join(queries)
@@ -0,0 +1,23 @@
+import tempfile
+
+import pytest
+
+from yatube.testing import temporary_files
+
+
+@pytest.fixture(autouse=True)
+def thumbnails_sync(settings):
+    """Копии картинок создаются в запросе, а не в пуле потоков.
+
+    Поток пула пишет в ту же базу SQLite в памяти, что и тест, и
+    очистка базы после теста падает на заблокированной таблице.
+    """
+    settings.THUMBNAIL_SYNC = True
+
+
+@pytest.fixture(autouse=True, scope='session')
+def temporary_project_files():
+    """Метаданные миниатюр - во временном файле, а не в файле проекта."""
+    with tempfile.TemporaryDirectory() as directory:
+        with temporary_files(directory):
+            yield
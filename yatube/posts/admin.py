@@ -1,50 +1,157 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.html import format_html
 
+from . import search
 from .models import Comment, Follow, Group, Post
+from .paginators import EstimatedCountPaginator
 
 EMPTY_VALUE_DISPLAY = '-пусто-'
 
 User = get_user_model()
 
 
-class PostsInstanceInline(admin.TabularInline):
+class LatestInlineFormSet(BaseInlineFormSet):
+    """Формы только для limit первых объектов связи."""
+    limit = None
+
+    def get_queryset(self):
+        if not hasattr(self, '_limited_queryset'):
+            queryset = super().get_queryset()
+            if self.limit is not None:
+                queryset = queryset[:self.limit]
+            self._limited_queryset = queryset
+        return self._limited_queryset
+
+
+class LatestInline(admin.TabularInline):
+    """Последние limit связанных объектов, только для просмотра.
+
+    У подборки и записи могут быть тысячи записей и комментариев:
+    полный список на странице правки не выводится, остальные
+    открываются ссылкой на отфильтрованный список.
+    """
+    formset = LatestInlineFormSet
+    limit = 20
+    extra = 0
+    max_num = 0
+    can_delete = False
+    show_change_link = True
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.limit = self.limit
+        return formset
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author')
+
+
+class PostsInstanceInline(LatestInline):
     model = Post
+    fields = readonly_fields = ('pub_date', 'author', 'text')
 
 
-class CommentsInstanceInline(admin.TabularInline):
+class CommentsInstanceInline(LatestInline):
     model = Comment
+    fields = readonly_fields = ('created', 'author', 'text')
+    ordering = ('-created',)
 
 
 class FollowsInstanceInline(admin.TabularInline):
     model = Follow
 
 
-class PostAdmin(admin.ModelAdmin):
+class HasImageFilter(admin.SimpleListFilter):
+    """Фильтр по наличию картинки вместо списка всех её файлов."""
+    title = 'картинка'
+    parameter_name = 'has_image'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Есть'), ('no', 'Нет'))
+
+    def queryset(self, request, queryset):
+        without_image = Q(image='') | Q(image=None)
+        if self.value() == 'yes':
+            return queryset.exclude(without_image)
+        if self.value() == 'no':
+            return queryset.filter(without_image)
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список большой таблицы без COUNT(*) по всем её строкам."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    empty_value_display = EMPTY_VALUE_DISPLAY
+
+
+class PostAdmin(LargeTableAdmin):
     list_display = ('id', 'text', 'pub_date', 'author', 'group', 'image')
-    search_fields = ('text', 'author', 'group', 'image')
-    list_filter = ('pub_date', 'author', 'group', 'image')
+    list_select_related = ('author', 'group')
+    search_fields = ('text', '=author__username', '=group__slug')
+    list_filter = ('pub_date', HasImageFilter)
+    date_hierarchy = 'pub_date'
+    autocomplete_fields = ('author', 'group')
+    readonly_fields = ('comments_link',)
     inlines = [CommentsInstanceInline]
-    empty_value_display = EMPTY_VALUE_DISPLAY
+
+    def get_search_fields(self, request):
+        # Текст записей и комментариев ищется по поисковому индексу
+        # (get_search_results), а не перебором icontains по всей таблице
+        return [field for field in super().get_search_fields(request)
+                if field != 'text']
+
+    def get_search_results(self, request, queryset, search_term):
+        found, use_distinct = super().get_search_results(
+            request, queryset, search_term
+        )
+        if search_term:
+            found |= search.filter_posts(queryset, search_term)
+        return found, use_distinct
+
+    def comments_link(self, post):
+        url = reverse('admin:posts_comment_changelist')
+        return format_html(
+            '<a href="{}?post__id__exact={}">Все комментарии записи</a>',
+            url, post.pk
+        )
+    comments_link.short_description = 'Комментарии'
 
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'slug', 'description')
     search_fields = ('title', 'description', 'slug')
-    list_filter = ('title',)
+    readonly_fields = ('posts_link',)
     inlines = [PostsInstanceInline]
 
+    def posts_link(self, group):
+        url = reverse('admin:posts_post_changelist')
+        return format_html(
+            '<a href="{}?group__id__exact={}">Все записи подборки</a>',
+            url, group.pk
+        )
+    posts_link.short_description = 'Записи'
+
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ('id', 'text', 'created', 'author', 'post')
-    search_fields = ('text', 'author', 'post')
-    list_filter = ('created', 'author')
+    list_select_related = ('author', 'post')
+    search_fields = ('=author__username',)
+    date_hierarchy = 'created'
+    autocomplete_fields = ('author', 'post')
+    ordering = ('-created',)
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'author')
-    search_fields = ('user', 'author')
-    list_filter = ('user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('=user__username', '=author__username')
+    autocomplete_fields = ('user', 'author')
+    ordering = ('-pk',)
 
 
 admin.site.register(Post, PostAdmin)
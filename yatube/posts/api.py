@@ -0,0 +1,201 @@
+"""JSON API только для чтения: ленты, запись и её комментарии, а для
+персонала - сводка замеров запросов.
+
+Ленты выбираются теми же запросами и индексами, что и HTML-страницы,
+но строками values() без создания моделей, и листаются курсором
+(?cursor=) по ключу (pub_date, id), у комментариев - (created, id).
+
+Ответы отдают ETag, клиент получает 304 без выборки самой ленты. ETag
+ленты строится по поколениям её областей кеша (invalidation.py) и
+меняется при любой правке записей и комментариев в ленте. Last-Modified
+у лент нет: дата самой новой записи не меняется при правке и удалении.
+У записи и её комментариев оба заголовка - по Post.updated.
+"""
+from functools import wraps
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_safe
+
+from . import invalidation, metrics
+from .models import Group, Post, User
+from .paginators import CursorPaginator
+from .storage import content_storage
+from .timeline import TimelineFeed
+
+POST_FIELDS = ('id', 'text', 'pub_date', 'updated', 'author__username',
+               'group__slug', 'image', 'comments_count')
+COMMENT_FIELDS = ('id', 'text', 'created', 'author__username', 'post_id')
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def json_response(data, status=HTTPStatus.OK):
+    return JsonResponse(
+        data, status=status, safe=False, encoder=DjangoJSONEncoder,
+        json_dumps_params=JSON_PARAMS
+    )
+
+
+def api_login_required(view):
+    """Как login_required, но с ответом 401 вместо перехода на вход."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return json_response({'detail': 'Требуется вход.'},
+                                 HTTPStatus.UNAUTHORIZED)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def api_staff_required(view):
+    """Только для персонала: 401 гостю, 403 остальным."""
+    @wraps(view)
+    @api_login_required
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_staff:
+            return json_response({'detail': 'Только для персонала.'},
+                                 HTTPStatus.FORBIDDEN)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def post_data(row):
+    """Запись для ответа из строки values(POST_FIELDS)."""
+    image = row['image']
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'pub_date': row['pub_date'],
+        'updated': row['updated'],
+        'author': row['author__username'],
+        'group': row['group__slug'],
+        'image': content_storage.url(image) if image else None,
+        'comments_count': row['comments_count'],
+    }
+
+
+def comment_data(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'created': row['created'],
+        'author': row['author__username'],
+        'post': row['post_id'],
+    }
+
+
+def cursor_url(request, cursor):
+    return f'{request.path}?cursor={cursor}' if cursor else None
+
+
+def page_response(request, rows, serialize, **paginator_options):
+    paginator = CursorPaginator(
+        rows, settings.PAGINATOR_DEFAULT_SIZE, **paginator_options
+    )
+    page = paginator.get_page(request.GET.get('cursor'))
+    return json_response({
+        'results': [serialize(row) for row in page],
+        'next': cursor_url(request, page.next_cursor),
+        'previous': cursor_url(request, page.previous_cursor),
+    })
+
+
+def feed_rows(posts):
+    return posts.values(*POST_FIELDS)
+
+
+def feed_condition(get_scopes, per_user=False):
+    """Декоратор view ленты: ETag по поколениям областей."""
+    def etag(request, *args, **kwargs):
+        extra = (request.user.pk,) if per_user else ()
+        return invalidation.page_etag(
+            request, get_scopes(request, *args, **kwargs), *extra
+        )
+    return condition(etag_func=etag)
+
+
+def follow_posts_of(request):
+    return TimelineFeed(request.user).as_queryset().prefetch_related(None)
+
+
+def post_updated(request, post_id):
+    return Post.objects.filter(pk=post_id).values_list(
+        'updated', flat=True
+    ).first()
+
+
+def post_etag(request, post_id):
+    updated = post_updated(request, post_id)
+    if updated is None:
+        return None
+    return invalidation.digest(f'{request.get_full_path()}:{updated}')
+
+
+@require_safe
+@feed_condition(lambda request: [(invalidation.SCOPE_FEED, None)])
+def index(request):
+    return page_response(request, feed_rows(Post.objects.all()), post_data)
+
+
+@require_safe
+@feed_condition(lambda request, slug: [(invalidation.SCOPE_GROUP, slug)])
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return page_response(request, feed_rows(group.posts.all()), post_data)
+
+
+@require_safe
+@feed_condition(
+    lambda request, username: [(invalidation.SCOPE_AUTHOR, username)]
+)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return page_response(request, feed_rows(author.posts.all()), post_data)
+
+
+@require_safe
+@api_login_required
+@feed_condition(
+    lambda request: [(invalidation.SCOPE_FEED, None),
+                     (invalidation.SCOPE_AUTHOR, request.user.username)],
+    per_user=True
+)
+def follow_index(request):
+    return page_response(request, feed_rows(follow_posts_of(request)),
+                         post_data)
+
+
+@require_safe
+@condition(etag_func=post_etag, last_modified_func=post_updated)
+def post_view(request, post_id):
+    row = get_object_or_404(feed_rows(Post.objects.all()), pk=post_id)
+    return json_response(post_data(row))
+
+
+@require_safe
+@condition(etag_func=post_etag, last_modified_func=post_updated)
+def post_comments(request, post_id):
+    # Добавление и удаление комментария меняет Post.updated, поэтому
+    # заголовки записи подходят и для её комментариев
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    return page_response(
+        request, post.comments.values(*COMMENT_FIELDS), comment_data,
+        date_field='created', newest_first=False
+    )
+
+
+@require_safe
+@api_staff_required
+def metrics_view(request):
+    """Сводка замеров всех процессов по view, см. posts/metrics.py."""
+    summary = metrics.collect()
+    return json_response({
+        'views': metrics.report(summary),
+        'slowest': [
+            {'ms': duration, 'sql': sql, 'view': view}
+            for duration, sql, view in summary['slowest']
+        ],
+    })
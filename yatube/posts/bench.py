@@ -0,0 +1,81 @@
+"""Общие инструменты для management-команд замера производительности.
+
+Замеры выполняются во временной тестовой БД, чтобы не трогать рабочие
+данные и получать воспроизводимый набор записей.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from .models import Group, Post
+
+User = get_user_model()
+
+
+@contextmanager
+def throwaway_database():
+    """Создать на время замера чистую тестовую БД и удалить её после."""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def bulk_posts(count, authors=10, groups=0, batch_size=5000):
+    """Быстро наполнить таблицу записей count постами от authors авторов.
+
+    Каждая третья запись попадает в одну из groups подборок, если они
+    заданы. Сигналы при этом не срабатывают.
+    """
+    User.objects.bulk_create(
+        User(username=f'bench_author_{i}') for i in range(authors)
+    )
+    users = list(User.objects.filter(username__startswith='bench_author_'))
+    Group.objects.bulk_create(
+        Group(title=f'bench group {i}', slug=f'bench-group-{i}')
+        for i in range(groups)
+    )
+    group_ids = list(Group.objects.filter(
+        slug__startswith='bench-group-'
+    ).values_list('pk', flat=True))
+    for start in range(0, count, batch_size):
+        Post.objects.bulk_create(
+            Post(text=f'bench post {i}', author=users[i % len(users)],
+                 group_id=(group_ids[i % len(group_ids)]
+                           if group_ids and i % 3 == 0 else None))
+            for i in range(start, min(start + batch_size, count))
+        )
+    return users
+
+
+def measure(func, repeat):
+    """Выполнить func repeat раз, вернуть длительности в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(timings, percent):
+    ordered = sorted(timings)
+    index = round(percent / 100 * (len(ordered) - 1))
+    return ordered[index]
+
+
+def summary(timings):
+    """Сводка по замерам: медиана, 95-й и 99-й перцентили, среднее."""
+    return {
+        'p50': statistics.median(timings),
+        'p95': percentile(timings, 95),
+        'p99': percentile(timings, 99),
+        'mean': statistics.mean(timings),
+    }
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                'django.core.cache.backends.dummy.DummyCache')
+
+
+@register('caches')
+def check_shared_cache(app_configs, **kwargs):
+    """Вне DEBUG кеш должен быть общим для процессов, см. CACHES."""
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'Кеш {backend.rsplit(".", 1)[-1]} не общий для процессов: '
+        f'страницы, карточки, очередь комментариев и сводки замеров '
+        f'в разных процессах разойдутся.',
+        hint='Задайте YATUBE_CACHE_BACKEND и YATUBE_CACHE_LOCATION, '
+             'например memcached.',
+        id='posts.W001',
+    )]
+
+
+@register()
+def check_comment_journal(app_configs, **kwargs):
+    """Журнал комментариев требует fcntl, см. comment_buffer."""
+    from . import comment_buffer
+
+    if (settings.COMMENT_BUFFER_DURABILITY != comment_buffer.JOURNAL
+            or comment_buffer.fcntl is not None):
+        return []
+    return [Warning(
+        'Журнал комментариев не ведётся: на этой платформе нет fcntl, '
+        'очередь комментариев держится только в памяти процесса.',
+        hint='Задайте COMMENT_BUFFER_DURABILITY = "memory" или "sync".',
+        id='posts.W002',
+    )]
@@ -0,0 +1,380 @@
+"""Отложенная запись комментариев.
+
+add_comment сохранял каждый комментарий в своём запросе: INSERT,
+сдвиг счётчика, переиндексация записи со всеми её комментариями и
+смена поколений кеша - на каждый комментарий, даже когда под одной
+записью пишут десятки человек в секунду. Здесь комментарии копятся
+в очереди процесса, и поток буфера записывает их одним bulk_create
+раз в COMMENT_BUFFER_INTERVAL секунд или сразу, как наберётся
+COMMENT_BUFFER_SIZE. bulk_create не отправляет сигналов, поэтому то,
+что для comment.save() делают обработчики signals.py, save_comments()
+делает один раз на запись за всю пачку.
+
+Автор видит свои ещё не записанные комментарии сразу: до записи в БД
+каждый лежит в кеше под своим ключом с номером из счётчика пользователя
+(cache.incr), post_view выводит их под комментариями записи, а
+постановка в очередь меняет поколение записи, чтобы браузер не получил
+304 со старой страницей.
+
+Надёжность задаёт COMMENT_BUFFER_DURABILITY:
+
+- 'sync' - буфера нет, комментарий записывается в запросе;
+- 'memory' - при падении процесса пропадают комментарии, не записанные
+  за последний интервал;
+- 'journal' - до ответа комментарий дописывается в журнал процесса
+  с fsync. Журналы упавших процессов дописывает в БД поток буфера
+  при запуске и команда flush_comments. Запись из журнала выполняется
+  не меньше одного раза: если процесс упал между записью пачки и
+  очисткой журнала, пачка прочитается повторно, но уже записанные
+  комментарии отбрасываются (unsaved). Журнал живого процесса
+  отличается от журнала упавшего блокировкой fcntl; где её нет
+  (Windows), журнал не ведётся и 'journal' работает как 'memory'.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import invalidation, search
+from .models import Comment, Post, User, bulk_batch_size
+from .seeding import explicit_dates
+from .signals import post_page_scopes, shift_counter
+
+logger = logging.getLogger(__name__)
+
+SYNC = 'sync'
+MEMORY = 'memory'
+JOURNAL = 'journal'
+# Сколько хранить ещё не записанные комментарии пользователя в кеше,
+# секунд: если процесс упал, они не висят на странице вечно
+PENDING_TIMEOUT = 60 * 10
+# Сколько последних комментариев пользователя проверять на странице
+PENDING_SHOWN = 50
+
+
+def durability():
+    """COMMENT_BUFFER_DURABILITY с учётом платформы.
+
+    Без fcntl журнал живого процесса не отличить от журнала упавшего,
+    и replay_journals записал бы чужую очередь второй раз.
+    """
+    value = settings.COMMENT_BUFFER_DURABILITY
+    if value == JOURNAL and fcntl is None:
+        return MEMORY
+    return value
+
+
+def is_enabled():
+    return durability() != SYNC
+
+
+def pending_key(user_id, number):
+    return f'posts:comments:pending:{user_id}:{number}'
+
+
+def remember_pending(item):
+    """Положить комментарий в кеш под новым номером пользователя.
+
+    Номер выдаёт incr, поэтому два одновременных комментария одного
+    пользователя не перезаписывают друг друга. Ключ сохраняется
+    в item['pending_key'], по нему комментарий забывается после записи.
+    """
+    counter = pending_key(item['author_id'], 'last')
+    for attempt in range(3):
+        cache.add(counter, 0, PENDING_TIMEOUT)
+        try:
+            number = cache.incr(counter)
+            break
+        except ValueError:
+            # Счётчик истёк между add и incr
+            continue
+    else:
+        # Кеш ничего не хранит (DummyCache): показывать нечего
+        return
+    item['pending_key'] = pending_key(item['author_id'], number)
+    cache.set(item['pending_key'], item, PENDING_TIMEOUT)
+    # Счётчик живёт не меньше последнего комментария: иначе номера
+    # начнутся заново и затрут ещё не записанные
+    cache.touch(counter, PENDING_TIMEOUT)
+
+
+def forget_pending(items):
+    # В журналах, записанных до ключей на комментарий, ключа нет
+    cache.delete_many(
+        [item['pending_key'] for item in items if 'pending_key' in item]
+    )
+
+
+def pending_comments(user, post):
+    """Ещё не записанные в БД комментарии пользователя к записи."""
+    if not user.is_authenticated or not is_enabled():
+        return []
+    last = cache.get(pending_key(user.pk, 'last'))
+    if not last:
+        return []
+    keys = [pending_key(user.pk, number)
+            for number in range(max(last - PENDING_SHOWN, 0) + 1, last + 1)]
+    pending = cache.get_many(keys)
+    return [
+        Comment(post=post, author=user, text=item['text'],
+                created=item['created'])
+        for item in (pending[key] for key in keys if key in pending)
+        if item['post_id'] == post.pk
+    ]
+
+
+def save_comments(items):
+    """Записать комментарии одной транзакцией, проиндексировать их и
+    по разу на запись сдвинуть её счётчик и сменить поколения её
+    страниц.
+
+    Комментарии к удалённым за это время записям и от удалённых
+    пользователей отбрасываются. return - число записанных.
+    """
+    posts = Post.objects.select_related('author').in_bulk(
+        {item['post_id'] for item in items}
+    )
+    authors = set(User.objects.filter(
+        pk__in={item['author_id'] for item in items}
+    ).values_list('pk', flat=True))
+    # Время создания - время постановки в очередь, а не записи: иначе
+    # порядок разошёлся бы с показанным до записи, а комментарии из
+    # журнала получили бы время восстановления
+    comments = [
+        Comment(post_id=item['post_id'], author_id=item['author_id'],
+                text=item['text'], created=item['created'])
+        for item in items
+        if item['post_id'] in posts and item['author_id'] in authors
+    ]
+    per_post = Counter(comment.post_id for comment in comments)
+    created = Comment._meta.get_field('created')
+    with transaction.atomic(), explicit_dates(created):
+        # bulk_create на SQLite не возвращает id: новые комментарии -
+        # это всё, что выше последнего id до вставки. Попавшие туда
+        # чужие комментарии проиндексируются повторно, без вреда.
+        last_pk = Comment.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        Comment.objects.bulk_create(comments, batch_size=bulk_batch_size(
+            Comment, settings.COMMENT_BUFFER_SIZE
+        ))
+        search.index_comments(Comment.objects.filter(
+            pk__gt=last_pk
+        ).values_list('pk', 'post_id', 'text').iterator())
+        now = timezone.now()
+        for post_id, count in per_post.items():
+            shift_counter(Post.objects.filter(pk=post_id),
+                          'comments_count', count, updated=now)
+    scopes = []
+    for post_id in per_post:
+        post = posts[post_id]
+        scopes += post_page_scopes(post, (post.group_id,))
+        scopes.append((invalidation.SCOPE_POST, post_id))
+    invalidation.bump_generations(scopes)
+    return len(comments)
+
+
+def try_lock(journal):
+    """Захватить журнал. Журнал живого процесса захвачен им самим."""
+    try:
+        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def dump_item(item):
+    # isoformat, а не DjangoJSONEncoder: тот обрезает время до
+    # миллисекунд, и по нему не узнать уже записанный комментарий
+    return json.dumps(dict(item, created=item['created'].isoformat()))
+
+
+def load_items(journal):
+    items = []
+    for line in journal:
+        try:
+            item = json.loads(line)
+        except ValueError:
+            # Строка, которую процесс не успел дописать при падении
+            continue
+        item['created'] = parse_datetime(item['created'])
+        items.append(item)
+    return items
+
+
+def unsaved(items):
+    """Пункты журнала, которых ещё нет в БД.
+
+    Повторы одного пункта убираются по token, а уже записанный
+    комментарий узнаётся по записи, автору и времени создания: оно
+    переносится из очереди в БД с точностью до микросекунды.
+    """
+    items = list({item['token']: item for item in items}.values())
+    created = [item['created'] for item in items]
+    saved = set(Comment.objects.filter(
+        created__range=(min(created), max(created))
+    ).values_list('post_id', 'author_id', 'created'))
+    return [
+        item for item in items
+        if (item['post_id'], item['author_id'], item['created']) not in saved
+    ]
+
+
+class CommentBuffer:
+    """Очередь комментариев процесса, см. описание модуля."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.items = []
+        self.thread = None
+        self.journal = None
+
+    def add(self, post, author, text):
+        """Поставить комментарий в очередь.
+
+        Без потока (COMMENT_BUFFER_INTERVAL = 0) полная очередь
+        записывается здесь же, в запросе.
+        """
+        item = {
+            'token': uuid.uuid4().hex,
+            'post_id': post.pk,
+            'author_id': author.pk,
+            'text': text,
+            'created': timezone.now(),
+        }
+        # До постановки в очередь: иначе пачку могут записать и забыть
+        # раньше, чем комментарий появится среди ожидающих
+        remember_pending(item)
+        with self.lock:
+            if durability() == JOURNAL:
+                self.write_journal([item])
+            self.items.append(item)
+            full = len(self.items) >= settings.COMMENT_BUFFER_SIZE
+            if full:
+                self.ready.notify()
+        invalidation.bump_generations([(invalidation.SCOPE_POST, post.pk)])
+        if settings.COMMENT_BUFFER_INTERVAL:
+            self.start()
+        elif full:
+            self.flush_quietly()
+        return item
+
+    def flush(self):
+        """Записать очередь в БД. При ошибке очередь остаётся прежней.
+
+        return - число записанных комментариев.
+        """
+        with self.lock:
+            items, self.items = self.items, []
+        if not items:
+            return 0
+        try:
+            saved = save_comments(items)
+        except Exception:
+            with self.lock:
+                self.items[:0] = items
+            raise
+        with self.lock:
+            if self.journal is not None:
+                self.journal.seek(0)
+                self.journal.truncate()
+                self.write_journal(self.items)
+        forget_pending(items)
+        return saved
+
+    def flush_quietly(self):
+        try:
+            return self.flush()
+        except Exception:
+            logger.exception('Comment buffer flush failed')
+            return 0
+
+    def open_journal(self):
+        if self.journal is None:
+            directory = settings.COMMENT_BUFFER_JOURNAL_DIR
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(
+                directory, f'{os.getpid()}-{uuid.uuid4().hex}.jsonl'
+            )
+            self.journal = open(path, 'a+', encoding='utf-8')
+            try_lock(self.journal)
+        return self.journal
+
+    def write_journal(self, items):
+        journal = self.open_journal()
+        for item in items:
+            journal.write(dump_item(item) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(
+                target=self.run, name='comment-buffer', daemon=True
+            )
+            self.thread.start()
+
+    def run(self):
+        try:
+            replay_journals()
+        except Exception:
+            logger.exception('Comment journal replay failed')
+        while True:
+            with self.lock:
+                if len(self.items) < settings.COMMENT_BUFFER_SIZE:
+                    self.ready.wait(settings.COMMENT_BUFFER_INTERVAL)
+            self.flush_quietly()
+            # Соединение с базой у потока буфера своё
+            connection.close()
+
+
+buffer = CommentBuffer()
+atexit.register(buffer.flush_quietly)
+
+
+def replay_journals():
+    """Записать в БД комментарии из журналов завершившихся процессов.
+
+    return - число записанных комментариев.
+    """
+    directory = settings.COMMENT_BUFFER_JOURNAL_DIR
+    if fcntl is None or not os.path.isdir(directory):
+        return 0
+    own = buffer.journal.name if buffer.journal is not None else None
+    saved = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith('.jsonl') or path == own:
+            continue
+        try:
+            journal = open(path, 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with journal:
+            # Журнал живого процесса или уже записанный другим процессом
+            if (not try_lock(journal)
+                    or not os.fstat(journal.fileno()).st_nlink):
+                continue
+            items = load_items(journal)
+            if items:
+                saved += save_comments(unsaved(items))
+                forget_pending(items)
+            os.remove(path)
+    return saved
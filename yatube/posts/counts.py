@@ -0,0 +1,70 @@
+"""Кешированные счётчики записей для пагинатора.
+
+Общее количество объектов нужно пагинатору только для номеров страниц,
+поэтому оно хранится в кеше по областям (вся лента, подборка, автор,
+лента подписок читателя) и поддерживается сигналами из signals.py.
+Записи, созданные в обход сигналов (bulk_create, update), становятся
+видны в счётчике не позже PAGINATOR_COUNT_TIMEOUT секунд.
+
+Сдвиг счётчика, которого ещё нет в кеше, пропускается. Если он пришёлся
+на время между COUNT(*) и записью результата в кеш, записанное значение
+уже устарело; чтобы его не держать, каждый сдвиг и сброс меняет общую
+версию счётчиков, и cached_count удаляет своё значение, если версия
+за время подсчёта сменилась.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+SCOPE_ALL = 'all'
+SCOPE_GROUP = 'group'
+SCOPE_AUTHOR = 'author'
+SCOPE_FOLLOW = 'follow'
+SCOPE_GROUPS = 'groups'
+VERSION_KEY = 'posts:count:version'
+
+
+def count_key(scope, pk=None):
+    """Ключ кеша со счётчиком объектов области scope."""
+    if pk is None:
+        return f'posts:count:{scope}'
+    return f'posts:count:{scope}:{pk}'
+
+
+def cached_count(key, objects):
+    """Вернуть количество objects, при промахе посчитать и запомнить."""
+    cached = cache.get_many([key, VERSION_KEY])
+    count = cached.get(key)
+    if count is None:
+        count = objects.count()
+        if (cache.add(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+                and cache.get(VERSION_KEY) != cached.get(VERSION_KEY)):
+            # Пока считали, счётчик менялся: посчитает следующий запрос
+            cache.delete(key)
+    return count
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, None)
+
+
+def change_counts(keys, delta):
+    """Сдвинуть на delta счётчики, которые уже есть в кеше.
+
+    Отсутствующие ключи не создаются: их посчитает первый же запрос.
+    """
+    # До сдвига: подсчёт, начатый после смены версии, уже видит
+    # изменение, о котором сигнализирует сдвиг
+    bump_version()
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def forget_counts(keys):
+    bump_version()
+    cache.delete_many(list(keys))
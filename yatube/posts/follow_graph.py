@@ -0,0 +1,154 @@
+"""Граф подписок в кеше.
+
+Подписки и подписчики пользователя хранятся в кеше отсортированными
+массивами id (array('I'), 4 байта на подписку) и загружаются из Follow
+при первом обращении. Проверка подписки - двоичный поиск, количество -
+длина массива, пересечения - слияние множеств: без запросов к БД, пока
+массивы в кеше.
+
+Сигналы сохранения и удаления Follow забывают массивы обоих участников
+сразу и ещё раз после фиксации транзакции: читатель, загрузивший их
+до фиксации, не оставит в кеше старое состояние. Расхождение с таблицей
+(например, после bulk_create в обход сигналов) находит check(), его
+вызывает команда check_follow_graph. Поэтому граф только для чтения:
+подписка и отписка пишут в таблицу всегда, не сверяясь с массивами.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow, User
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+# Колонка владельца массива и колонка id в массиве
+COLUMNS = {
+    FOLLOWING: ('user_id', 'author_id'),
+    FOLLOWERS: ('author_id', 'user_id'),
+}
+# Сколько подписок читателя просматривать в поисках знакомых
+FRIENDS_LIMIT = 200
+
+
+def graph_key(kind, user_id):
+    return f'posts:follow:{kind}:{user_id}'
+
+
+def load(kind, user_ids):
+    """{id пользователя: массив} из таблицы Follow одним запросом."""
+    owner, other = COLUMNS[kind]
+    sets = {pk: array('I') for pk in user_ids}
+    rows = Follow.objects.filter(**{f'{owner}__in': user_ids}).order_by(
+        owner, other
+    ).values_list(owner, other)
+    for pk, other_pk in rows.iterator():
+        sets[pk].append(other_pk)
+    return sets
+
+
+def id_sets(kind, user_ids):
+    """{id пользователя: отсортированный массив id} из кеша, недостающие
+    - из БД."""
+    keys = {graph_key(kind, pk): pk for pk in user_ids}
+    sets = {}
+    for key, data in cache.get_many(keys).items():
+        ids = sets[keys[key]] = array('I')
+        ids.frombytes(data)
+    missing = [pk for pk in keys.values() if pk not in sets]
+    if missing:
+        loaded = load(kind, missing)
+        cache.set_many(
+            {graph_key(kind, pk): ids.tobytes()
+             for pk, ids in loaded.items()},
+            settings.FOLLOW_GRAPH_TIMEOUT
+        )
+        sets.update(loaded)
+    return sets
+
+
+def following(user_id):
+    """Авторы, на которых подписан пользователь."""
+    return id_sets(FOLLOWING, [user_id])[user_id]
+
+
+def followers(user_id):
+    """Подписчики автора."""
+    return id_sets(FOLLOWERS, [user_id])[user_id]
+
+
+def contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def is_following(user_id, author_id):
+    return contains(following(user_id), author_id)
+
+
+def following_count(user_id):
+    return len(following(user_id))
+
+
+def followers_count(user_id):
+    return len(followers(user_id))
+
+
+def common_following(user_id, other_id):
+    """Авторы, на которых подписаны оба, по возрастанию id."""
+    sets = id_sets(FOLLOWING, [user_id, other_id])
+    return sorted(set(sets[user_id]).intersection(sets[other_id]))
+
+
+def people_you_may_know(user_id, limit=5):
+    """Авторы, на которых подписаны авторы пользователя, а он - нет.
+
+    Чем больше авторов пользователя подписано на кандидата, тем он выше.
+    """
+    followed = following(user_id)
+    friends = id_sets(FOLLOWING, list(followed[:FRIENDS_LIMIT]))
+    candidates = Counter()
+    for ids in friends.values():
+        candidates.update(ids)
+    ranked = sorted(
+        (-count, pk) for pk, count in candidates.items()
+        if pk != user_id and not contains(followed, pk)
+    )
+    return [pk for _, pk in ranked[:limit]]
+
+
+def forget(user_id, author_id):
+    """Забыть массивы участников подписки, сейчас и после фиксации."""
+    keys = [graph_key(FOLLOWING, user_id), graph_key(FOLLOWERS, author_id)]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def check(fix=False, batch_size=500):
+    """Сверить закешированные массивы с таблицей Follow.
+
+    return - [(вид, id пользователя)] разошедшихся массивов; с fix=True
+    они удаляются из кеша и при следующем обращении загрузятся заново.
+    Массивы, которых нет в кеше, не проверяются.
+    """
+    user_ids = User.objects.order_by('pk').values_list(
+        'pk', flat=True
+    )
+    mismatched = []
+    for start in range(0, user_ids.count(), batch_size):
+        batch = list(user_ids[start:start + batch_size])
+        for kind in (FOLLOWING, FOLLOWERS):
+            keys = {graph_key(kind, pk): pk for pk in batch}
+            cached = cache.get_many(keys)
+            if not cached:
+                continue
+            actual = load(kind, [keys[key] for key in cached])
+            for key, data in cached.items():
+                if data != actual[keys[key]].tobytes():
+                    mismatched.append((kind, keys[key]))
+    if fix:
+        cache.delete_many([graph_key(*item) for item in mismatched])
+    return mismatched
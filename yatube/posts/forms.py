@@ -1,6 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
 from .models import Comment, Post
+from .uploads import clean_upload
 
 
 class PostForm(forms.ModelForm):
@@ -21,6 +23,13 @@ class PostForm(forms.ModelForm):
                       ' смысловую связь.'),
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Проверяется только новая загрузка, а не уже сохранённая картинка
+        if isinstance(image, UploadedFile):
+            image = clean_upload(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
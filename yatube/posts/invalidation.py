@@ -0,0 +1,149 @@
+"""Кеш страниц с инвалидацией по поколениям.
+
+Для каждой области (вся лента, подборка по slug, автор по username,
+список подборок, комментарии записи по id, предложения авторов
+для подписки) в кеше хранится номер
+поколения. Ключ закешированной
+страницы включает номера поколений всех областей, от которых она
+зависит, поэтому сигналы из signals.py не ищут и не удаляют старые
+страницы, а только сдвигают поколение: следующий запрос пойдёт мимо
+кеша, а устаревшие записи истекут сами. Благодаря этому страницы можно
+хранить долго (PAGE_CACHE_TIMEOUT) без риска показать старое. Из тех
+же поколений строится ETag, по которому браузер получает 304.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+SCOPE_FEED = 'feed'
+SCOPE_GROUP = 'group'
+SCOPE_AUTHOR = 'author'
+SCOPE_GROUPS = 'groups'
+SCOPE_POST = 'post'
+SCOPE_SUGGESTIONS = 'suggestions'
+
+
+def digest(value):
+    # username и адрес страницы могут содержать пробелы и не-ASCII
+    # символы, недопустимые в ключах memcached.
+    return hashlib.md5(str(value).encode()).hexdigest()
+
+
+def generation_key(scope, ident=None):
+    if ident is None:
+        return f'posts:gen:{scope}'
+    return f'posts:gen:{scope}:{digest(ident)}'
+
+
+def new_generation():
+    # Поколение, начатое заново после вытеснения ключа из кеша, не должно
+    # совпасть с прежним, поэтому отсчёт идёт от текущего времени.
+    return time.time_ns()
+
+
+def get_generations(scopes):
+    """Текущие поколения областей scopes (пар (область, идентификатор))."""
+    keys = [generation_key(*scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, new_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(scopes):
+    """Сдвинуть поколения областей, сделав их страницы в кеше устаревшими."""
+    for scope in set(scopes):
+        key = generation_key(*scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_generation(), None)
+
+
+def page_cache_key(request, scopes):
+    generations = '.'.join(str(gen) for gen in get_generations(scopes))
+    return f'posts:page:{digest(request.get_full_path())}:{generations}'
+
+
+def page_etag(request, scopes, *extra):
+    """ETag ответа: меняется вместе с поколениями его областей.
+
+    extra - то, от чего ответ зависит помимо адреса и областей,
+    например читатель ленты подписок.
+    """
+    parts = [request.get_full_path(), *get_generations(scopes), *extra]
+    return digest(':'.join(str(part) for part in parts))
+
+
+def cached_fragment(name, scopes, render):
+    """Часть страницы, общая для всех читателей, из кеша до смены
+    поколения областей scopes. render() отрисовывает её при промахе."""
+    timeout = settings.PAGE_CACHE_TIMEOUT
+    if not timeout:
+        return render()
+    generations = '.'.join(str(gen) for gen in get_generations(scopes))
+    key = f'posts:fragment:{digest(name)}:{generations}'
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = render()
+        cache.set(key, fragment, timeout)
+    return fragment
+
+
+def cache_page_by_generations(get_scopes):
+    """Декоратор view: кешировать страницу до смены поколения её областей.
+
+    get_scopes(request, *args, **kwargs) возвращает области, от которых
+    зависит страница. Кешируются только GET-запросы гостей: страницы
+    пользователя содержат его меню, кнопки и формы.
+
+    Всем GET/HEAD-запросам страница отдаётся с ETag из поколений и
+    данных читателя (пользователь, CSRF-cookie для форм), и повторный
+    запрос с If-None-Match получает 304 до любых запросов к БД за
+    самой страницей и до отрисовки шаблона.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            scopes = get_scopes(request, *args, **kwargs)
+            csrf_cookie = request.META.get('CSRF_COOKIE')
+            etag = quote_etag(page_etag(
+                request, scopes, request.user.pk, csrf_cookie
+            ))
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                return not_modified
+
+            timeout = settings.PAGE_CACHE_TIMEOUT
+            if (not timeout or request.method != 'GET'
+                    or request.user.is_authenticated):
+                response = view(request, *args, **kwargs)
+            else:
+                key = page_cache_key(request, scopes)
+                response = cache.get(key)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code == 200:
+                        cache.set(key, response, timeout)
+            if response.status_code == 200:
+                if request.META.get('CSRF_COOKIE') != csrf_cookie:
+                    # Форма на странице выдала читателю CSRF-cookie:
+                    # следующий запрос придёт уже с ним
+                    etag = quote_etag(page_etag(
+                        request, scopes, request.user.pk,
+                        request.META['CSRF_COOKIE']
+                    ))
+                response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
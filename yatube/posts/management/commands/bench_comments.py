@@ -0,0 +1,79 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts import comment_buffer, search
+from posts.bench import bulk_posts, throwaway_database
+from posts.models import Comment, Post, bulk_batch_size
+
+
+class Command(BaseCommand):
+    help = ('Замерить устойчивую скорость приёма комментариев, шт./с: '
+            'запись в запросе против отложенной записи из памяти и '
+            'с журналом. Комментарии пишутся через add_comment в записи '
+            'с уже накопленными комментариями, включая запись очереди.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=2000,
+                            help='Комментариев на каждый режим.')
+        parser.add_argument('--posts', type=int, default=20,
+                            help='Записей, которые комментируют.')
+        parser.add_argument('--existing', type=int, default=300,
+                            help='Комментариев у каждой записи до замера.')
+        parser.add_argument('--size', type=int, default=200,
+                            help='COMMENT_BUFFER_SIZE для замера.')
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            authors = bulk_posts(options['posts'], authors=10)
+            posts = list(Post.objects.select_related('author'))
+            self.fill_comments(posts, authors, options['existing'])
+            clients = []
+            for author in authors:
+                client = Client()
+                client.force_login(author)
+                clients.append(client)
+            urls = [reverse('add_comment', args=(post.author.username,
+                                                 post.pk))
+                    for post in posts]
+            self.stdout.write(f'{"режим":<10}{"комментариев":>14}'
+                              f'{"время, с":>10}{"в с":>10}')
+            with tempfile.TemporaryDirectory() as journal_dir:
+                for mode in (comment_buffer.SYNC, comment_buffer.MEMORY,
+                             comment_buffer.JOURNAL):
+                    with override_settings(
+                        COMMENT_BUFFER_DURABILITY=mode,
+                        COMMENT_BUFFER_INTERVAL=0,
+                        COMMENT_BUFFER_SIZE=options['size'],
+                        COMMENT_BUFFER_JOURNAL_DIR=journal_dir,
+                    ):
+                        self.report(mode, clients, urls,
+                                    options['comments'])
+
+    def fill_comments(self, posts, authors, count):
+        Comment.objects.bulk_create(
+            (Comment(post=post, author=authors[i % len(authors)],
+                     text=f'bench comment {i}')
+             for post in posts for i in range(count)),
+            batch_size=bulk_batch_size(Comment, 5000)
+        )
+        if search.is_available():
+            with transaction.atomic():
+                search.rebuild()
+
+    def report(self, mode, clients, urls, count):
+        before = Comment.objects.count()
+        started = time.perf_counter()
+        for i in range(count):
+            clients[i % len(clients)].post(
+                urls[i % len(urls)], {'text': f'Замер {mode} {i}'}
+            )
+        comment_buffer.buffer.flush()
+        elapsed = time.perf_counter() - started
+        saved = Comment.objects.count() - before
+        self.stdout.write(f'{mode:<10}{saved:>14}{elapsed:>10.2f}'
+                          f'{saved / elapsed:>10.0f}')
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from posts.bench import bulk_posts, measure, summary, throwaway_database
+from posts.models import Post
+from posts.paginators import CURSOR_NEXT, encode_cursor
+from posts.views import pagination
+
+
+class Command(BaseCommand):
+    help = ('Сравнить время выборки первой и глубокой страницы ленты '
+            'для пагинации по номерам (OFFSET) и по курсору.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=10000,
+                            help='Номер глубокой страницы для замера.')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Количество повторов каждого замера.')
+
+    def handle(self, *args, **options):
+        deep_page = options['page']
+        per_page = settings.PAGINATOR_DEFAULT_SIZE
+        with throwaway_database():
+            self.stdout.write(
+                f'Наполнение {deep_page * per_page} записями...'
+            )
+            bulk_posts(deep_page * per_page)
+            self.report(deep_page, per_page, options['repeat'])
+
+    def report(self, deep_page, per_page, repeat):
+        factory = RequestFactory()
+        anchor = Post.objects.order_by('-pub_date', '-pk')[
+            (deep_page - 1) * per_page - 1
+        ]
+        cases = (
+            ('offset', 1, factory.get('/'), False),
+            ('offset', deep_page,
+             factory.get('/', {'page': deep_page}), False),
+            ('cursor', 1, factory.get('/'), True),
+            ('cursor', deep_page,
+             factory.get('/', {'cursor': encode_cursor(CURSOR_NEXT, anchor)}),
+             True),
+        )
+        self.stdout.write(
+            f'{"режим":<8}{"страница":>10}{"p50, мс":>10}{"p95, мс":>10}'
+        )
+        for mode, number, request, cursor in cases:
+            def fetch_page():
+                page = pagination(request, Post.objects.feed(), cursor)
+                return list(page)
+
+            stats = summary(measure(fetch_page, repeat))
+            self.stdout.write(
+                f'{mode:<8}{number:>10}{stats["p50"]:>10.2f}'
+                f'{stats["p95"]:>10.2f}'
+            )
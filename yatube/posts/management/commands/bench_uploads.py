@@ -0,0 +1,67 @@
+import io
+import multiprocessing
+import resource
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from posts.management.commands.bench_variants import sample_image
+from posts.uploads import clean_upload
+
+
+def full_decode(content):
+    """Декодировать картинку целиком и уменьшить, как без нормализации."""
+    image = Image.open(io.BytesIO(content))
+    image.load()
+    image.thumbnail((settings.UPLOAD_IMAGE_MAX_SIDE,) * 2, Image.LANCZOS)
+    return image
+
+
+def ingest(content):
+    return clean_upload(SimpleUploadedFile('upload.jpg', content))
+
+
+def peak_memory(func, content):
+    """Время и прирост пикового RSS процесса при вызове func, КБ."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    func(content)
+    elapsed = (time.perf_counter() - start) * 1000
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, after - before
+
+
+class Command(BaseCommand):
+    help = ('Замерить время и пиковую память при приёме картинки: полное '
+            'декодирование против проверки заголовка и декодирования '
+            'в уменьшенном масштабе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image',
+                            help='Путь к картинке (по умолчанию '
+                                 'синтетический JPEG 6000x4000).')
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('Замер памяти требует fork (Linux, macOS).')
+        if options['image']:
+            with open(options['image'], 'rb') as file_:
+                content = file_.read()
+        else:
+            content = sample_image(6000, 4000)
+        self.stdout.write(f'Исходник {len(content) // 1024} КБ, '
+                          f'предел стороны {settings.UPLOAD_IMAGE_MAX_SIDE}')
+
+        # Каждый замер - в отдельном процессе: пиковый RSS не сбрасывается
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(f'{"способ":<24}{"время, мс":>12}{"пик, МБ":>10}')
+        for name, func in (('полное декодирование', full_decode),
+                           ('нормализация', ingest)):
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                elapsed, peak = pool.apply(peak_memory, (func, content))
+            self.stdout.write(
+                f'{name:<24}{elapsed:>12.1f}{peak / 1024:>10.1f}'
+            )
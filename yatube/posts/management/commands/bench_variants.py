@@ -0,0 +1,83 @@
+import io
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from posts.bench import measure, summary
+from posts.variants import ENCODERS, VARIANT_WIDTHS, render
+
+
+def sample_image(width, height):
+    """JPEG с плавными переходами цвета, похожий на фотографию."""
+    image = Image.radial_gradient('L').resize((width, height))
+    image = Image.merge('RGB', (
+        image, image.rotate(90, expand=False), image.transpose(
+            Image.FLIP_LEFT_RIGHT
+        )
+    ))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def render_separately(content):
+    """Каждая копия из своего декодирования, как при вызовах get_thumbnail."""
+    sizes = 0
+    for format_, (pil_format, params) in ENCODERS.items():
+        for width in VARIANT_WIDTHS:
+            image = Image.open(io.BytesIO(content)).convert('RGB')
+            image.thumbnail((width, width))
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **params)
+            sizes += buffer.tell()
+    return sizes
+
+
+class Command(BaseCommand):
+    help = ('Замерить скорость подготовки копий картинки для srcset: '
+            'одно декодирование на все копии против декодирования '
+            'на каждую копию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image',
+                            help='Путь к картинке (по умолчанию '
+                                 'синтетический JPEG 4000x3000).')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Количество повторов каждого замера.')
+
+    def handle(self, *args, **options):
+        if options['image']:
+            with open(options['image'], 'rb') as file_:
+                content = file_.read()
+        else:
+            content = sample_image(4000, 3000)
+        with Image.open(io.BytesIO(content)) as image:
+            width, height = image.size
+        megapixels = width * height / 1_000_000
+        self.stdout.write(
+            f'Исходник {width}x{height}, {len(content) // 1024} КБ'
+        )
+
+        variants = list(render(io.BytesIO(content)))
+        for format_ in ENCODERS:
+            total = sum(len(data) for name, _, _, data in variants
+                        if name == format_)
+            self.stdout.write(f'{format_}: {total // 1024} КБ на все копии')
+
+        cases = (
+            ('одно декодирование',
+             lambda: list(render(io.BytesIO(content)))),
+            ('декодирование на копию',
+             lambda: render_separately(content)),
+        )
+        self.stdout.write(
+            f'{"способ":<26}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"картинок/с":>12}{"Мп/с":>8}'
+        )
+        for name, func in cases:
+            stats = summary(measure(func, options['repeat']))
+            per_second = 1000 / stats['p50']
+            self.stdout.write(
+                f'{name:<26}{stats["p50"]:>10.1f}{stats["p95"]:>10.1f}'
+                f'{per_second:>12.2f}{per_second * megapixels:>8.1f}'
+            )
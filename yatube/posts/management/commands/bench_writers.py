@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.urls import reverse
+
+from posts.bench import summary
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = ('Замерить запросы в секунду при одновременной записи: потоки '
+            'пишут записи (new_post) и комментарии (add_comment) в '
+            'настроенную БД. Сравнивать настройки YATUBE_DB_* нужно '
+            'отдельными запусками; пользователи замера удаляются после '
+            'него.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8,
+                            help='Одновременных пишущих потоков.')
+        parser.add_argument('--seconds', type=float, default=10,
+                            help='Длительность замера, с.')
+        parser.add_argument('--comments', type=float, default=0.7,
+                            help='Доля комментариев среди запросов.')
+        parser.add_argument('--prefix', default='benchw',
+                            help='Префикс имён пользователей замера.')
+
+    def handle(self, *args, **options):
+        db = settings.DATABASES['default']
+        self.stdout.write(
+            f'{db["ENGINE"]} {db["NAME"]}, CONN_MAX_AGE='
+            f'{db["CONN_MAX_AGE"]}, PRAGMA {db.get("PRAGMAS") or "-"}'
+        )
+        prefix = f'{options["prefix"]}_writer_'
+        users = [User.objects.get_or_create(username=f'{prefix}{i}')[0]
+                 for i in range(options['writers'])]
+        targets = [
+            reverse('add_comment', args=(user.username, Post.objects.create(
+                author=user, text='Запись для комментариев'
+            ).pk))
+            for user in users
+        ]
+        timings = defaultdict(list)
+        errors = Counter()
+        deadline = time.monotonic() + options['seconds']
+        threads = [
+            threading.Thread(target=self.write, args=(
+                user, number, deadline, targets, options['comments'],
+                timings, errors
+            ))
+            for number, user in enumerate(users)
+        ]
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.report(timings, errors, time.perf_counter() - started)
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+
+    def write(self, user, seed, deadline, targets, share, timings, errors):
+        """Поток замера: свой клиент, своё соединение с БД."""
+        rng = random.Random(seed)
+        client = Client()
+        client.force_login(user)
+        new_post = reverse('new_post')
+        try:
+            while time.monotonic() < deadline:
+                if rng.random() < share:
+                    kind, url = 'add_comment', rng.choice(targets)
+                else:
+                    kind, url = 'new_post', new_post
+                start = time.perf_counter()
+                try:
+                    response = client.post(url, {'text': f'Замер {kind}'})
+                except DatabaseError as error:
+                    errors[f'{kind}: {error}'] += 1
+                    continue
+                elapsed = (time.perf_counter() - start) * 1000
+                if response.status_code == 302:
+                    timings[kind].append(elapsed)
+                else:
+                    errors[f'{kind}: HTTP {response.status_code}'] += 1
+        finally:
+            connection.close()
+
+    def report(self, timings, errors, elapsed):
+        self.stdout.write(f'{"view":<14}{"запросов":>10}{"в с":>8}'
+                          f'{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}')
+        total = 0
+        for kind, values in sorted(timings.items()):
+            total += len(values)
+            stats = summary(values)
+            self.stdout.write(
+                f'{kind:<14}{len(values):>10}{len(values) / elapsed:>8.0f}'
+                f'{stats["p50"]:>10.1f}{stats["p95"]:>10.1f}'
+                f'{stats["p99"]:>10.1f}'
+            )
+        self.stdout.write(f'{"всего":<14}{total:>10}{total / elapsed:>8.0f}')
+        for error, count in errors.most_common():
+            self.stdout.write(self.style.ERROR(f'{count} x {error}'))
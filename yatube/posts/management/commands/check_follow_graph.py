@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts import follow_graph
+
+
+class Command(BaseCommand):
+    help = ('Сверить подписки и подписчиков пользователей в кеше '
+            '(posts/follow_graph.py) с таблицей Follow.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Удалить разошедшиеся массивы из кеша.')
+
+    def handle(self, *args, **options):
+        mismatched = follow_graph.check(fix=options['fix'])
+        for kind, user_id in mismatched:
+            self.stdout.write(f'{kind}: пользователь {user_id}')
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Удалено из кеша: {len(mismatched)}'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Расхождений: {len(mismatched)}, исправить: --fix'
+            ))
@@ -0,0 +1,128 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import ImageVariant, Post, StoredFile, bulk_batch_size
+from posts.storage import INCOMING_DIR, content_storage
+
+BATCH_SIZE = 1000
+MEDIA_DIRS = ('posts', 'variants', INCOMING_DIR)
+
+
+def references():
+    """Число ссылок на каждый файл по таблицам записей и копий."""
+    counter = Counter()
+    for model in (Post, ImageVariant):
+        names = model.objects.exclude(image='').exclude(image=None)
+        counter.update(names.values_list('image', flat=True).iterator())
+    return counter
+
+
+def walk(storage, directory):
+    """Имена всех файлов каталога хранилища, рекурсивно."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from walk(storage, f'{directory}/{name}')
+
+
+def is_referenced(name):
+    return (Post.objects.filter(image=name).exists()
+            or ImageVariant.objects.filter(image=name).exists())
+
+
+class Command(BaseCommand):
+    help = ('Удалить файлы картинок, на которые не ссылается ни одна '
+            'запись. С --scan сначала сверить счётчики ссылок с таблицами '
+            'и обойти каталоги, чтобы найти и файлы без счётчика.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scan', action='store_true',
+                            help='Пересчитать ссылки и обойти каталоги.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+        parser.add_argument('--grace', type=int, default=3600,
+                            help='Не трогать файлы моложе стольких секунд: '
+                                 'их запись может быть ещё не сохранена.')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.deadline = time.time() - options['grace']
+        self.removed = self.size = 0
+        if options['scan']:
+            self.collect_scanned()
+        else:
+            self.collect_released()
+        action = 'К удалению' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {self.removed}, '
+            f'{self.size / 1024 / 1024:.1f} МБ'
+        ))
+
+    def collect_released(self):
+        """Файлы, счётчик ссылок которых дошёл до нуля."""
+        released = StoredFile.objects.filter(refcount=0).values_list(
+            'name', flat=True
+        )
+        for name in list(released):
+            # Счётчик мог разойтись с таблицами: удаляем только то,
+            # на что действительно нет ссылок
+            if not is_referenced(name) and self.remove(name):
+                if not self.dry_run:
+                    StoredFile.objects.filter(name=name, refcount=0).delete()
+
+    def collect_scanned(self):
+        counter = references()
+        drift = self.sync_refcounts(counter)
+        self.stdout.write(f'Исправлено счётчиков ссылок: {drift}')
+        for directory in MEDIA_DIRS:
+            for name in walk(content_storage, directory):
+                if not counter[name]:
+                    self.remove(name)
+        if not self.dry_run:
+            StoredFile.objects.filter(refcount=0).exclude(
+                name__in=counter.keys()
+            ).delete()
+
+    def remove(self, name):
+        """Удалить файл, если он старше --grace. return - удалён ли."""
+        if not content_storage.exists(name):
+            return True
+        path = content_storage.path(name)
+        if os.path.getmtime(path) > self.deadline:
+            return False
+        self.size += os.path.getsize(path)
+        self.removed += 1
+        if self.dry_run:
+            self.stdout.write(f'  {name}')
+        else:
+            content_storage.delete(name)
+        return True
+
+    def sync_refcounts(self, counter):
+        stored = dict(StoredFile.objects.values_list('name', 'refcount'))
+        wrong = [
+            StoredFile(name=name, refcount=counter[name])
+            for name, refcount in stored.items() if refcount != counter[name]
+        ]
+        missing = [
+            StoredFile(name=name, refcount=count)
+            for name, count in counter.items() if name not in stored
+        ]
+        if not self.dry_run:
+            with transaction.atomic():
+                StoredFile.objects.bulk_update(
+                    wrong, ['refcount'], batch_size=BATCH_SIZE
+                )
+                StoredFile.objects.bulk_create(
+                    missing,
+                    batch_size=bulk_batch_size(StoredFile, BATCH_SIZE),
+                    ignore_conflicts=True
+                )
+        return len(wrong) + len(missing)
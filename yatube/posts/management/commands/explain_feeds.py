@@ -0,0 +1,161 @@
+import re
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.bench import bulk_posts, measure, summary, throwaway_database
+from posts.models import Comment, Follow, Group, Post, User
+
+# Составные индексы миграции 0020 и одиночные индексы внешних ключей,
+# которые она заменила
+FEED_INDEXES = (
+    (Post, 'post_pub_date_idx'),
+    (Post, 'post_author_pub_date_idx'),
+    (Post, 'post_group_pub_date_idx'),
+    (Comment, 'comment_post_created_idx'),
+    (Follow, 'follow_author_user_idx'),
+)
+FOREIGN_KEY_INDEXES = (
+    (Post, 'author'),
+    (Post, 'group'),
+    (Comment, 'post'),
+    (Follow, 'user'),
+    (Follow, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Вывести планы запросов всех лент (EXPLAIN QUERY PLAN) и время '
+            'ответа до и после составных индексов миграции 0020 '
+            'на временной БД с заданным числом записей. Схема остаётся '
+            'последней, "до" - это она без индексов 0020 и с одиночными '
+            'индексами внешних ключей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        with throwaway_database():
+            self.use_indexes(feed=False)
+            self.stdout.write(f'Наполнение {options["posts"]} записями...')
+            self.seed(options['posts'], options['authors'], options['groups'])
+            # Статистика планировщика собирается перед каждым проходом:
+            # иначе планы и время различались бы не только индексами
+            self.analyze()
+            self.report('До индексов')
+            self.use_indexes(feed=True)
+            self.analyze()
+            self.report('После индексов')
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def use_indexes(self, feed):
+        """Оставить составные индексы 0020 или одиночные индексы ключей.
+
+        SQL индексов берётся у schema_editor, но выполняется напрямую:
+        в блоке with schema_editor SQLite не работает внутри транзакции.
+        """
+        editor = connection.schema_editor()
+        quote = editor.quote_name
+        statements = []
+        for model, name in FEED_INDEXES:
+            index = next(index for index in model._meta.indexes
+                         if index.name == name)
+            sql = (index.create_sql if feed else index.remove_sql)(
+                model, editor
+            )
+            statements.append(str(sql))
+        for model, field_name in FOREIGN_KEY_INDEXES:
+            table = model._meta.db_table
+            column = model._meta.get_field(field_name).column
+            name = quote(f'explain_{table}_{column}')
+            statements.append(
+                f'DROP INDEX {name}' if feed
+                else f'CREATE INDEX {name} ON {quote(table)} '
+                     f'({quote(column)})'
+            )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def seed(self, posts, authors, groups):
+        users = bulk_posts(posts, authors=authors, groups=groups)
+        self.reader = User.objects.create(username='explain_reader')
+        for author in users[:20]:
+            Follow.objects.create(user=self.reader, author=author)
+        self.post = Post.objects.filter(author=users[0]).first()
+        self.group = Group.objects.first()
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.reader, text=f'comment {i}')
+            for i in range(100)
+        )
+
+    def views(self):
+        post = self.post
+        return (
+            ('index', reverse('index')),
+            ('index, глубокая страница', reverse('index') + '?page=5000'),
+            ('group', reverse('group', args=(self.group.slug,))),
+            ('profile', reverse('profile', args=(post.author.username,))),
+            ('post', reverse('post', args=(post.author.username, post.pk))),
+            ('follow_index', reverse('follow_index')),
+            ('group_index', reverse('group_index')),
+        )
+
+    def report(self, title):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {title}'))
+        client = Client()
+        client.force_login(self.reader)
+        for name, url in self.views():
+            cache.clear()
+            # При DEBUG журнал запросов ограничен, после наполнения БД
+            # он переполнен и CaptureQueriesContext ничего не увидит.
+            reset_queries()
+            with CaptureQueriesContext(connection) as context:
+                client.get(url)
+            # Срез журнала, который следующий запрос клиента очистит
+            queries = context.captured_queries
+
+            def fetch():
+                cache.clear()
+                client.get(url)
+
+            stats = summary(measure(fetch, self.repeat))
+            self.stdout.write(self.style.MIGRATE_LABEL(
+                f'\n{name} {url}: {len(queries)} запросов, '
+                f'p50 {stats["p50"]:.1f} мс'
+            ))
+            # Одинаковые запросы с разными параметрами (N+1) выводятся
+            # один раз с числом повторов.
+            shapes = Counter()
+            first_sql = {}
+            for query in queries:
+                shape = re.sub(r'\b\d+\b', '?', query['sql'])
+                shapes[shape] += 1
+                first_sql.setdefault(shape, query['sql'])
+            for shape, times in shapes.items():
+                self.explain(first_sql[shape], times)
+
+    def explain(self, sql, times):
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' \
+            else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            plan = [str(row[-1]) for row in cursor.fetchall()]
+        repeated = f' (x{times})' if times > 1 else ''
+        self.stdout.write(f'  {sql[:150]}{repeated}')
+        for line in plan:
+            self.stdout.write(f'    {line}')
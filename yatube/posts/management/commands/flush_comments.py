@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import comment_buffer
+
+
+class Command(BaseCommand):
+    help = ('Записать в БД комментарии из журналов отложенной записи '
+            '(COMMENT_BUFFER_DURABILITY = "journal") процессов, которые '
+            'завершились, не успев их записать.')
+
+    def handle(self, *args, **options):
+        saved = comment_buffer.replay_journals()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано комментариев: {saved}'
+        ))
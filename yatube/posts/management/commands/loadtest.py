@@ -0,0 +1,179 @@
+import random
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.bench import summary
+from posts.models import Group, Post, User
+from posts.seeding import WORDS, zipf_choice, zipf_weights
+
+MIX = 'index=30,group=15,profile=15,post=20,follow=5,search=5,api=10'
+RECENT_POSTS = 10000
+READERS = 20
+
+
+def parse_mix(value):
+    """'index=30,post=20' -> {'index': 30, 'post': 20}."""
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in Workload.kinds:
+            raise CommandError(
+                f'Неизвестный вид запроса "{kind}", допустимы: '
+                f'{", ".join(Workload.kinds)}.'
+            )
+        try:
+            mix[kind] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f'Вес "{weight}" вида "{kind}" не число.')
+    return mix
+
+
+class Workload:
+    """Адреса запросов по данным seed_yatube.
+
+    Популярность авторов, подборок и записей та же, что при наполнении:
+    чаще запрашиваются первые по id пользователи и свежие записи.
+    """
+    kinds = ('index', 'group', 'profile', 'post', 'follow', 'search', 'api')
+
+    def __init__(self, prefix, skew, rng):
+        self.rng = rng
+        self.usernames = list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).order_by('pk').values_list('username', flat=True))
+        self.slugs = list(Group.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).order_by('pk').values_list('slug', flat=True))
+        self.posts = list(Post.objects.filter(
+            author__username__startswith=f'{prefix}_'
+        ).order_by('-pub_date', '-pk').values_list(
+            'author__username', 'pk'
+        )[:RECENT_POSTS])
+        self.user_weights = zipf_weights(len(self.usernames), skew)
+        self.group_weights = zipf_weights(len(self.slugs), skew)
+        self.post_weights = zipf_weights(len(self.posts), skew)
+
+    def page(self):
+        """Номер страницы: чаще первая, изредка дальние."""
+        number = 1 + int(self.rng.expovariate(1.5))
+        return f'?page={number}' if number > 1 else ''
+
+    def url(self, kind):
+        rng = self.rng
+        if kind == 'index':
+            return reverse('index') + self.page()
+        if kind == 'group':
+            slug = self.slugs[zipf_choice(rng, self.group_weights)]
+            return reverse('group', args=(slug,)) + self.page()
+        if kind == 'profile':
+            username = self.usernames[zipf_choice(rng, self.user_weights)]
+            return reverse('profile', args=(username,)) + self.page()
+        if kind == 'post':
+            username, pk = self.posts[zipf_choice(rng, self.post_weights)]
+            return reverse('post', args=(username, pk))
+        if kind == 'follow':
+            return reverse('follow_index')
+        if kind == 'search':
+            words = ' '.join(rng.choices(WORDS, k=rng.randint(1, 2)))
+            return f'{reverse("search")}?{urlencode({"q": words})}'
+        if rng.random() < 0.5:
+            return reverse('api:index')
+        _, pk = self.posts[zipf_choice(rng, self.post_weights)]
+        return reverse('api:post', args=(pk,))
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон по данным seed_yatube: смесь запросов к '
+            'лентам, записям, поиску и API через тестовый клиент от имени '
+            'гостей и вошедших пользователей. Выводит перцентили времени '
+            'ответа и число SQL-запросов по видам страниц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--mix', default=MIX,
+                            help=f'Веса видов запросов, по умолчанию '
+                                 f'{MIX}.')
+        parser.add_argument('--logged-in', type=float, default=0.3,
+                            help='Доля запросов от вошедших пользователей; '
+                                 'лента подписок - всегда от вошедших.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель закона Ципфа для выбора '
+                                 'авторов, подборок и записей.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс данных seed_yatube.')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Очищать кеш перед каждым запросом.')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        rng = random.Random(options['seed'])
+        workload = Workload(options['prefix'], options['skew'], rng)
+        if not workload.posts or not workload.slugs:
+            raise CommandError(
+                f'Нет данных с префиксом "{options["prefix"]}", сначала '
+                f'выполните seed_yatube.'
+            )
+        guest = Client()
+        readers = []
+        for username in rng.sample(workload.usernames,
+                                   min(READERS, len(workload.usernames))):
+            client = Client()
+            client.force_login(User.objects.get(username=username))
+            readers.append(client)
+
+        kinds, weights = zip(*mix.items())
+        timings = defaultdict(list)
+        queries = defaultdict(list)
+        errors = defaultdict(int)
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            kind = rng.choices(kinds, weights)[0]
+            logged_in = (kind == 'follow'
+                         or rng.random() < options['logged_in'])
+            client = rng.choice(readers) if logged_in else guest
+            url = workload.url(kind)
+            if options['no_cache']:
+                cache.clear()
+            # Журнал запросов при DEBUG ограничен: без сброса после
+            # нескольких тысяч запросов CaptureQueriesContext пуст
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings[kind].append((time.perf_counter() - start) * 1000)
+            queries[kind].append(len(captured))
+            if response.status_code >= 400:
+                errors[kind] += 1
+        elapsed = time.perf_counter() - started
+        self.report(timings, queries, errors)
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["requests"]} запросов за {elapsed:.1f} с, '
+            f'{options["requests"] / elapsed:.1f} в секунду'
+        ))
+
+    def report(self, timings, queries, errors):
+        self.stdout.write(
+            f'{"вид":<10}{"запросов":>10}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"p99, мс":>10}{"SQL ср.":>10}{"SQL макс.":>10}{"ошибок":>8}'
+        )
+        for kind in Workload.kinds:
+            if kind not in timings:
+                continue
+            stats = summary(timings[kind])
+            counts = queries[kind]
+            self.stdout.write(
+                f'{kind:<10}{len(counts):>10}{stats["p50"]:>10.1f}'
+                f'{stats["p95"]:>10.1f}{stats["p99"]:>10.1f}'
+                f'{sum(counts) / len(counts):>10.1f}{max(counts):>10}'
+                f'{errors[kind]:>8}'
+            )
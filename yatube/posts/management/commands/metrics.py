@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts import metrics
+
+
+def milliseconds(value):
+    return '-' if value is None else f'{value:.1f}'
+
+
+class Command(BaseCommand):
+    help = ('Вывести сводку замеров запросов по view, собранную '
+            'RequestMetricsMiddleware всех процессов, и самые медленные '
+            'SQL-запросы. Процессы видны, если у них общий кеш.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true',
+                            help='Вывести сводку в JSON.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Сбросить сводку во всех процессах.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            metrics.reset()
+            self.stdout.write(self.style.SUCCESS('Сводка сброшена.'))
+            return
+        summary = metrics.collect()
+        rows = metrics.report(summary)
+        if options['json']:
+            self.stdout.write(json.dumps(
+                {'views': rows, 'slowest': summary['slowest']},
+                ensure_ascii=False, indent=2
+            ))
+            return
+        if not rows:
+            self.stdout.write('Замеров нет.')
+            return
+        self.stdout.write(
+            f'{"view":<24}{"запросов":>9}{"SQL":>7}{"SQL макс.":>10}'
+            f'{"SQL, мс":>9}{"шаблоны":>9}{"ср., мс":>9}{"p50 <":>8}'
+            f'{"p95 <":>8}{"кеш":>6}'
+        )
+        for row in rows:
+            ratio = row['cache_hit_ratio']
+            self.stdout.write(
+                f'{row["view"]:<24}{row["requests"]:>9}'
+                f'{row["queries"]:>7.1f}{row["max_queries"]:>10}'
+                f'{row["sql_ms"]:>9.1f}{row["template_ms"]:>9.1f}'
+                f'{row["total_ms"]:>9.1f}{milliseconds(row["p50_ms"]):>8}'
+                f'{milliseconds(row["p95_ms"]):>8}'
+                f'{"-" if ratio is None else f"{ratio:.0%}":>6}'
+            )
+        if summary['slowest']:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '\nСамые медленные SQL-запросы:'
+            ))
+            for duration, sql, view in summary['slowest']:
+                self.stdout.write(f'{duration:>9.1f} мс  {view}  {sql}')
@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts.models import Post
+from posts.thumbnails import run
+
+
+class Command(BaseCommand):
+    help = ('Заранее создать копии картинок для карточек записей, '
+            'у которых их ещё нет или они устарели.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=settings.THUMBNAIL_WORKERS,
+                            help='Сколько картинок обрабатывать параллельно.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        ids = posts.order_by('-pub_date').values_list('pk', flat=True)
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            created = sum(pool.map(run, ids.iterator()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {created} из {posts.count()}'
+        ))
+        stats = getattr(default.kvstore, 'stats', None)
+        if stats is not None:
+            self.stdout.write(
+                'Хранилище метаданных: {keys} ключей, попаданий в память '
+                '{hits}, из файла {misses}, не найдено {absent}, '
+                'доля попаданий {hit_rate:.1%}'.format(**stats())
+            )
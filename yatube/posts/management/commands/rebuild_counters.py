@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import (Comment, Follow, Post, User, UserCounters,
+                          bulk_batch_size)
+
+BATCH_SIZE = 1000
+USER_COUNTERS = (
+    ('posts_count', Post, 'author'),
+    ('followers_count', Follow, 'author'),
+    ('following_count', Follow, 'user'),
+)
+
+
+def count_of(model, field):
+    """Подзапрос: количество строк model, ссылающихся полем field на pk."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать по таблицам счётчики записей, подписчиков, '
+            'подписок и комментариев. С --check только проверить их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Не исправлять, а завершиться ошибкой при расхождении.'
+        )
+
+    def handle(self, *args, **options):
+        posts = self.wrong_posts()
+        users = self.wrong_users()
+        self.stdout.write(
+            f'Записей с неверным числом комментариев: {len(posts)}\n'
+            f'Пользователей с неверными счётчиками: {len(users)}'
+        )
+        if options['check']:
+            if posts or users:
+                raise CommandError('Счётчики расходятся с таблицами.')
+            return
+        with transaction.atomic():
+            self.fix_posts(posts)
+            self.fix_users(users)
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
+
+    def wrong_posts(self):
+        return list(
+            Post.objects.annotate(
+                actual=count_of(Comment, 'post')
+            ).exclude(comments_count=F('actual')).only('pk')
+        )
+
+    def wrong_users(self):
+        users = User.objects.annotate(**{
+            f'actual_{field}': count_of(model, related)
+            for field, model, related in USER_COUNTERS
+        })
+        differs = Q(counters__isnull=True)
+        for field, _, _ in USER_COUNTERS:
+            differs |= ~Q(**{f'counters__{field}': F(f'actual_{field}')})
+        return list(users.filter(differs).select_related('counters'))
+
+    def fix_posts(self, posts):
+        for post in posts:
+            post.comments_count = post.actual
+        Post.objects.bulk_update(
+            posts, ['comments_count'], batch_size=BATCH_SIZE
+        )
+
+    def fix_users(self, users):
+        missing, wrong = [], []
+        for user in users:
+            values = {
+                field: getattr(user, f'actual_{field}')
+                for field, _, _ in USER_COUNTERS
+            }
+            try:
+                counters = user.counters
+            except UserCounters.DoesNotExist:
+                missing.append(UserCounters(user=user, **values))
+                continue
+            for field, value in values.items():
+                setattr(counters, field, value)
+            wrong.append(counters)
+        UserCounters.objects.bulk_create(
+            missing, batch_size=bulk_batch_size(UserCounters, BATCH_SIZE)
+        )
+        UserCounters.objects.bulk_update(
+            wrong, [field for field, _, _ in USER_COUNTERS],
+            batch_size=BATCH_SIZE
+        )
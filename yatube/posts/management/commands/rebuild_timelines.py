@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import TimelineEntry
+from posts.timeline import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Заново собрать материализованные ленты подписок по таблице '
+            'Follow, например после смены TIMELINE_FANOUT_LIMIT. Число '
+            'подписчиков авторов берётся из счётчиков (rebuild_counters).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='id читателя, можно указать несколько раз.')
+
+    def handle(self, *args, **options):
+        entries = TimelineEntry.objects.all()
+        if options['user']:
+            entries = entries.filter(user_id__in=options['user'])
+        with transaction.atomic():
+            rebuild(options['user'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах подписок: {entries.count()}'
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = ('Пересобрать поисковый индекс записей и комментариев, '
+            'например после загрузки данных через bulk_create.')
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Поисковый индекс ведётся только на SQLite.')
+        started = time.perf_counter()
+        with transaction.atomic():
+            count = search.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано записей: {count} за {elapsed:.1f} с'
+        ))
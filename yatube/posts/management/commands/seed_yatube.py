@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import Group, User
+from posts.seeding import SEED_PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = ('Наполнить БД правдоподобным набором данных: пользователи, '
+            'подборки, записи с неравномерным распределением по авторам, '
+            'комментарии и граф подписок. Строки вставляются bulk_create, '
+            'после чего пересобираются счётчики, ленты и поисковый индекс.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--comments', type=int, default=200_000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель закона Ципфа для популярности '
+                                 'авторов и записей (0 - равномерно).')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько последних дней датировать '
+                                 'записи.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Строк в одном INSERT, не больше лимита '
+                                 'параметров СУБД.')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Процессов для генерации строк '
+                                 '(0 - без пула).')
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс имён пользователей и slug '
+                                 'подборок.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if (User.objects.filter(username__startswith=f'{prefix}_').exists()
+                or Group.objects.filter(slug__startswith=f'{prefix}-')
+                .exists()):
+            raise CommandError(
+                f'Данные с префиксом "{prefix}" уже есть, укажите другой '
+                f'--prefix.'
+            )
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя.')
+        seeder = Seeder(
+            users=options['users'], groups=options['groups'],
+            posts=options['posts'], comments=options['comments'],
+            follows=options['follows'], skew=options['skew'],
+            days=options['days'], seed=options['seed'],
+            batch_size=options['batch_size'], workers=options['workers'],
+            prefix=prefix, log=self.stdout.write
+        )
+        timings = seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {sum(timings.values()):.1f} с. Пароль '
+            f'пользователей {prefix}_N: {SEED_PASSWORD}'
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать блок "Кого читать": лучших авторов для подписки '
+            'каждому читателю по друзьям друзей, общим подборкам и '
+            'популярности (posts/suggestions.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None,
+                            help='Предложений на читателя (по умолчанию '
+                                 'SUGGESTIONS_TOP).')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Процессов расчёта (по умолчанию по '
+                                 'числу ядер).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = suggestions.rebuild(options['top'], options['workers'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Предложений сохранено: {count} за {elapsed:.1f} с'
+        ))
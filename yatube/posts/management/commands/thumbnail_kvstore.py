@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail import default
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class Command(BaseCommand):
+    help = ('Показать состояние файлового хранилища метаданных миниатюр '
+            'или перенести в него метаданные из таблицы sorl-thumbnail.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--import-db', action='store_true',
+                            help='Скопировать записи из таблицы '
+                                 'thumbnail_kvstore базы сайта.')
+
+    def handle(self, *args, **options):
+        kvstore = default.kvstore
+        if not hasattr(kvstore, 'load'):
+            raise CommandError(
+                'THUMBNAIL_KVSTORE не указывает на '
+                'posts.thumbnail_store.SQLiteKVStore'
+            )
+        if options['import_db']:
+            rows = KVStoreModel.objects.values_list('key', 'value')
+            imported = 0
+            for key, value in rows.iterator():
+                kvstore._set_raw(key, value)
+                imported += 1
+            self.stdout.write(f'Перенесено записей: {imported}')
+
+        started = time.perf_counter()
+        keys = kvstore.load()
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f'{kvstore.path}: {keys} ключей, загрузка {elapsed:.1f} мс'
+        ))
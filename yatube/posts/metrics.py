@@ -0,0 +1,340 @@
+"""Замеры стоимости запросов по именам URL.
+
+RequestMetricsMiddleware замеряет долю METRICS_SAMPLE_RATE запросов:
+число и время SQL-запросов (execute_wrapper всех соединений), время
+отрисовки шаблонов, попадания и промахи кеша и полное время ответа.
+Незамеряемый запрос обходится одной проверкой случайного числа, поэтому
+при малой доле замеры можно держать включёнными в бою.
+
+Замеры складываются в памяти процесса по имени URL (view_name) и раз в
+METRICS_FLUSH_INTERVAL секунд копируются в кеш под ключом процесса.
+Оттуда их собирает страница для персонала (api:metrics) и команда
+metrics. Сводка всех процессов собирается только при общем кеше (см.
+CACHES в settings.py), с LocMemCache виден лишь процесс, который
+отвечает. Время ответа хранится гистограммой, поэтому сводки процессов
+складываются без потери перцентилей. SQL-запросы медленнее
+METRICS_SLOW_QUERY_MS пишутся в журнал posts.metrics, а
+METRICS_SLOW_QUERIES самых медленных хранятся вместе со сводкой.
+"""
+import heapq
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы времени ответа, мс
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+COUNTERS = ('requests', 'queries', 'sql_ms', 'template_ms', 'total_ms',
+            'cache_hits', 'cache_misses')
+PROCESSES_KEY = 'posts:metrics:processes'
+EPOCH_KEY = 'posts:metrics:epoch'
+SQL_PREVIEW = 500
+
+_local = threading.local()
+_installed = False
+_missing = object()
+
+
+def current_sample():
+    """Замер текущего запроса или None, если запрос не замеряется."""
+    return getattr(_local, 'sample', None)
+
+
+class RequestSample:
+    """Замер одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.slow = []
+        # Глубина вложенных вызовов: get_many через get и include
+        # шаблона не считаются второй раз. Счётчики у шаблонов и кеша
+        # свои: {% cache %} внутри шаблона - такое же чтение кеша
+        self.depth = {'template': 0, 'cache': 0}
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.sql_ms += duration
+            if duration >= settings.METRICS_SLOW_QUERY_MS:
+                self.slow.append((duration, sql[:SQL_PREVIEW]))
+
+    def capture_queries(self):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(
+                connections[alias].execute_wrapper(self.execute)
+            )
+        return stack
+
+
+def measured(method, record, kind):
+    """Обёртка метода: record(sample, result, elapsed_ms, *args) только
+    для замеряемого запроса и только во внешнем вызове того же вида
+    (kind - 'template' или 'cache')."""
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        sample = current_sample()
+        if sample is None or sample.depth[kind]:
+            return method(*args, **kwargs)
+        sample.depth[kind] += 1
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            sample.depth[kind] -= 1
+        record(sample, result, (time.perf_counter() - started) * 1000,
+               *args, **kwargs)
+        return result
+    return wrapper
+
+
+def record_render(sample, result, elapsed, *args, **kwargs):
+    sample.template_ms += elapsed
+
+
+def record_get_many(sample, result, elapsed, backend, keys, *args,
+                    **kwargs):
+    sample.cache_hits += len(result)
+    sample.cache_misses += len(keys) - len(result)
+
+
+def instrumented_get(get):
+    """get кеша, отличающий промах от закешированного значения default."""
+    def record(sample, result, elapsed, *args, **kwargs):
+        if result is _missing:
+            sample.cache_misses += 1
+        else:
+            sample.cache_hits += 1
+
+    counted_get = measured(get, record, 'cache')
+
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        if current_sample() is None:
+            return get(self, key, default, version)
+        value = counted_get(self, key, _missing, version)
+        return default if value is _missing else value
+    return wrapper
+
+
+def install():
+    """Обернуть отрисовку шаблонов и чтение кешей. Выполняется один раз
+    на процесс, незамеряемые запросы обёртки не замедляют."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    Template.render = measured(Template.render, record_render, 'template')
+    for backend in {type(caches[alias]) for alias in settings.CACHES}:
+        backend.get = instrumented_get(backend.get)
+        backend.get_many = measured(backend.get_many, record_get_many,
+                                    'cache')
+
+
+def empty_stats():
+    stats = dict.fromkeys(COUNTERS, 0)
+    stats.update(max_queries=0, max_ms=0.0,
+                 histogram=[0] * (len(BUCKETS) + 1))
+    return stats
+
+
+def merge_stats(total, stats):
+    for field in COUNTERS:
+        total[field] += stats[field]
+    total['max_queries'] = max(total['max_queries'], stats['max_queries'])
+    total['max_ms'] = max(total['max_ms'], stats['max_ms'])
+    total['histogram'] = [
+        a + b for a, b in zip(total['histogram'], stats['histogram'])
+    ]
+
+
+def merge_slowest(lists, limit):
+    return heapq.nlargest(
+        limit, (tuple(item) for items in lists for item in items)
+    )
+
+
+class Registry:
+    """Сводка замеров процесса: {view_name: статистика} и самые
+    медленные SQL-запросы [(мс, SQL, view_name)]."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = f'posts:metrics:process:{os.getpid()}:{uuid.uuid4().hex}'
+        self.epoch = None
+        self.flushed = 0.0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.slowest = []
+
+    def add(self, view_name, sample, total_ms):
+        limit = settings.METRICS_SLOW_QUERIES
+        with self.lock:
+            stats = self.views.get(view_name)
+            if stats is None:
+                stats = self.views[view_name] = empty_stats()
+            stats['requests'] += 1
+            stats['queries'] += sample.queries
+            stats['sql_ms'] += sample.sql_ms
+            stats['template_ms'] += sample.template_ms
+            stats['total_ms'] += total_ms
+            stats['cache_hits'] += sample.cache_hits
+            stats['cache_misses'] += sample.cache_misses
+            stats['max_queries'] = max(stats['max_queries'], sample.queries)
+            stats['max_ms'] = max(stats['max_ms'], total_ms)
+            stats['histogram'][bisect_left(BUCKETS, total_ms)] += 1
+            for duration, sql in sample.slow:
+                item = (duration, sql, view_name)
+                if len(self.slowest) < limit:
+                    heapq.heappush(self.slowest, item)
+                else:
+                    heapq.heappushpop(self.slowest, item)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'views': {
+                    name: dict(stats, histogram=list(stats['histogram']))
+                    for name, stats in self.views.items()
+                },
+                'slowest': sorted(self.slowest, reverse=True),
+            }
+
+    def flush(self, force=False):
+        """Скопировать сводку в кеш, если подошло время."""
+        now = time.monotonic()
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if not force and self.flushed and now - self.flushed < interval:
+            return
+        first = not self.flushed
+        self.flushed = now
+        shared = cache.get_many([PROCESSES_KEY, EPOCH_KEY])
+        epoch = shared.get(EPOCH_KEY)
+        if epoch != self.epoch:
+            # Сводку сбросили командой metrics --reset в другом процессе
+            if not first:
+                self.reset()
+            self.epoch = epoch
+        cache.set(self.key, self.snapshot(), interval * 10)
+        processes = shared.get(PROCESSES_KEY, [])
+        if self.key not in processes:
+            cache.set(PROCESSES_KEY, processes[-100:] + [self.key], None)
+
+
+registry = Registry()
+
+
+def collect():
+    """Сводка всех процессов, сбросивших замеры в кеш, и текущего."""
+    registry.flush(force=True)
+    keys = cache.get(PROCESSES_KEY, [])
+    snapshots = list(cache.get_many(keys).values())
+    views = {}
+    for snapshot in snapshots:
+        for name, stats in snapshot['views'].items():
+            merge_stats(views.setdefault(name, empty_stats()), stats)
+    slowest = merge_slowest(
+        [snapshot['slowest'] for snapshot in snapshots],
+        settings.METRICS_SLOW_QUERIES
+    )
+    return {'views': views, 'slowest': slowest}
+
+
+def reset():
+    """Сбросить сводку во всех процессах."""
+    keys = cache.get(PROCESSES_KEY, [])
+    cache.delete_many(keys + [PROCESSES_KEY])
+    epoch = uuid.uuid4().hex
+    cache.set(EPOCH_KEY, epoch, None)
+    registry.reset()
+    registry.epoch = epoch
+
+
+def histogram_percentile(histogram, percent):
+    """Верхняя граница корзины, в которую попадает перцентиль, мс."""
+    rank = sum(histogram) * percent / 100
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if count and seen >= rank:
+            return BUCKETS[bucket] if bucket < len(BUCKETS) else None
+    return None
+
+
+def report(summary):
+    """Строки сводки по view от самого дорогого по суммарному времени."""
+    rows = []
+    for name, stats in summary['views'].items():
+        requests = stats['requests']
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        rows.append({
+            'view': name,
+            'requests': requests,
+            'queries': stats['queries'] / requests,
+            'max_queries': stats['max_queries'],
+            'sql_ms': stats['sql_ms'] / requests,
+            'template_ms': stats['template_ms'] / requests,
+            'total_ms': stats['total_ms'] / requests,
+            'p50_ms': histogram_percentile(stats['histogram'], 50),
+            'p95_ms': histogram_percentile(stats['histogram'], 95),
+            'max_ms': stats['max_ms'],
+            'cache_hit_ratio': (stats['cache_hits'] / lookups
+                                if lookups else None),
+        })
+    rows.sort(key=lambda row: row['total_ms'] * row['requests'],
+              reverse=True)
+    return rows
+
+
+class RequestMetricsMiddleware:
+    """Замер запросов, см. описание модуля. Ставится первым в
+    MIDDLEWARE, чтобы полное время включало остальные middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        rate = settings.METRICS_SAMPLE_RATE
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+        sample = RequestSample()
+        _local.sample = sample
+        started = time.perf_counter()
+        try:
+            with sample.capture_queries():
+                response = self.get_response(request)
+        finally:
+            _local.sample = None
+        total_ms = (time.perf_counter() - started) * 1000
+        match = request.resolver_match
+        if match is not None:
+            registry.add(match.view_name, sample, total_ms)
+            for duration, sql in sample.slow:
+                logger.warning('Медленный запрос %s, %.1f мс: %s',
+                               match.view_name, duration, sql)
+        registry.flush()
+        return response
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-17 08:37
+
+from collections import Counter
+
+from django.db import migrations, models
+import posts.storage
+
+
+def fill_stored_files(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    ImageVariant = apps.get_model('posts', 'ImageVariant')
+    StoredFile = apps.get_model('posts', 'StoredFile')
+
+    references = Counter()
+    for model in (Post, ImageVariant):
+        names = model.objects.exclude(image='').exclude(image=None)
+        references.update(names.values_list('image', flat=True).iterator())
+    # Пачка по лимиту параметров СУБД (у SQLite - 999): явный batch_size
+    # Django 2.2 с ним не сверяет
+    fields = StoredFile._meta.concrete_fields
+    batch_size = max(schema_editor.connection.ops.bulk_batch_size(
+        fields, [None] * len(references)
+    ), 1)
+    StoredFile.objects.bulk_create(
+        (StoredFile(name=name, refcount=count)
+         for name, count in references.items()),
+        batch_size=batch_size
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+            },
+        ),
+        migrations.AlterField(
+            model_name='imagevariant',
+            name='image',
+            field=models.ImageField(storage=posts.storage.ContentAddressedStorage(), upload_to='variants/', verbose_name='Файл копии'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Файл с изображением'),
+        ),
+        migrations.RunPython(fill_stored_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+from posts.search import terms
+
+# Схема и наполнение индекса на момент миграции: строка на запись,
+# в колонке comments - тексты всех её комментариев
+CREATE_SQL = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5('
+    "text, comments, tokenize='unicode61 remove_diacritics 0')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    schema_editor.execute(CREATE_SQL)
+    with schema_editor.connection.cursor() as cursor:
+        comments = {}
+        cursor.execute(
+            f'SELECT post_id, text FROM {Comment._meta.db_table}'
+        )
+        for post_id, text in cursor.fetchall():
+            comments.setdefault(post_id, []).extend(terms(text))
+        cursor.execute(f'SELECT id, text FROM {Post._meta.db_table}')
+        cursor.executemany(
+            'INSERT INTO posts_search (rowid, text, comments) '
+            'VALUES (%s, %s, %s)',
+            [(pk, ' '.join(terms(text)), ' '.join(comments.get(pk, ())))
+             for pk, text in cursor.fetchall()]
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_content_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,68 @@
+from importlib import import_module
+
+from django.db import migrations
+
+from posts.search import terms
+
+# Комментарии - отдельные строки индекса: rowid - минус id комментария,
+# post_id (не индексируется) - id записи
+CREATE_SQL = (
+    'CREATE VIRTUAL TABLE posts_search USING fts5('
+    'text, comments, post_id UNINDEXED, '
+    "tokenize='unicode61 remove_diacritics 0')"
+)
+INSERT_SQL = (
+    'INSERT INTO posts_search (rowid, text, comments, post_id) '
+    'VALUES (%s, %s, %s, %s)'
+)
+BATCH_SIZE = 1000
+
+
+def copy_rows(connection, select, make_row):
+    with connection.cursor() as cursor, connection.cursor() as insert:
+        cursor.execute(select)
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                return
+            insert.executemany(INSERT_SQL, [make_row(*row) for row in rows])
+
+
+def split_comment_rows(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+    schema_editor.execute(CREATE_SQL)
+    copy_rows(
+        schema_editor.connection,
+        f'SELECT id, text FROM {Post._meta.db_table}',
+        lambda pk, text: (pk, ' '.join(terms(text)), '', pk)
+    )
+    copy_rows(
+        schema_editor.connection,
+        f'SELECT id, post_id, text FROM {Comment._meta.db_table}',
+        lambda pk, post_id, text: (-pk, '', ' '.join(terms(text)), post_id)
+    )
+
+
+def join_comment_rows(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE posts_search')
+    # Прежние схема и наполнение - из 0024
+    import_module('posts.migrations.0024_search_index').create_search_index(
+        apps, schema_editor
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_suggested_authors'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_comment_rows, join_comment_rows),
+    ]
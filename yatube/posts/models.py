@@ -1,9 +1,23 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+
+from .storage import content_storage
 
 User = get_user_model()
 
 
+def bulk_batch_size(model, size):
+    """Размер пачки bulk_create не больше size и лимита СУБД.
+
+    Явный batch_size Django 2.2 не сверяет с лимитом параметров запроса
+    (у SQLite - 999 параметров и 500 строк), в отличие от bulk_update.
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if not isinstance(field, models.AutoField)]
+    ops = connections[router.db_for_write(model)].ops
+    return min(size, max(ops.bulk_batch_size(fields, [None] * size), 1))
+
+
 class Group(models.Model):
     title = models.CharField(
         max_length=200, unique=True,
@@ -33,6 +47,21 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Набор записей для вывода лентой.
+
+        Автор и подборка подтягиваются одним JOIN, а количество
+        комментариев хранится в самой записи (Post.comments_count).
+        Уменьшенные копии картинок всей страницы загружаются одним
+        дополнительным запросом, поэтому карточка записи в шаблоне
+        не делает своих обращений к БД.
+        """
+        return self.select_related('author', 'group').prefetch_related(
+            'variants'
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст записи'
@@ -42,19 +71,48 @@ class Post(models.Model):
         auto_now_add=True
     )
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE,
+        User, on_delete=models.CASCADE, db_index=False,
         related_name='posts', verbose_name='Автор'
     )
     group = models.ForeignKey(
         Group, on_delete=models.SET_NULL, blank=True, null=True,
+        db_index=False,
         related_name='posts', verbose_name='Подборка записей'
     )
     image = models.ImageField(
         verbose_name='Файл с изображением',
-        upload_to='posts/', blank=True, null=True
+        upload_to='posts/', storage=content_storage, blank=True, null=True
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0, editable=False
+    )
+    # Метка версии карточки записи: меняется при правке записи, смене
+    # картинки и при добавлении или удалении комментария (signals.py).
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
     )
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
+        # Индексы повторяют порядок ленты (-pub_date, -id), по которому
+        # листает и CursorPaginator, отдельно для всей ленты, автора и
+        # подборки. Они же заменяют одиночные индексы author и group.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
         ordering = ('-pub_date',)
         verbose_name = 'Запись'
         verbose_name_plural = 'Записи'
@@ -65,7 +123,7 @@ class Post(models.Model):
 
 class Comment(models.Model):
     post = models.ForeignKey(
-        Post, on_delete=models.CASCADE,
+        Post, on_delete=models.CASCADE, db_index=False,
         related_name='comments', verbose_name='Комментируемая запись'
     )
     author = models.ForeignKey(
@@ -81,6 +139,15 @@ class Comment(models.Model):
     )
 
     class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'
+            ),
+            # Список комментариев в админке по дате (date_hierarchy)
+            models.Index(
+                fields=['-created', '-id'], name='comment_created_idx'
+            ),
+        ]
         ordering = ('created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
@@ -91,11 +158,11 @@ class Comment(models.Model):
 
 class Follow(models.Model):
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE,
+        User, on_delete=models.CASCADE, db_index=False,
         related_name='follower', verbose_name='Подписчик'
     )
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE,
+        User, on_delete=models.CASCADE, db_index=False,
         related_name='following', verbose_name='Автор записей'
     )
 
@@ -109,6 +176,13 @@ class Follow(models.Model):
                 name='not_yourself_follow'
             ),
         ]
+        # Подписчики автора (раскладка ленты, счётчики); подписки
+        # читателя обслуживает индекс ограничения unique_follow.
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
         ordering = ('author',)
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
@@ -116,3 +190,203 @@ class Follow(models.Model):
     def __str__(self):
         return (f'Подписчик {self.user.username[:15]}'
                 f' на автора {self.author.username[:15]}')
+
+
+class TimelineEntry(models.Model):
+    """Запись в материализованной ленте подписок читателя.
+
+    Заполняется при публикации (fan-out on write), поэтому лента
+    подписок читается по индексу (user, -pub_date) без JOIN с Follow.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='timeline', verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name='timeline_entries', verbose_name='Запись'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации записи'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+
+    def __str__(self):
+        return f'{self.user.username[:15]} {self.post}'
+
+
+class SuggestedAuthor(models.Model):
+    """Автор, предложенный читателю для подписки (блок "Кого читать").
+
+    Таблицу целиком пересобирает команда suggest_authors
+    (suggestions.py), страницы читают предложения читателя одним
+    запросом по индексу ограничения (user, rank).
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, db_index=False,
+        related_name='suggested_authors', verbose_name='Читатель'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='suggested_to', verbose_name='Предложенный автор'
+    )
+    score = models.FloatField(verbose_name='Оценка')
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'rank'], name='unique_suggestion_rank'
+            ),
+        ]
+        ordering = ('user', 'rank')
+        verbose_name = 'Предложенный автор'
+        verbose_name_plural = 'Предложенные авторы'
+
+    def __str__(self):
+        return (f'{self.author.username[:15]} для '
+                f'{self.user.username[:15]} ({self.rank})')
+
+
+class ImageVariant(models.Model):
+    """Уменьшенная копия картинки записи для srcset карточки.
+
+    Все копии одной картинки создаются за одно декодирование
+    (см. variants.py). source - имя файла Post.image, из которого они
+    сделаны: после замены картинки копии устаревают. Файлы копий, как
+    и картинки записей, адресуются по содержимому и общие у записей
+    с одинаковой картинкой.
+    """
+    WEBP = 'webp'
+    JPEG = 'jpeg'
+    FORMAT_CHOICES = (
+        (WEBP, 'WebP'),
+        (JPEG, 'JPEG'),
+    )
+
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name='variants', verbose_name='Запись'
+    )
+    source = models.CharField(
+        verbose_name='Исходный файл', max_length=100
+    )
+    format = models.CharField(
+        verbose_name='Формат', max_length=4, choices=FORMAT_CHOICES
+    )
+    width = models.PositiveSmallIntegerField(verbose_name='Ширина')
+    height = models.PositiveSmallIntegerField(verbose_name='Высота')
+    image = models.ImageField(
+        verbose_name='Файл копии', upload_to='variants/',
+        storage=content_storage
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'format', 'width'],
+                name='unique_image_variant'
+            ),
+        ]
+        ordering = ('format', 'width')
+        verbose_name = 'Копия картинки'
+        verbose_name_plural = 'Копии картинок'
+
+    def __str__(self):
+        return f'{self.post_id} {self.format} {self.width}w'
+
+
+class UserCounters(models.Model):
+    """Счётчики пользователя, которые выводятся в шапке профиля.
+
+    Поддерживаются сигналами из signals.py через F()-выражения,
+    пересчитываются командой rebuild_counters.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name='counters', verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Записей', default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков', default=0
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Подписан', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user.username[:15]}'
+
+    @classmethod
+    def actual(cls, user_id):
+        """Счётчики пользователя, заново посчитанные по таблицам."""
+        return cls(
+            user_id=user_id,
+            posts_count=Post.objects.filter(author_id=user_id).count(),
+            followers_count=Follow.objects.filter(author_id=user_id).count(),
+            following_count=Follow.objects.filter(user_id=user_id).count(),
+        )
+
+
+class StoredFile(models.Model):
+    """Счётчик ссылок на файл в хранилище по содержимому (storage.py).
+
+    Ссылками считаются Post.image и ImageVariant.image, счётчики
+    поддерживаются сигналами из signals.py. Файлы без ссылок удаляет
+    команда collect_media, она же сверяет счётчики с таблицами.
+    """
+    name = models.CharField(
+        verbose_name='Имя файла', max_length=255, primary_key=True
+    )
+    refcount = models.PositiveIntegerField(
+        verbose_name='Ссылок', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
+
+    @classmethod
+    def acquire(cls, name):
+        if not name:
+            return
+        files = cls.objects.filter(name=name)
+        if files.update(refcount=models.F('refcount') + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, refcount=1)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            files.update(refcount=models.F('refcount') + 1)
+
+    @classmethod
+    def release(cls, name):
+        if name:
+            cls.objects.filter(name=name, refcount__gt=0).update(
+                refcount=models.F('refcount') - 1
+            )
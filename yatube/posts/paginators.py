@@ -0,0 +1,224 @@
+import base64
+import binascii
+import json
+
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .counts import cached_count
+
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+
+
+def item_position(item, date_field='pub_date'):
+    """Ключ (дата, id) объекта ленты: модели или строки values()."""
+    if isinstance(item, dict):
+        return item[date_field], item['id']
+    return getattr(item, date_field), item.pk
+
+
+def encode_cursor(direction, item, date_field='pub_date'):
+    """Упаковать позицию объекта в ленте в непрозрачный токен для url."""
+    date, pk = item_position(item, date_field)
+    raw = json.dumps(
+        [direction, date.isoformat(), pk], separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковать токен курсора.
+
+    return - кортеж (направление, pub_date, id) или None, если токен
+             отсутствует или повреждён.
+    """
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding)
+        direction, pub_date, pk = json.loads(raw.decode())
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if direction not in (CURSOR_NEXT, CURSOR_PREVIOUS) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CountingPaginator(Paginator):
+    """Пагинатор по номерам страниц с общим числом объектов из кеша.
+
+    count_key - ключ счётчика области в кеше (см. counts.count_key),
+                без него количество считается запросом COUNT(*), как у
+                обычного Paginator.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return super().count
+        return cached_count(self.count_key, self.object_list)
+
+
+def estimate_rows(model, using='default'):
+    """Приблизительное число строк таблицы модели без COUNT(*).
+
+    PostgreSQL - по статистике планировщика (pg_class.reltuples),
+    SQLite - по статистике ANALYZE (sqlite_stat1), а без неё - по
+    разбросу rowid, что завышает оценку на число удалённых строк.
+    return - число или None, если оценить нельзя.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = to_regclass(%s)', [table]
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone():
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                    [table]
+                )
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            cursor.execute(
+                f'SELECT max(rowid) - min(rowid) + 1 FROM "{table}"'
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки для больших таблиц.
+
+    Число строк таблицы без фильтров берётся из оценки estimate_rows:
+    COUNT(*) по миллионам строк читает всю таблицу. Если таблица
+    меньше ESTIMATE_FROM строк или отфильтрована (поиск, date_hierarchy),
+    считается точно.
+    """
+    ESTIMATE_FROM = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.ESTIMATE_FROM:
+                return estimate
+        return super().count
+
+
+class CursorPage(Page):
+    """Страница ленты, которая знает только соседей, но не общее число.
+
+    Номера страниц не вычисляются, вместо них шаблон получает
+    токены next_cursor и previous_cursor.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page {self.previous_cursor}:{self.next_cursor}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (дата, id) без COUNT(*) и OFFSET.
+
+    Каждая страница выбирается одним запросом по индексируемому условию
+    "строго после/до последнего показанного объекта", поэтому глубина
+    страницы не влияет на время ответа. По умолчанию листает ленту
+    записей по pub_date от новых к старым; date_field и newest_first
+    задают другой ключ и порядок (комментарии - по created от старых).
+    Объекты - модели или строки values() с полем id.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 newest_first=True, **kwargs):
+        # Ленты, собираемые вне одного запроса (timeline.TimelineFeed),
+        # листаются по равносильному им QuerySet.
+        if hasattr(object_list, 'as_queryset'):
+            object_list = object_list.as_queryset()
+        super().__init__(object_list, per_page, **kwargs)
+        self.date_field = date_field
+        self.newest_first = newest_first
+
+    def get_page(self, cursor=None):
+        position = decode_cursor(cursor)
+        if position is None:
+            return self._page_after(None)
+        direction, date, pk = position
+        if direction == CURSOR_PREVIOUS:
+            return self._page_before((date, pk))
+        return self._page_after((date, pk))
+
+    def _beyond(self, position, forward):
+        """Объекты строго после position в порядке ленты (forward) или
+        строго до неё, отсортированные от position."""
+        descending = self.newest_first == forward
+        sign, lookup = ('-', 'lt') if descending else ('', 'gt')
+        queryset = self.object_list.order_by(
+            f'{sign}{self.date_field}', f'{sign}pk'
+        )
+        if position is None:
+            return queryset
+        date, pk = position
+        return queryset.filter(
+            Q(**{f'{self.date_field}__{lookup}': date})
+            | Q(**{self.date_field: date, f'pk__{lookup}': pk})
+        )
+
+    def _cursor(self, direction, item):
+        return encode_cursor(direction, item, self.date_field)
+
+    def _page_after(self, position):
+        rows = list(self._beyond(position, True)[:self.per_page + 1])
+        items = rows[:self.per_page]
+        next_cursor = previous_cursor = None
+        if len(rows) > self.per_page:
+            next_cursor = self._cursor(CURSOR_NEXT, items[-1])
+        if position is not None and items:
+            previous_cursor = self._cursor(CURSOR_PREVIOUS, items[0])
+        return CursorPage(items, self, next_cursor, previous_cursor)
+
+    def _page_before(self, position):
+        rows = list(self._beyond(position, False)[:self.per_page + 1])
+        items = rows[:self.per_page][::-1]
+        if not items:
+            return self._page_after(None)
+        next_cursor = self._cursor(CURSOR_NEXT, items[-1])
+        previous_cursor = None
+        if len(rows) > self.per_page:
+            previous_cursor = self._cursor(CURSOR_PREVIOUS, items[0])
+        return CursorPage(items, self, next_cursor, previous_cursor)
@@ -0,0 +1,342 @@
+"""Полнотекстовый поиск по записям и комментариям.
+
+Индекс - виртуальная таблица SQLite FTS5 в основной базе (создаётся
+миграциями 0024 и 0027). У записи своя строка: rowid равен id записи,
+текст лежит в колонке text. У каждого комментария тоже: rowid равен
+минус id комментария, текст - в колонке comments. В колонке post_id
+(не индексируется) - id записи. Новый комментарий добавляет одну
+строку, не перестраивая строку записи.
+Слова хранятся уже приведёнными к основе (stem, русский Snowball),
+поэтому "котами" и "кот" находят друг друга. Запрос проходит ту же
+обработку, записи ранжируются по BM25, совпадения в тексте записи
+весят больше, чем в комментариях.
+
+Индекс обновляется сигналами (signals.py) в той же транзакции, что и
+сами записи. bulk_create сигналов не отправляет: после массовой
+загрузки индекс пересобирается командой search_index, а очередь
+комментариев (comment_buffer) индексирует свои пачки сама.
+
+На других СУБД таблицы нет, и поиск сводится к icontains по текстам.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Comment, Post
+
+INDEX_TABLE = 'posts_search'
+# Веса колонок для bm25(): text, comments
+RANK = f'bm25({INDEX_TABLE}, 1.0, 0.4)'
+MAX_TERMS = 16
+BATCH_SIZE = 1000
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile('[а-я]')
+RV_RE = re.compile('^(.*?[аеиоуыэюя])(.*)$')
+R1_RE = re.compile('.*?[аеиоуыэюя][^аеиоуыэюя]')
+
+PERFECTIVE_GERUND_RE = re.compile(
+    '((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE_RE = re.compile('(ся|сь)$')
+ADJECTIVE_RE = re.compile(
+    '(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    'ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE_RE = re.compile('((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB_RE = re.compile(
+    '((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|'
+    'ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN_RE = re.compile(
+    '(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = ('ость', 'ост')
+SUPERLATIVE_RE = re.compile('(ейше|ейш)$')
+
+
+def strip_ending(rv):
+    """Шаг 1 Snowball: окончание деепричастия, иначе возвратная частица
+    и окончание прилагательного, глагола или существительного."""
+    rv, found = PERFECTIVE_GERUND_RE.subn('', rv, count=1)
+    if found:
+        return rv
+    rv = REFLEXIVE_RE.sub('', rv, count=1)
+    rv, found = ADJECTIVE_RE.subn('', rv, count=1)
+    if found:
+        return PARTICIPLE_RE.sub('', rv, count=1)
+    rv, found = VERB_RE.subn('', rv, count=1)
+    if found:
+        return rv
+    return NOUN_RE.sub('', rv, count=1)
+
+
+def r2_start(word):
+    """Начало области R2 слова (len(word), если области нет)."""
+    r1 = R1_RE.match(word)
+    r2 = r1 and R1_RE.match(word, r1.end())
+    return r2.end() if r2 else len(word)
+
+
+def stem(word):
+    """Основа слова по алгоритму Snowball для русского языка.
+
+    Слова без кириллицы (латиница, числа) только приводятся
+    к нижнему регистру.
+    """
+    word = word.lower().replace('ё', 'е')
+    match = RV_RE.match(word)
+    if match is None or not CYRILLIC_RE.search(word):
+        return word
+    prefix, rv = match.groups()
+
+    rv = strip_ending(rv)
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    # Шаг 3: словообразовательные суффиксы, только в области R2
+    start = r2_start(prefix + rv)
+    for suffix in DERIVATIONAL:
+        if rv.endswith(suffix) and len(prefix + rv) - len(suffix) >= start:
+            rv = rv[:-len(suffix)]
+            break
+    # Шаг 4
+    if rv.endswith('нн'):
+        return prefix + rv[:-1]
+    rv, found = SUPERLATIVE_RE.subn('', rv, count=1)
+    if found and rv.endswith('нн'):
+        rv = rv[:-1]
+    elif rv.endswith('ь'):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def terms(text):
+    """Основы всех слов текста в порядке следования."""
+    return [stem(word) for word in WORD_RE.findall(text or '')]
+
+
+def query_terms(query):
+    """Основы слов запроса в кавычках, для MATCH по одной.
+
+    Кавычки не дают операторам FTS5 в запросе работать и вызывать
+    синтаксические ошибки. return - список, пустой, если в запросе
+    нет слов.
+    """
+    words = list(dict.fromkeys(terms(query)))[:MAX_TERMS]
+    return [f'"{word}"' for word in words]
+
+
+def matching_posts(words):
+    """SQL и параметры подзапроса id записей, в тексте или комментариях
+    которых есть все слова: слова могут стоять в разных строках
+    индекса, поэтому каждое ищется отдельно и id пересекаются."""
+    sql = ' INTERSECT '.join(
+        [f'SELECT post_id FROM {INDEX_TABLE} '
+         f'WHERE {INDEX_TABLE} MATCH %s'] * len(words)
+    )
+    return sql, list(words)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def post_row(pk, text):
+    """Строка индекса записи: rowid - id записи."""
+    return pk, ' '.join(terms(text)), '', pk
+
+
+def comment_row(pk, post_id, text):
+    """Строка индекса комментария: rowid - минус id комментария."""
+    return -pk, '', ' '.join(terms(text)), post_id
+
+
+def insert_rows(cursor, rows):
+    # Одной командой: между отдельными DELETE и INSERT параллельный
+    # запрос успевал вставить ту же строку, и INSERT падал
+    cursor.executemany(
+        f'INSERT OR REPLACE INTO {INDEX_TABLE} '
+        f'(rowid, text, comments, post_id) VALUES (%s, %s, %s, %s)',
+        rows
+    )
+
+
+def index_post(post_id):
+    """Переиндексировать текст записи. Комментарии - отдельные строки
+    индекса, их правка запись не трогает."""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT text FROM {Post._meta.db_table} WHERE id = %s',
+            [post_id]
+        )
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s',
+                           [post_id])
+            return
+        insert_rows(cursor, [post_row(post_id, row[0])])
+
+
+def unindex_post(post_id):
+    """Убрать запись из индекса. Строки её комментариев убирают
+    сигналы удаления комментариев (каскад их отправляет)."""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s',
+                       [post_id])
+
+
+def index_comments(comments):
+    """Проиндексировать комментарии: (id, id записи, текст)."""
+    if not is_available():
+        return
+    rows = [comment_row(*comment) for comment in comments]
+    if rows:
+        with connection.cursor() as cursor:
+            insert_rows(cursor, rows)
+
+
+def unindex_comment(comment_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s',
+                       [-comment_id])
+
+
+def stream_rows(db_connection, select, make_row):
+    """Проиндексировать строки select пачками по BATCH_SIZE, не держа
+    таблицу в памяти. return - число строк."""
+    count = 0
+    with db_connection.cursor() as cursor, \
+            db_connection.cursor() as insert:
+        cursor.execute(select)
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                return count
+            insert_rows(insert, [make_row(*row) for row in rows])
+            count += len(rows)
+
+
+def rebuild(db_connection=connection):
+    """Пересобрать индекс целиком по таблицам записей и комментариев.
+
+    return - число проиндексированных записей.
+    """
+    with db_connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+    count = stream_rows(
+        db_connection, f'SELECT id, text FROM {Post._meta.db_table}',
+        post_row
+    )
+    stream_rows(
+        db_connection,
+        f'SELECT id, post_id, text FROM {Comment._meta.db_table}',
+        comment_row
+    )
+    with db_connection.cursor() as cursor:
+        # Слить сегменты индекса после массовой вставки
+        cursor.execute(
+            f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')"
+        )
+    return count
+
+
+class SearchResults:
+    """Найденные записи для пагинатора, от более релевантных к менее.
+
+    Как timeline.TimelineFeed, поддерживает count() и срезы: срез
+    выбирает из индекса только id нужной страницы (ORDER BY bm25 LIMIT),
+    и загружает только эти записи. Вес записи - сумма bm25 её строк
+    индекса (текст и комментарии), в которых есть слова запроса.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.words = query_terms(query)
+
+    def count(self):
+        if not self.words:
+            return 0
+        sql, params = matching_posts(self.words)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM ({sql})', params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('SearchResults supports only plain slices.')
+        if not self.words:
+            return []
+        start = key.start or 0
+        limit = -1 if key.stop is None else max(key.stop - start, 0)
+        sql, params = matching_posts(self.words)
+        with connection.cursor() as cursor:
+            # LIMIT -1 не даёт SQLite развернуть подзапрос: bm25()
+            # нельзя вызывать внутри агрегата
+            cursor.execute(
+                f'SELECT post_id FROM ('
+                f'SELECT post_id, {RANK} AS score FROM {INDEX_TABLE} '
+                f'WHERE {INDEX_TABLE} MATCH %s LIMIT -1) '
+                f'WHERE post_id IN ({sql}) GROUP BY post_id '
+                f'ORDER BY SUM(score), post_id DESC LIMIT %s OFFSET %s',
+                [' OR '.join(self.words), *params, limit, start]
+            )
+            ids = [pk for pk, in cursor.fetchall()]
+        posts = Post.objects.feed().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+class IndexSubquery(RawSQL):
+    """Подзапрос к индексу для условия pk__in.
+
+    Лукап __in сам берёт выражение в скобки, а RawSQL добавил бы вторые:
+    "id IN ((SELECT ...))" SQLite читает как скалярный подзапрос и
+    берёт из него только первую строку.
+    """
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def filter_posts(posts, query):
+    """Отфильтровать QuerySet записей по запросу, без ранжирования.
+
+    На SQLite условие - подзапрос к индексу (id IN (SELECT post_id ...)),
+    на других СУБД - icontains по текстам записей и комментариев.
+    """
+    if is_available():
+        words = query_terms(query)
+        if not words:
+            return posts.none()
+        return posts.filter(pk__in=IndexSubquery(*matching_posts(words)))
+    words = WORD_RE.findall(query)[:MAX_TERMS]
+    if not words:
+        return posts.none()
+    for word in words:
+        # Подзапрос вместо JOIN: записи не дублируются, и результат
+        # можно объединять с другими QuerySet (admin.PostAdmin)
+        commented = Comment.objects.filter(
+            text__icontains=word
+        ).values('post_id')
+        posts = posts.filter(Q(text__icontains=word) | Q(pk__in=commented))
+    return posts
+
+
+def search(query):
+    """Записи, подходящие под запрос: SearchResults или QuerySet."""
+    if is_available():
+        return SearchResults(query)
+    return filter_posts(Post.objects.feed(), query)
@@ -0,0 +1,310 @@
+"""Генерация правдоподобного набора данных большого объёма.
+
+Строки генерируются порциями (при workers > 0 - в пуле процессов) и
+вставляются bulk_create пачками по batch_size. Популярность авторов и
+записей распределена по закону Ципфа: немногие авторы пишут большую
+часть записей и собирают большую часть подписчиков, немногие записи -
+большую часть комментариев. Каждая порция генерируется своим
+random.Random от seed и номера порции, поэтому набор не зависит от
+числа процессов.
+
+bulk_create не отправляет сигналов, поэтому после вставки производные
+данные (счётчики, ленты подписок, поисковый индекс) пересобираются
+теми же командами, что и после ручного ремонта.
+"""
+import io
+import itertools
+import multiprocessing
+import random
+import time
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from . import search
+from .models import Comment, Follow, Group, Post, User, bulk_batch_size
+
+CHUNK_SIZE = 10000
+WORDS = (
+    'город', 'река', 'кот', 'собака', 'лес', 'поезд', 'книга', 'музыка',
+    'утро', 'вечер', 'дождь', 'солнце', 'море', 'гора', 'дорога', 'друг',
+    'работа', 'отпуск', 'фотография', 'кофе', 'чай', 'зима', 'лето',
+    'осень', 'весна', 'красивый', 'новый', 'старый', 'тихий', 'быстрый',
+    'гулять', 'читать', 'писать', 'смотреть', 'слушать', 'думать',
+    'вспоминать', 'ехать', 'видеть', 'любить', 'сегодня', 'вчера',
+    'снова', 'очень', 'немного', 'долго', 'рядом', 'далеко', 'python',
+    'django',
+)
+SEED_PASSWORD = 'seed-password'
+
+# Данные, общие для всех порций. Процессы пула создаются через fork и
+# получают их без сериализации в каждую задачу.
+shared = {}
+
+
+def zipf_weights(count, skew):
+    """Накопленные веса рангов 1..count для random.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, count + 1)
+    ))
+
+
+def zipf_choice(rng, cum_weights):
+    """Индекс по накопленным весам: как random.choices, но без списка."""
+    return bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+def sentence(rng, low, high):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize()
+
+
+def chunk_rng(seed, kind, number):
+    """Генератор порции: зависит только от seed и номера порции."""
+    return random.Random(f'{seed}:{kind}:{number}')
+
+
+def post_chunk(args):
+    """Строки записей порции: (текст, индекс автора, индекс подборки,
+    дата). Работает без Django, поэтому годится для пула процессов."""
+    seed, number, count, authors, groups, skew, days, now = args
+    rng = chunk_rng(seed, 'posts', number)
+    cum_weights = zipf_weights(authors, skew)
+    rows = []
+    for _ in range(count):
+        group = rng.randrange(groups) if groups and rng.random() < 0.4 \
+            else None
+        rows.append((
+            sentence(rng, 5, 40), zipf_choice(rng, cum_weights), group,
+            now - timedelta(seconds=rng.uniform(0, days * 86400)),
+        ))
+    return rows
+
+
+def comment_chunk(args):
+    """Строки комментариев порции: (текст, индекс автора, индекс записи,
+    дата не раньше записи)."""
+    seed, number, count, users, skew, now = args
+    post_dates = shared['post_dates']
+    rng = chunk_rng(seed, 'comments', number)
+    # Популярны свежие записи: ранг записи - её место от новых к старым
+    cum_weights = zipf_weights(len(post_dates), skew)
+    rows = []
+    for _ in range(count):
+        post = len(post_dates) - 1 - zipf_choice(rng, cum_weights)
+        pub_date = post_dates[post]
+        created = pub_date + (now - pub_date) * rng.random() ** 3
+        rows.append((sentence(rng, 1, 15), rng.randrange(users), post,
+                     created))
+    return rows
+
+
+def follow_chunk(args):
+    """Пары (читатель, автор) для порции читателей; на кого подписаться,
+    выбирается по популярности авторов."""
+    seed, number, readers, users, follows, skew = args
+    rng = chunk_rng(seed, 'follows', number)
+    cum_weights = zipf_weights(users, skew)
+    rows = []
+    for reader in readers:
+        count = min(int(rng.expovariate(1 / follows)) if follows else 0,
+                    users - 1)
+        authors = set()
+        for _ in range(count * 3):
+            if len(authors) >= count:
+                break
+            author = zipf_choice(rng, cum_weights)
+            if author != reader:
+                authors.add(author)
+        rows.extend((reader, author) for author in sorted(authors))
+    return rows
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключить auto_now/auto_now_add у полей на время вставки,
+    чтобы bulk_create сохранил сгенерированные даты."""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def chunks(total, size=CHUNK_SIZE):
+    """Номера и размеры порций для total строк."""
+    for number, start in enumerate(range(0, total, size)):
+        yield number, min(size, total - start)
+
+
+class Seeder:
+    """Наполнение БД. Параметры - как у команды seed_yatube."""
+
+    def __init__(self, users=1000, groups=20, posts=100_000,
+                 comments=200_000, follows=20, skew=1.1, days=365, seed=0,
+                 batch_size=5000, workers=0, prefix='seed', log=None):
+        self.users = users
+        self.groups = groups
+        self.posts = posts
+        self.comments = comments
+        self.follows = follows
+        self.skew = skew
+        self.days = days
+        self.seed = seed
+        self.batch_size = batch_size
+        self.workers = workers
+        self.prefix = prefix
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def map(self, func, tasks):
+        """Порции по порядку: в пуле процессов или в текущем процессе."""
+        if not self.workers:
+            return map(func, tasks)
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(self.workers)
+        self._pools.append(pool)
+        return pool.imap(func, tasks)
+
+    def run(self):
+        """Наполнить БД. return - {этап: секунд}."""
+        self._pools = []
+        timings = {}
+        try:
+            with transaction.atomic():
+                for stage in ('users', 'groups', 'posts', 'comments',
+                              'follows'):
+                    started = time.perf_counter()
+                    count = getattr(self, f'insert_{stage}')()
+                    timings[stage] = time.perf_counter() - started
+                    self.log(f'{stage}: {count} за {timings[stage]:.1f} с')
+        finally:
+            for pool in self._pools:
+                pool.terminate()
+        started = time.perf_counter()
+        self.rebuild()
+        timings['rebuild'] = time.perf_counter() - started
+        self.log(f'производные данные за {timings["rebuild"]:.1f} с')
+        return timings
+
+    def bulk_create(self, model, objs, **kwargs):
+        model.objects.bulk_create(
+            objs, batch_size=bulk_batch_size(model, self.batch_size),
+            **kwargs
+        )
+
+    def insert_users(self):
+        # Хеш пароля общий: make_password на каждого занял бы минуты
+        password = make_password(SEED_PASSWORD)
+        self.bulk_create(
+            User,
+            (User(username=f'{self.prefix}_{number}', password=password)
+             for number in range(self.users))
+        )
+        self.user_ids = list(User.objects.filter(
+            username__startswith=f'{self.prefix}_'
+        ).order_by('pk').values_list('pk', flat=True))
+        return len(self.user_ids)
+
+    def insert_groups(self):
+        self.bulk_create(
+            Group,
+            (Group(title=f'{self.prefix} подборка {number}',
+                   slug=f'{self.prefix}-{number}',
+                   description=sentence(random.Random(number), 5, 20))
+             for number in range(self.groups))
+        )
+        self.group_ids = list(Group.objects.filter(
+            slug__startswith=f'{self.prefix}-'
+        ).order_by('pk').values_list('pk', flat=True))
+        return len(self.group_ids)
+
+    def insert_posts(self):
+        tasks = (
+            (self.seed, number, count, len(self.user_ids),
+             len(self.group_ids), self.skew, self.days, self.now)
+            for number, count in chunks(self.posts)
+        )
+        pub_date = Post._meta.get_field('pub_date')
+        updated = Post._meta.get_field('updated')
+        with explicit_dates(pub_date, updated):
+            for rows in self.map(post_chunk, tasks):
+                self.bulk_create(
+                    Post,
+                    (Post(text=text, author_id=self.user_ids[author],
+                          group_id=(None if group is None
+                                    else self.group_ids[group]),
+                          pub_date=date, updated=date)
+                     for text, author, group, date in rows)
+                )
+        posts = Post.objects.filter(
+            author_id__in=self.user_ids
+        ).order_by('pub_date', 'pk').values_list('pk', 'pub_date')
+        self.post_ids, self.post_dates = [], []
+        for pk, date in posts.iterator():
+            self.post_ids.append(pk)
+            self.post_dates.append(date)
+        return len(self.post_ids)
+
+    def insert_comments(self):
+        if not self.post_ids:
+            return 0
+        shared['post_dates'] = self.post_dates
+        tasks = (
+            (self.seed, number, count, len(self.user_ids), self.skew,
+             self.now)
+            for number, count in chunks(self.comments)
+        )
+        created = Comment._meta.get_field('created')
+        inserted = 0
+        with explicit_dates(created):
+            for rows in self.map(comment_chunk, tasks):
+                self.bulk_create(
+                    Comment,
+                    (Comment(text=text, author_id=self.user_ids[author],
+                             post_id=self.post_ids[post], created=date)
+                     for text, author, post, date in rows)
+                )
+                inserted += len(rows)
+        return inserted
+
+    def insert_follows(self):
+        readers = range(len(self.user_ids))
+        size = max(CHUNK_SIZE // max(self.follows, 1), 1)
+        tasks = (
+            (self.seed, number, readers[start:start + size],
+             len(self.user_ids), self.follows, self.skew)
+            for number, start in enumerate(range(0, len(readers), size))
+        )
+        inserted = 0
+        for rows in self.map(follow_chunk, tasks):
+            self.bulk_create(
+                Follow,
+                (Follow(user_id=self.user_ids[reader],
+                        author_id=self.user_ids[author])
+                 for reader, author in rows),
+                ignore_conflicts=True
+            )
+            inserted += len(rows)
+        return inserted
+
+    def rebuild(self):
+        """Счётчики, ленты подписок, поисковый индекс и блок "Кого
+        читать" - по таблицам."""
+        commands = ['rebuild_counters', 'rebuild_timelines',
+                    'suggest_authors']
+        if search.is_available():
+            commands.append('search_index')
+        for command in commands:
+            call_command(command, stdout=io.StringIO())
+        # Закешированные страницы и счётчики не знают о вставленных строках
+        cache.clear()
@@ -0,0 +1,346 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import follow_graph, invalidation, search
+from .counts import (SCOPE_ALL, SCOPE_AUTHOR, SCOPE_FOLLOW, SCOPE_GROUP,
+                     SCOPE_GROUPS, change_counts, count_key, forget_counts)
+from .models import (Comment, Follow, Group, ImageVariant, Post, StoredFile,
+                     User, UserCounters)
+from .timeline import backfill, fan_out, is_pulled_author, trim
+
+# Имя и логин выводятся в шапке профиля, на странице записи, в карточках,
+# комментариях и предложениях авторов
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def shift_counter(queryset, field, delta, **values):
+    """Атомарно сдвинуть поле-счётчик на delta одним UPDATE.
+
+    Счётчик не уходит ниже нуля, даже если до этого разошёлся
+    с таблицами (его поправит команда rebuild_counters).
+    values - другие поля, которые надо обновить тем же запросом.
+    """
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta}, **values)
+
+
+def file_name(value):
+    """Имя файла из значения поля: строки из БД или FieldFile."""
+    return getattr(value, 'name', value) or ''
+
+
+def shift_user_counter(user_id, field, delta):
+    counters = UserCounters.objects.filter(user_id=user_id)
+    if shift_counter(counters, field, delta) or delta < 0:
+        return
+    # Строки счётчиков нет (пользователь создан в обход сигналов):
+    # заводим её сразу с актуальными значениями. При уменьшении так
+    # не делаем, чтобы не воскрешать счётчики удаляемого пользователя.
+    if not counters.exists():
+        UserCounters.actual(user_id).save()
+
+
+def post_count_keys(author_id, group_id):
+    keys = [count_key(SCOPE_ALL), count_key(SCOPE_AUTHOR, author_id)]
+    if group_id is not None:
+        keys.append(count_key(SCOPE_GROUP, group_id))
+    return keys
+
+
+def forget_follow_counts(author_id):
+    """Сбросить счётчики лент подписок всех читателей автора.
+
+    Работа растёт с числом подписчиков, поэтому у популярных авторов
+    (timeline.is_pulled_author), чьи записи и так не раскладываются по
+    лентам, счётчики не сбрасываются: они обновятся не позже
+    PAGINATOR_COUNT_TIMEOUT секунд.
+    """
+    if is_pulled_author(author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    forget_counts(count_key(SCOPE_FOLLOW, pk) for pk in followers)
+
+
+@receiver(post_init, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    instance._loaded_slug = instance.__dict__.get('slug')
+
+
+@receiver(post_init, sender=User)
+def remember_user_names(sender, instance, **kwargs):
+    instance._loaded_names = user_names(instance)
+
+
+def user_names(user):
+    """Поля пользователя, которые выводятся на страницах."""
+    return tuple(user.__dict__.get(name) for name in USER_NAME_FIELDS)
+
+
+@receiver(post_init, sender=Post)
+def remember_loaded_post(sender, instance, **kwargs):
+    # Подборка и картинка на момент загрузки нужны, чтобы при правке
+    # записи перенести её из счётчика старой подборки в счётчик новой,
+    # а ссылку - со старого файла на новый; текст - чтобы не
+    # переиндексировать запись, текст которой не менялся.
+    # Читаем из __dict__, чтобы не загружать отложенные поля.
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    instance._loaded_image = file_name(instance.__dict__.get('image'))
+    instance._loaded_text = instance.__dict__.get('text')
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        change_counts(
+            post_count_keys(instance.author_id, instance.group_id), 1
+        )
+        forget_follow_counts(instance.author_id)
+    elif instance._loaded_group_id != instance.group_id:
+        if instance._loaded_group_id is not None:
+            change_counts(
+                [count_key(SCOPE_GROUP, instance._loaded_group_id)], -1
+            )
+        if instance.group_id is not None:
+            change_counts([count_key(SCOPE_GROUP, instance.group_id)], 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_counts(post_count_keys(instance.author_id, instance.group_id), -1)
+    forget_follow_counts(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def count_changed_follow(sender, instance, **kwargs):
+    forget_counts([count_key(SCOPE_FOLLOW, instance.user_id)])
+    follow_graph.forget(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Group)
+def count_saved_group(sender, instance, created, **kwargs):
+    if created:
+        change_counts([count_key(SCOPE_GROUPS)], 1)
+    else:
+        # Название подборки выводится в карточках её записей
+        Post.objects.filter(group=instance).update(updated=timezone.now())
+
+
+@receiver(post_delete, sender=Group)
+def count_deleted_group(sender, instance, **kwargs):
+    change_counts([count_key(SCOPE_GROUPS)], -1)
+
+
+@receiver(post_save, sender=User)
+def create_user_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post_for_author(sender, instance, created, **kwargs):
+    if created:
+        shift_user_counter(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post_for_author(sender, instance, **kwargs):
+    shift_user_counter(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        shift_counter(
+            Post.objects.filter(pk=instance.post_id), 'comments_count', 1,
+            updated=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    shift_counter(
+        Post.objects.filter(pk=instance.post_id), 'comments_count', -1,
+        updated=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        shift_user_counter(instance.author_id, 'followers_count', 1)
+        shift_user_counter(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    shift_user_counter(instance.author_id, 'followers_count', -1)
+    shift_user_counter(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_saved_post(sender, instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    trim(instance.user_id, instance.author_id)
+
+
+def post_page_scopes(post, group_ids):
+    """Области кеша страниц, на которых выводится запись."""
+    scopes = [
+        (invalidation.SCOPE_FEED, None),
+        (invalidation.SCOPE_AUTHOR, post.author.username),
+    ]
+    group_ids = [pk for pk in group_ids if pk is not None]
+    if group_ids:
+        slugs = Group.objects.filter(pk__in=group_ids).values_list(
+            'slug', flat=True
+        )
+        scopes += [(invalidation.SCOPE_GROUP, slug) for slug in slugs]
+    return scopes
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    invalidation.bump_generations(post_page_scopes(
+        instance, (instance.group_id, instance._loaded_group_id)
+    ))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    post = instance.post
+    invalidation.bump_generations(
+        post_page_scopes(post, (post.group_id,))
+        + [(invalidation.SCOPE_POST, post.pk)]
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    # Счётчики подписчиков и подписок в шапках профилей обоих
+    invalidation.bump_generations([
+        (invalidation.SCOPE_AUTHOR, instance.author.username),
+        (invalidation.SCOPE_AUTHOR, instance.user.username),
+    ])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    scopes = [
+        (invalidation.SCOPE_GROUPS, None),
+        (invalidation.SCOPE_FEED, None),
+        (invalidation.SCOPE_GROUP, instance.slug),
+        (invalidation.SCOPE_GROUP, instance._loaded_slug),
+    ]
+    # Название подборки выводится в карточках её записей в профилях
+    authors = User.objects.filter(posts__group=instance).values_list(
+        'username', flat=True
+    ).distinct()
+    scopes += [(invalidation.SCOPE_AUTHOR, name) for name in authors]
+    invalidation.bump_generations(scopes)
+    instance._loaded_slug = instance.slug
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_pages(sender, instance, created, **kwargs):
+    """Смена имени или логина делает устаревшими страницы пользователя.
+
+    Карточки его записей меняют ключ сами (post_card_key), а страницы
+    лент, профиля, записей и комментариев - со сменой поколений.
+    Сохранение без смены имени (например, last_login при входе) ничего
+    не сдвигает.
+    """
+    names = user_names(instance)
+    loaded, instance._loaded_names = instance._loaded_names, names
+    if created or names == loaded:
+        return
+    scopes = [
+        (invalidation.SCOPE_FEED, None),
+        (invalidation.SCOPE_SUGGESTIONS, None),
+        (invalidation.SCOPE_AUTHOR, instance.username),
+    ]
+    if loaded[0]:
+        scopes.append((invalidation.SCOPE_AUTHOR, loaded[0]))
+    slugs = Group.objects.filter(posts__author=instance).values_list(
+        'slug', flat=True
+    ).distinct()
+    scopes += [(invalidation.SCOPE_GROUP, slug) for slug in slugs]
+    # Страницы записей с его комментариями: в комментариях - логин
+    commented = Comment.objects.filter(author=instance).values_list(
+        'post_id', 'post__author__username'
+    ).distinct()
+    for post_id, author in commented.iterator():
+        scopes += [(invalidation.SCOPE_POST, post_id),
+                   (invalidation.SCOPE_AUTHOR, author)]
+    invalidation.bump_generations(scopes)
+
+
+@receiver(post_save, sender=Post)
+def count_post_image(sender, instance, created, **kwargs):
+    image = file_name(instance.image)
+    if created:
+        StoredFile.acquire(image)
+    elif image != instance._loaded_image:
+        StoredFile.acquire(image)
+        StoredFile.release(instance._loaded_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_post_image(sender, instance, **kwargs):
+    StoredFile.release(file_name(instance.image))
+
+
+# Копии создаются bulk_create, их ссылки учитывает variants.build_variants
+@receiver(post_delete, sender=ImageVariant)
+def release_variant_image(sender, instance, **kwargs):
+    StoredFile.release(file_name(instance.image))
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, created, **kwargs):
+    if created or instance.text != instance._loaded_text:
+        search.index_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_saved_comment(sender, instance, **kwargs):
+    search.index_comments([(instance.pk, instance.post_id, instance.text)])
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_deleted_comment(sender, instance, **kwargs):
+    search.unindex_comment(instance.pk)
+
+
+# Подключается последним: до него обработчики post_save видят подборку,
+# картинку и текст записи на момент загрузки.
+@receiver(post_save, sender=Post)
+def remember_saved_post(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = file_name(instance.image)
+    instance._loaded_text = instance.text
@@ -0,0 +1,79 @@
+"""Хранилище файлов, адресуемых по содержимому.
+
+Имя файла - SHA-256 его содержимого: одинаковые картинки, загруженные
+в разные записи или повторно в ту же, ложатся в один файл, и копии для
+srcset (variants.py) делаются для него один раз. Хеш считается по ходу
+записи во временный файл рядом с MEDIA_ROOT, без второго прохода по
+содержимому. Общий файл нельзя удалять вместе с записью: на него
+ведётся счётчик ссылок (StoredFile), а неиспользуемые файлы удаляет
+команда collect_media.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+INCOMING_DIR = '.incoming'
+
+
+def content_name(name, digest):
+    """Имя файла по хешу: каталог upload_to/первые два знака/хеш.расш."""
+    directory = posixpath.dirname(name)
+    extension = posixpath.splitext(name)[1].lower()
+    return posixpath.join(directory, digest[:2], digest + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    # MEDIA_ROOT читается при каждом обращении, а не один раз, как у
+    # FileSystemStorage: хранилище создаётся при импорте моделей и
+    # иначе не заметит MEDIA_ROOT, заданный прямым присваиванием
+    # (без сигнала setting_changed), и писало бы в прежний каталог
+    @property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.MEDIA_ROOT)
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def get_available_name(self, name, max_length=None):
+        # Совпадение имён означает совпадение содержимого: файл не
+        # переименовывается, а используется повторно
+        return name
+
+    def _save(self, name, content):
+        incoming = self.path(INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=incoming)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(descriptor, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            name = content_name(name, digest.hexdigest())
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.remove(temp_path)
+                # Свежая дата изменения защищает файл от collect_media,
+                # пока новая ссылка на него ещё не сохранена
+                os.utime(full_path)
+                return name
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+content_storage = ContentAddressedStorage()
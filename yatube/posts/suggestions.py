@@ -0,0 +1,194 @@
+"""Кого читать: авторы, предложенные читателю для подписки.
+
+Предложения считает офлайн команда suggest_authors по всему графу
+подписок и подборкам записей. Оценка кандидата складывается из:
+
+- друзей друзей: FOF_WEIGHT за каждого автора читателя, подписанного
+  на кандидата;
+- общих подборок: GROUP_WEIGHT, умноженного на долю подборки в
+  интересах читателя (подборки его записей и записей его авторов)
+  и на вес кандидата в подборке (его записей в ней относительно
+  самого пишущего в неё автора);
+- популярности: POPULAR_WEIGHT, умноженного на долю подписчиков
+  кандидата от самого популярного автора. Она добирает предложения
+  новичкам, у которых нет ни подписок, ни записей.
+
+Сам читатель и авторы, на которых он подписан, не предлагаются.
+SUGGESTIONS_TOP лучших кандидатов каждого читателя ложатся в таблицу
+SuggestedAuthor, и страница получает их одним запросом по индексу.
+
+Граф держится в памяти процесса (array('I') на читателя, 4 байта на
+подписку: миллион подписок - около 4 МБ) и считается пулом процессов,
+которым он достаётся при fork без копирования и сериализации. Где fork
+нет, всё считается в одном процессе.
+"""
+import heapq
+import multiprocessing
+import os
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from . import follow_graph, invalidation
+from .models import Follow, Post, SuggestedAuthor, User, bulk_batch_size
+
+FOF_WEIGHT = 1.0
+GROUP_WEIGHT = 3.0
+POPULAR_WEIGHT = 0.5
+# Сколько подписок читателя и самых пишущих авторов подборки учитывать
+FRIENDS_LIMIT = 200
+GROUP_AUTHORS = 50
+POPULAR_AUTHORS = 100
+CHUNK_SIZE = 500
+BATCH_SIZE = 5000
+
+# Граф для процессов пула, см. compute()
+_graph = None
+
+
+class Graph:
+    """Подписки и подборки всех пользователей в памяти."""
+
+    def __init__(self):
+        self.following = defaultdict(lambda: array('I'))
+        follows = Follow.objects.order_by('user_id', 'author_id')
+        for user_id, author_id in follows.values_list(
+            'user_id', 'author_id'
+        ).iterator(chunk_size=BATCH_SIZE):
+            self.following[user_id].append(author_id)
+
+        # {автор: {подборка: записей}}, {подборка: [(автор, вес)]}
+        self.author_groups = defaultdict(dict)
+        group_counts = defaultdict(list)
+        rows = Post.objects.filter(group__isnull=False).order_by().values(
+            'author_id', 'group_id'
+        ).annotate(total=Count('pk')).values_list(
+            'author_id', 'group_id', 'total'
+        )
+        for author_id, group_id, total in rows.iterator():
+            self.author_groups[author_id][group_id] = total
+            group_counts[group_id].append((total, author_id))
+        self.group_authors = {}
+        for group_id, counts in group_counts.items():
+            top = heapq.nlargest(GROUP_AUTHORS, counts)
+            self.group_authors[group_id] = [
+                (author_id, total / top[0][0]) for total, author_id in top
+            ]
+
+        popular = Counter()
+        for authors in self.following.values():
+            popular.update(authors)
+        top = popular.most_common(POPULAR_AUTHORS)
+        self.popular = [(author_id, count / top[0][1])
+                        for author_id, count in top]
+
+    def interests(self, user_id, followed):
+        """{подборка: доля} в записях читателя и его авторов."""
+        groups = Counter(self.author_groups.get(user_id, {}))
+        for author_id in followed:
+            groups.update(self.author_groups.get(author_id, {}))
+        total = sum(groups.values())
+        return {group_id: count / total for group_id, count in groups.items()}
+
+    def scores(self, user_id):
+        """{кандидат: оценка} для читателя."""
+        followed = self.following.get(user_id, array('I'))
+        friends = Counter()
+        for author_id in followed[:FRIENDS_LIMIT]:
+            friends.update(self.following.get(author_id, ()))
+        scores = defaultdict(float)
+        for author_id, count in friends.items():
+            scores[author_id] += FOF_WEIGHT * count
+        for group_id, share in self.interests(user_id, followed).items():
+            for author_id, weight in self.group_authors[group_id]:
+                scores[author_id] += GROUP_WEIGHT * share * weight
+        for author_id, weight in self.popular:
+            scores[author_id] += POPULAR_WEIGHT * weight
+        scores.pop(user_id, None)
+        for author_id in followed:
+            scores.pop(author_id, None)
+        return scores
+
+    def top(self, user_id, limit):
+        """[(кандидат, оценка)] от лучшего, при равенстве - по id."""
+        return heapq.nsmallest(
+            limit, self.scores(user_id).items(),
+            key=lambda item: (-item[1], item[0])
+        )
+
+
+def score_chunk(args):
+    user_ids, limit = args
+    return [(user_id, _graph.top(user_id, limit)) for user_id in user_ids]
+
+
+def compute(user_ids, limit, workers=None):
+    """Предложения для читателей: итератор (читатель, [(автор, оценка)])."""
+    global _graph
+    _graph = Graph()
+    chunks = [(user_ids[start:start + CHUNK_SIZE], limit)
+              for start in range(0, len(user_ids), CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if (workers == 1 or len(chunks) < 2
+            or 'fork' not in multiprocessing.get_all_start_methods()):
+        for chunk in chunks:
+            yield from score_chunk(chunk)
+        return
+    context = multiprocessing.get_context('fork')
+    with context.Pool(min(workers, len(chunks))) as pool:
+        for results in pool.imap_unordered(score_chunk, chunks):
+            yield from results
+
+
+def rebuild(limit=None, workers=None):
+    """Пересчитать таблицу SuggestedAuthor. return - число строк.
+
+    Таблица заменяется одной короткой транзакцией после расчёта, а не
+    во время него: SQLite не держит блокировку записи минутами.
+    """
+    limit = limit or settings.SUGGESTIONS_TOP
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    rows = [
+        (user_id, author_id, score, rank)
+        for user_id, top in compute(user_ids, limit, workers)
+        for rank, (author_id, score) in enumerate(top, 1)
+    ]
+    batch_size = bulk_batch_size(SuggestedAuthor, BATCH_SIZE)
+    with transaction.atomic():
+        SuggestedAuthor.objects.all().delete()
+        for start in range(0, len(rows), batch_size):
+            SuggestedAuthor.objects.bulk_create(
+                SuggestedAuthor(user_id=user_id, author_id=author_id,
+                                score=score, rank=rank)
+                for user_id, author_id, score, rank
+                in rows[start:start + batch_size]
+            )
+    invalidation.bump_generations([(invalidation.SCOPE_SUGGESTIONS, None)])
+    return len(rows)
+
+
+def suggested_authors(user, exclude=()):
+    """До SUGGESTIONS_SHOWN предложенных читателю авторов.
+
+    Один запрос к таблице; авторов, на которых читатель подписался
+    после пересчёта, отсеивает граф подписок в кеше.
+    """
+    if not user.is_authenticated:
+        return []
+    suggestions = SuggestedAuthor.objects.filter(user=user).select_related(
+        'author'
+    ).order_by('rank')[:settings.SUGGESTIONS_TOP]
+    followed = follow_graph.following(user.pk)
+    authors = []
+    for suggestion in suggestions:
+        author = suggestion.author
+        if (author.pk in exclude
+                or follow_graph.contains(followed, author.pk)):
+            continue
+        authors.append(author)
+        if len(authors) == settings.SUGGESTIONS_SHOWN:
+            break
+    return authors
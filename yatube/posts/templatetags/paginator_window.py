@@ -0,0 +1,32 @@
+from django import template
+from django.conf import settings
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page):
+    """Номера страниц не дальше PAGINATOR_PAGE_WINDOW от текущей.
+
+    Заменяет в шаблоне полный page_range, чтобы на длинных лентах
+    не выводить ссылку на каждую страницу.
+    """
+    width = settings.PAGINATOR_PAGE_WINDOW
+    first = max(page.number - width, 1)
+    last = min(page.number + width, page.paginator.num_pages)
+    return range(first, last + 1)
+
+
+@register.simple_tag(takes_context=True)
+def page_url(context, **params):
+    """Ссылка на другую страницу с сохранением остальных GET-параметров.
+
+    Нужна страницам с параметрами помимо номера страницы, например
+    поисковому запросу q.
+    """
+    query = context['request'].GET.copy()
+    for name in ('page', 'cursor'):
+        query.pop(name, None)
+    for name, value in params.items():
+        query[name] = value
+    return f'?{query.urlencode()}'
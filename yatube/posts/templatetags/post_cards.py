@@ -0,0 +1,37 @@
+from django import template
+
+from posts import thumbnails, variants
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_card_key(context, post, addcomment_button=False):
+    """Ключ кеша карточки записи.
+
+    Карточка зависит от версии записи (post.updated), логина автора
+    (он выводится в карточке и меняется без правки записи) и от того,
+    смотрит ли её автор (кнопка "Редактировать"), но не от страницы
+    ленты, поэтому одна и та же отрисовка годится для всех лент.
+    """
+    user = context.get('user')
+    is_author = getattr(user, 'pk', None) == post.author_id
+    return (f'{post.pk}:{post.updated.timestamp()}:{post.author.username}:'
+            f'{int(is_author)}:{int(bool(addcomment_button))}')
+
+
+@register.simple_tag
+def card_picture(post):
+    """Данные для <picture> картинки записи или None.
+
+    Недостающие копии картинки ставятся в очередь фоновой генерации,
+    а карточка пока выводит прежнюю миниатюру sorl-thumbnail, если она
+    есть, или заглушку.
+    """
+    picture = variants.picture(post)
+    if picture is None and post.image:
+        thumbnails.schedule(post)
+        thumbnail = thumbnails.card_thumbnail(post.image)
+        if thumbnail is not None:
+            picture = {'sources': [], 'src': thumbnail.url}
+    return picture
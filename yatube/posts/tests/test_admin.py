@@ -0,0 +1,128 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.admin import LatestInline
+from posts.models import Comment, Group, Post
+from posts.paginators import EstimatedCountPaginator
+
+User = get_user_model()
+
+
+class AdminTests(TestCase):
+    """Проверка админки на больших таблицах.
+
+    - список записей не делает запросов на каждую строку
+    - без фильтров число строк оценивается, а не считается
+    - текст записей ищется по поисковому индексу
+    - на странице подборки выводятся только последние записи
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin_user', email='admin@example.com',
+            password='admin_password'
+        )
+        cls.author = User.objects.create(username='admin_author')
+        cls.group = Group.objects.create(title='Подборка', slug='admin-group')
+
+    def setUp(self):
+        self.admin_client = Client()
+        self.admin_client.force_login(AdminTests.admin)
+
+    def create_posts(self, count, text='Запись'):
+        return [
+            Post.objects.create(text=f'{text} {number}',
+                                author=AdminTests.author,
+                                group=AdminTests.group)
+            for number in range(count)
+        ]
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.admin_client.get(
+                reverse('admin:posts_post_changelist'), params
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow(self):
+        """Проверка, что автор и подборка строк выбираются одним JOIN."""
+        self.create_posts(2)
+        few = self.changelist_queries()
+        self.create_posts(8)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_unfiltered_count_is_estimated(self):
+        """Проверка оценки числа строк без COUNT(*)."""
+        posts = self.create_posts(5)
+        posts[2].delete()
+        paginator = EstimatedCountPaginator(Post.objects.all(), 10)
+        with mock.patch.object(EstimatedCountPaginator, 'ESTIMATE_FROM', 0):
+            # Разброс rowid учитывает и удалённую строку
+            self.assertEqual(paginator.count, 5)
+            filtered = EstimatedCountPaginator(
+                Post.objects.filter(author=AdminTests.author), 10
+            )
+            self.assertEqual(filtered.count, 4)
+        self.assertEqual(
+            EstimatedCountPaginator(Post.objects.all(), 10).count, 4
+        )
+
+    def test_search_uses_index(self):
+        """Проверка поиска по словоформам и по имени автора."""
+        post = Post.objects.create(text='Кошки гуляют по крыше',
+                                   author=AdminTests.author)
+        other = Post.objects.create(text='Собака', author=AdminTests.admin)
+        Comment.objects.create(text='Видел кошку', author=AdminTests.admin,
+                               post=other)
+        url = reverse('admin:posts_post_changelist')
+        cases = (
+            ('кошка', {post, other}),
+            ('гулять кошки', {post}),
+            ('admin_author', {post}),
+        )
+        for query, expected in cases:
+            with self.subTest(query=query):
+                response = self.admin_client.get(url, {'q': query})
+                self.assertEqual(
+                    set(response.context['cl'].result_list), expected
+                )
+
+    def test_group_inline_is_limited(self):
+        """Проверка, что подборка показывает только последние записи."""
+        posts = self.create_posts(4)
+        with mock.patch.object(LatestInline, 'limit', 2):
+            response = self.admin_client.get(reverse(
+                'admin:posts_group_change', args=(AdminTests.group.pk,)
+            ))
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual([form.instance for form in formset.forms],
+                         [posts[3], posts[2]])
+        self.assertContains(
+            response, f'?group__id__exact={AdminTests.group.pk}'
+        )
+
+    def test_pages_render(self):
+        """Проверка списков и форм с полями автодополнения."""
+        post = self.create_posts(1)[0]
+        Comment.objects.create(text='Комментарий', author=AdminTests.author,
+                               post=post)
+        names = ('admin:posts_post_changelist', 'admin:posts_post_add',
+                 'admin:posts_comment_changelist', 'admin:posts_comment_add',
+                 'admin:posts_follow_changelist', 'admin:posts_follow_add')
+        for name in names:
+            with self.subTest(name=name):
+                response = self.admin_client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+        response = self.admin_client.get(
+            reverse('admin:posts_post_change', args=(post.pk,))
+        )
+        self.assertContains(response, 'Комментарий')
+        self.assertContains(response, f'?post__id__exact={post.pk}')
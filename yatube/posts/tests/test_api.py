@@ -0,0 +1,155 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(PAGINATOR_DEFAULT_SIZE=2)
+class ApiTests(TestCase):
+    """Проверка JSON API.
+
+    - ленты и комментарии листаются курсором
+    - ответы несут ETag, повтор запроса получает 304
+    - правка записи и комментарии меняют ETag
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='api_author')
+        cls.reader = User.objects.create(username='api_reader')
+        cls.group = Group.objects.create(
+            title='API', slug='api-group', description='API'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_reader = Client()
+        self.authorized_reader.force_login(ApiTests.reader)
+
+    def create_posts(self, count, **kwargs):
+        return [
+            Post.objects.create(text=f'Запись {number}',
+                                author=ApiTests.author, **kwargs)
+            for number in range(count)
+        ]
+
+    def walk(self, client, url):
+        """id всех объектов ленты, пройденной по ссылкам next."""
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            data = response.json()
+            ids += [item['id'] for item in data['results']]
+            url = data['next']
+        return ids
+
+    def test_feeds(self):
+        """Проверка лент: состав, порядок и поля записей."""
+        posts = self.create_posts(3, group=ApiTests.group)
+        other = Post.objects.create(text='Чужая', author=ApiTests.reader)
+        newest_first = [post.pk for post in reversed(posts)]
+        cases = (
+            (reverse('api:index'), [other.pk] + newest_first),
+            (reverse('api:group', args=(ApiTests.group.slug,)),
+             newest_first),
+            (reverse('api:profile', args=(ApiTests.author.username,)),
+             newest_first),
+        )
+        for url, expected in cases:
+            with self.subTest(url=url):
+                self.assertEqual(self.walk(self.guest_client, url), expected)
+
+        item = self.guest_client.get(reverse('api:index')).json()[
+            'results'
+        ][1]
+        self.assertEqual(item['text'], 'Запись 2')
+        self.assertEqual(item['author'], ApiTests.author.username)
+        self.assertEqual(item['group'], ApiTests.group.slug)
+        self.assertIsNone(item['image'])
+
+        response = self.guest_client.get(
+            reverse('api:group', args=('missing',))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_follow_feed(self):
+        """Проверка ленты подписок: только для вошедших."""
+        posts = self.create_posts(2)
+        Post.objects.create(text='Своя', author=ApiTests.reader)
+        url = reverse('api:follow_index')
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+        self.assertEqual(self.walk(self.authorized_reader, url), [])
+        Follow.objects.create(user=ApiTests.reader, author=ApiTests.author)
+        self.assertEqual(self.walk(self.authorized_reader, url),
+                         [posts[1].pk, posts[0].pk])
+
+    def test_post_and_comments(self):
+        """Проверка записи и её комментариев от старых к новым."""
+        post = self.create_posts(1)[0]
+        comments = [
+            Comment.objects.create(text=f'Комментарий {number}',
+                                   author=ApiTests.reader, post=post)
+            for number in range(3)
+        ]
+        data = self.guest_client.get(reverse('api:post', args=(post.pk,)))
+        self.assertEqual(data.json()['comments_count'], 3)
+        self.assertEqual(
+            self.walk(self.guest_client,
+                      reverse('api:comments', args=(post.pk,))),
+            [comment.pk for comment in comments]
+        )
+        for name in ('api:post', 'api:comments'):
+            with self.subTest(name=name):
+                response = self.guest_client.get(reverse(name, args=(0,)))
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_conditional_get(self):
+        """Проверка 304 и смены ETag после изменений ленты."""
+        post = self.create_posts(1)[0]
+        url = reverse('api:index')
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        # Дата самой новой записи не меняется при правке и удалении
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        # Ответ 304 не выбирает ленту: поколения областей - в кеше
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+        post.text = 'Исправленная запись'
+        post.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response['ETag']
+
+        Comment.objects.create(text='Новый', author=ApiTests.reader,
+                               post=post)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+        post_url = reverse('api:post', args=(post.pk,))
+        etag = self.guest_client.get(post_url)['ETag']
+        response = self.guest_client.get(post_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+        # Комментарии датируются записью: её updated меняет и удаление
+        # комментария
+        post.refresh_from_db()
+        response = self.guest_client.get(
+            reverse('api:comments', args=(post.pk,))
+        )
+        self.assertEqual(response['Last-Modified'],
+                         http_date(post.updated.timestamp()))
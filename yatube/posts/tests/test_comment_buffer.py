@@ -0,0 +1,183 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import checks, comment_buffer, search
+from posts.models import Comment, Post
+
+User = get_user_model()
+JOURNAL_DIR = tempfile.mkdtemp()
+
+
+@override_settings(COMMENT_BUFFER_DURABILITY=comment_buffer.MEMORY,
+                   COMMENT_BUFFER_INTERVAL=0, COMMENT_BUFFER_SIZE=3,
+                   COMMENT_BUFFER_JOURNAL_DIR=JOURNAL_DIR)
+class CommentBufferTests(TestCase):
+    """Проверка отложенной записи комментариев.
+
+    - комментарий ждёт в очереди и виден до записи только автору
+    - очередь записывается пачкой со счётчиками и поисковым индексом
+    - время создания комментария - время постановки в очередь
+    - журнал завершившегося процесса дописывается командой, уже
+      записанные комментарии повторно не вставляются
+    - без fcntl журнал не ведётся, check выдаёт posts.W002
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='buffer_author')
+        cls.reader = User.objects.create(username='buffer_reader')
+        cls.post = Post.objects.create(text='Запись', author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(JOURNAL_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(CommentBufferTests.reader)
+        post = CommentBufferTests.post
+        self.post_url = reverse('post', args=(post.author.username,
+                                              post.pk))
+        self.comment_url = reverse('add_comment',
+                                   args=(post.author.username, post.pk))
+
+    def tearDown(self):
+        comment_buffer.buffer.items.clear()
+
+    def comment(self, text):
+        return self.client.post(self.comment_url, {'text': text})
+
+    def test_pending_comment_is_seen_by_its_author(self):
+        response = self.comment('Ещё в очереди')
+        self.assertRedirects(response, f'{self.post_url}#pending-comments')
+        self.assertFalse(Comment.objects.exists())
+        self.assertContains(self.client.get(self.post_url), 'Ещё в очереди')
+
+        other = Client()
+        other.force_login(CommentBufferTests.author)
+        self.assertNotContains(other.get(self.post_url), 'Ещё в очереди')
+
+    def test_pending_comment_changes_etag(self):
+        etag = self.client.get(self.post_url)['ETag']
+        self.comment('Новый')
+        response = self.client.get(self.post_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый')
+
+    def test_pending_comments_do_not_overwrite_each_other(self):
+        post = CommentBufferTests.post
+        reader = CommentBufferTests.reader
+        # Оба запроса прочитали кеш до того, как другой в него записал
+        with mock.patch.object(comment_buffer.cache, 'get',
+                               return_value=[]):
+            comment_buffer.buffer.add(post, reader, 'Первый')
+            comment_buffer.buffer.add(post, reader, 'Второй')
+        self.assertEqual(
+            [comment.text for comment in
+             comment_buffer.pending_comments(reader, post)],
+            ['Первый', 'Второй']
+        )
+
+    def test_full_queue_is_written_in_one_batch(self):
+        self.comment('Первый')
+        self.comment('Второй')
+        self.assertFalse(Comment.objects.exists())
+        self.comment('Третий поиск')
+
+        post = Post.objects.get(pk=CommentBufferTests.post.pk)
+        self.assertEqual(post.comments_count, 3)
+        self.assertEqual(
+            list(post.comments.order_by('pk').values_list('text', flat=True)),
+            ['Первый', 'Второй', 'Третий поиск']
+        )
+        self.assertEqual(comment_buffer.pending_comments(
+            CommentBufferTests.reader, post
+        ), [])
+        response = self.client.get(self.post_url)
+        self.assertNotContains(response, 'pending-comments')
+        self.assertIn(post, search.search('поиск')[:10])
+
+    def test_comment_keeps_queued_time(self):
+        item = comment_buffer.buffer.add(
+            CommentBufferTests.post, CommentBufferTests.reader, 'Ранний'
+        )
+        with mock.patch('django.utils.timezone.now',
+                        return_value=item['created'] + timedelta(hours=1)):
+            comment_buffer.buffer.flush()
+        self.assertEqual(Comment.objects.get().created, item['created'])
+
+    def test_comments_to_deleted_post_are_dropped(self):
+        post = Post.objects.create(text='Удалят', author=self.author)
+        comment_buffer.buffer.add(post, CommentBufferTests.reader, 'Пропадёт')
+        post.delete()
+        self.assertEqual(comment_buffer.buffer.flush(), 0)
+        self.assertEqual(comment_buffer.buffer.items, [])
+
+    @override_settings(COMMENT_BUFFER_DURABILITY=comment_buffer.JOURNAL)
+    def test_journal_of_finished_process_is_replayed(self):
+        crashed = comment_buffer.CommentBuffer()
+        crashed.add(CommentBufferTests.post, CommentBufferTests.reader,
+                    'Из журнала')
+        # Процесс упал: очередь пропала, журнал остался
+        crashed.journal.close()
+
+        out = StringIO()
+        call_command('flush_comments', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)),
+            ['Из журнала']
+        )
+        call_command('flush_comments', stdout=StringIO())
+        self.assertEqual(Comment.objects.count(), 1)
+
+    @override_settings(COMMENT_BUFFER_DURABILITY=comment_buffer.JOURNAL)
+    def test_journal_is_cleared_after_flush(self):
+        buffer = comment_buffer.CommentBuffer()
+        buffer.add(CommentBufferTests.post, CommentBufferTests.reader,
+                   'Записан')
+        buffer.flush()
+        buffer.journal.seek(0)
+        self.assertEqual(buffer.journal.read(), '')
+        buffer.journal.close()
+        call_command('flush_comments', stdout=StringIO())
+        self.assertEqual(Comment.objects.count(), 1)
+
+    @override_settings(COMMENT_BUFFER_DURABILITY=comment_buffer.JOURNAL)
+    def test_journal_disabled_without_fcntl(self):
+        self.assertEqual(checks.check_comment_journal(None), [])
+        with mock.patch.object(comment_buffer, 'fcntl', None):
+            self.assertEqual(
+                [error.id for error in checks.check_comment_journal(None)],
+                ['posts.W002']
+            )
+            buffer = comment_buffer.CommentBuffer()
+            buffer.add(CommentBufferTests.post, CommentBufferTests.reader,
+                       'Без журнала')
+            self.assertIsNone(buffer.journal)
+            self.assertEqual(comment_buffer.replay_journals(), 0)
+
+    @override_settings(COMMENT_BUFFER_DURABILITY=comment_buffer.JOURNAL)
+    def test_saved_batch_is_not_replayed_twice(self):
+        crashed = comment_buffer.CommentBuffer()
+        crashed.add(CommentBufferTests.post, CommentBufferTests.reader,
+                    'Один раз')
+        # Пачка записана, а журнал очистить не успели
+        comment_buffer.save_comments(crashed.items)
+        crashed.journal.close()
+        call_command('flush_comments', stdout=StringIO())
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)),
+            ['Один раз']
+        )
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from yatube import database
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    """Проверка настроек БД из переменных окружения.
+
+    - без переменных - прежний файл SQLite, соединения живут минуту
+    - профиль tuned выполняет PRAGMA в каждом новом соединении
+    - профиль PostgreSQL и ошибки в значениях
+    """
+
+    def settings_from(self, **environ):
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return database.from_env('/project')
+
+    def test_defaults(self):
+        db = self.settings_from()
+        self.assertEqual(db['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(db['NAME'], '/project/db.sqlite3')
+        self.assertEqual(db['CONN_MAX_AGE'], 60)
+        self.assertEqual(db['PRAGMAS'], {})
+        self.assertIsNone(
+            self.settings_from(YATUBE_DB_CONN_MAX_AGE='none')['CONN_MAX_AGE']
+        )
+
+    def test_postgresql(self):
+        db = self.settings_from(YATUBE_DB_ENGINE='postgresql',
+                                YATUBE_DB_HOST='db', YATUBE_DB_NAME='test',
+                                YATUBE_DB_CONN_MAX_AGE='0')
+        self.assertEqual(db['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((db['HOST'], db['NAME'], db['CONN_MAX_AGE']),
+                         ('db', 'test', 0))
+
+    def test_invalid_values(self):
+        for environ in ({'YATUBE_DB_ENGINE': 'oracle'},
+                        {'YATUBE_SQLITE_PROFILE': 'fast'},
+                        {'YATUBE_DB_CONN_MAX_AGE': 'час'},
+                        {'YATUBE_SQLITE_PROFILE': 'tuned',
+                         'YATUBE_SQLITE_MMAP_SIZE': '256M'}):
+            with self.subTest(environ=environ):
+                with self.assertRaises(ImproperlyConfigured):
+                    self.settings_from(**environ)
+
+    def test_tuned_profile_pragmas(self):
+        pragmas = self.settings_from(
+            YATUBE_SQLITE_PROFILE='tuned', YATUBE_SQLITE_BUSY_TIMEOUT='1234'
+        )['PRAGMAS']
+        with tempfile.TemporaryDirectory() as directory:
+            # Обычное соединение sqlite3: тесту без БД Django её не даёт
+            db = sqlite3.connect(os.path.join(directory, 'tuned.sqlite3'))
+            try:
+                cursor = db.cursor()
+                database.execute_pragmas(cursor, pragmas)
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 1234)
+                cursor.execute('PRAGMA synchronous')
+                self.assertEqual(cursor.fetchone()[0], 1)
+            finally:
+                db.close()
@@ -0,0 +1,110 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import follow_graph
+from posts.models import Follow
+
+User = get_user_model()
+
+
+class FollowGraphTests(TestCase):
+    """Проверка графа подписок в кеше.
+
+    - массивы загружаются при первом обращении и без запросов потом
+    - подписка и отписка сразу видны
+    - знакомые ранжируются по числу общих подписок
+    - расхождение с таблицей находит и исправляет check_follow_graph
+    - устаревший массив не мешает подписаться и отписаться
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [User.objects.create(username=f'graph_{i}')
+                     for i in range(5)]
+
+    def setUp(self):
+        cache.clear()
+
+    def follow(self, user, author):
+        return Follow.objects.create(user=self.users[user],
+                                     author=self.users[author])
+
+    def pk(self, index):
+        return self.users[index].pk
+
+    def test_sets_are_cached_and_updated(self):
+        self.follow(0, 1)
+        self.assertTrue(follow_graph.is_following(self.pk(0), self.pk(1)))
+        with self.assertNumQueries(0):
+            self.assertFalse(
+                follow_graph.is_following(self.pk(0), self.pk(2))
+            )
+            self.assertEqual(follow_graph.following_count(self.pk(0)), 1)
+
+        follow = self.follow(0, 2)
+        self.assertTrue(follow_graph.is_following(self.pk(0), self.pk(2)))
+        self.assertEqual(list(follow_graph.followers(self.pk(2))),
+                         [self.pk(0)])
+        follow.delete()
+        self.assertFalse(follow_graph.is_following(self.pk(0), self.pk(2)))
+        self.assertEqual(follow_graph.followers_count(self.pk(2)), 0)
+
+    def test_people_you_may_know(self):
+        self.follow(0, 1)
+        self.follow(0, 2)
+        self.follow(1, 3)
+        self.follow(2, 3)
+        self.follow(2, 4)
+        self.follow(1, 0)
+        self.assertEqual(follow_graph.people_you_may_know(self.pk(0)),
+                         [self.pk(3), self.pk(4)])
+        self.assertEqual(follow_graph.common_following(self.pk(1),
+                                                       self.pk(2)),
+                         [self.pk(3)])
+
+    def test_check_finds_stale_sets(self):
+        follow_graph.following(self.pk(0))
+        follow_graph.followers(self.pk(1))
+        # В обход сигналов
+        Follow.objects.bulk_create([Follow(user=self.users[0],
+                                           author=self.users[1])])
+        self.assertEqual(
+            sorted(follow_graph.check()),
+            [(follow_graph.FOLLOWERS, self.pk(1)),
+             (follow_graph.FOLLOWING, self.pk(0))]
+        )
+        out = StringIO()
+        call_command('check_follow_graph', fix=True, stdout=out)
+        self.assertIn('2', out.getvalue())
+        self.assertTrue(follow_graph.is_following(self.pk(0), self.pk(1)))
+        self.assertEqual(follow_graph.check(), [])
+
+    def test_stale_sets_do_not_block_follow_views(self):
+        client = Client()
+        client.force_login(self.users[0])
+        author = self.users[1].username
+        # Массив загружен до подписки в обход сигналов
+        follow_graph.following(self.pk(0))
+        Follow.objects.bulk_create([Follow(user=self.users[0],
+                                           author=self.users[1])])
+        client.get(reverse('profile_unfollow', args=(author,)))
+        self.assertFalse(Follow.objects.exists())
+
+        follow_graph.following(self.pk(0))
+        Follow.objects.bulk_create([Follow(user=self.users[0],
+                                           author=self.users[1])])
+        # Подписка есть, кеш о ней не знает: представление его поправит
+        client.get(reverse('profile_follow', args=(author,)))
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertTrue(follow_graph.is_following(self.pk(0), self.pk(1)))
+
+        follow_graph.following(self.pk(0))
+        Follow.objects.all().delete()
+        client.get(reverse('profile_follow', args=(author,)))
+        self.assertTrue(Follow.objects.exists())
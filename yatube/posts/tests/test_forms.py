@@ -1,17 +1,24 @@
+import io
 import shutil
 import tempfile
 
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from PIL import Image
+
+from posts.forms import PostForm
 from posts.models import Group, Post
 
 User = get_user_model()
 
 
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class TestCreateEditPostForm(TestCase):
     """Проверка работы формы PostForm для создания поста."""
 
@@ -27,11 +34,10 @@ class TestCreateEditPostForm(TestCase):
             description='Description of test group',
             slug='slug_for_form'
         )
-        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
     @classmethod
     def tearDownClass(cls):
-        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
         super().tearDownClass()
 
     def setUp(self):
@@ -235,3 +241,67 @@ class TestCreateEditPostForm(TestCase):
             edited_post.author, TestCreateEditPostForm.user_author
         )
         self.assertEqual(len(edited_post.image), len(form_data['image']))
+
+
+@override_settings(UPLOAD_IMAGE_MAX_SIDE=32, UPLOAD_IMAGE_MAX_PIXELS=4096)
+class TestPostFormImageUpload(TestCase):
+    """Проверка приёма картинки формой PostForm.
+
+    - картинка сверх предела разрешения отклоняется
+    - большая картинка уменьшается до UPLOAD_IMAGE_MAX_SIDE
+    - EXIF удаляется, а кадр поворачивается по тегу Orientation
+    - небольшая картинка без метаданных сохраняется как есть
+    """
+
+    def get_form(self, content, name='photo.jpg'):
+        uploaded = SimpleUploadedFile(
+            name=name, content=content, content_type='image/jpeg'
+        )
+        return PostForm(data={'text': 'upload_text'},
+                        files={'image': uploaded})
+
+    def make_image(self, size, format_='JPEG', **params):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (10, 200, 30)).save(buffer, format_, **params)
+        return buffer.getvalue()
+
+    def open_cleaned(self, form):
+        self.assertTrue(form.is_valid(), form.errors)
+        return Image.open(form.cleaned_data['image'])
+
+    def test_decompression_bomb_rejected(self):
+        """Проверка отказа по разрешению из заголовка."""
+        form = self.get_form(self.make_image((100, 50)))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'image_too_large')
+
+    def test_large_image_downscaled(self):
+        """Проверка уменьшения большой стороны до предела."""
+        with override_settings(UPLOAD_IMAGE_MAX_PIXELS=10_000):
+            form = self.get_form(self.make_image((100, 50), 'PNG'),
+                                 name='photo.png')
+            image = self.open_cleaned(form)
+        self.assertEqual(image.size, (32, 16))
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(form.cleaned_data['image'].name, 'photo.jpg')
+
+    def test_exif_stripped_and_applied(self):
+        """Проверка удаления EXIF и поворота по Orientation."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        form = self.get_form(
+            self.make_image((20, 10), exif=exif.tobytes())
+        )
+        image = self.open_cleaned(form)
+        self.assertEqual(image.size, (10, 20))
+        self.assertNotIn('exif', image.info)
+
+    def test_small_clean_image_kept(self):
+        """Проверка, что картинка без метаданных не перекодируется."""
+        content = self.make_image((20, 10))
+        form = self.get_form(content)
+        self.assertTrue(form.is_valid(), form.errors)
+        uploaded = form.cleaned_data['image']
+        uploaded.seek(0)
+        self.assertEqual(uploaded.read(), content)
@@ -0,0 +1,144 @@
+from http import HTTPStatus
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import checks, metrics
+from posts.models import Post
+
+User = get_user_model()
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0)
+class MetricsTests(TestCase):
+    """Проверка замеров запросов.
+
+    - SQL-запросы, шаблоны и кеш считаются по имени URL
+    - медленные запросы пишутся в журнал и хранятся в сводке
+    - чтения кеша внутри шаблонов ({% cache %}) тоже считаются
+    - сводка доступна персоналу и команде metrics
+    - без DEBUG локальный кеш вызывает предупреждение posts.W001
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='metrics_author')
+        cls.staff = User.objects.create(username='metrics_staff',
+                                        is_staff=True)
+        Post.objects.create(text='Запись', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.guest_client = Client()
+
+    def stats(self):
+        return metrics.collect()['views']
+
+    def test_request_is_measured(self):
+        """Проверка счётчиков страницы и попадания в кеш страниц."""
+        url = reverse('profile', args=(MetricsTests.author.username,))
+        self.guest_client.get(url)
+        first = self.stats()['profile']
+        self.assertEqual(first['requests'], 1)
+        self.assertGreater(first['queries'], 0)
+        self.assertGreater(first['template_ms'], 0)
+        self.assertGreater(first['cache_misses'], 0)
+
+        # Повтор отдаётся из кеша страниц: без шаблона, с попаданием
+        self.guest_client.get(url)
+        second = self.stats()['profile']
+        self.assertEqual(second['requests'], 2)
+        self.assertEqual(second['template_ms'], first['template_ms'])
+        self.assertGreater(second['cache_hits'], first['cache_hits'])
+        self.assertEqual(sum(second['histogram']), 2)
+
+    def test_card_cache_is_counted(self):
+        """Проверка, что чтения кеша карточек из шаблона учитываются."""
+        Post.objects.bulk_create(
+            Post(text=f'Карточка {number}', author=MetricsTests.author)
+            for number in range(9)
+        )
+        cards = Post.objects.count()
+        client = Client()
+        client.force_login(MetricsTests.author)
+        client.get(reverse('index'))
+        first = self.stats()['index']
+        self.assertGreaterEqual(first['cache_misses'], cards)
+
+        client.get(reverse('index'))
+        second = self.stats()['index']
+        self.assertGreaterEqual(second['cache_hits'] - first['cache_hits'],
+                                cards)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling_off(self):
+        self.guest_client.get(reverse('index'))
+        self.assertEqual(self.stats(), {})
+
+    @override_settings(METRICS_SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged(self):
+        with self.assertLogs('posts.metrics', 'WARNING') as logs:
+            self.guest_client.get(reverse('index'))
+        self.assertIn('index', logs.output[0])
+        slowest = metrics.collect()['slowest']
+        self.assertTrue(slowest)
+        self.assertEqual({view for _, _, view in slowest}, {'index'})
+
+    def test_summary_for_staff(self):
+        """Проверка доступа к сводке и вывода команды."""
+        self.guest_client.get(reverse('index'))
+        url = reverse('api:metrics')
+        self.assertEqual(self.guest_client.get(url).status_code,
+                         HTTPStatus.UNAUTHORIZED)
+        client = Client()
+        client.force_login(MetricsTests.author)
+        self.assertEqual(client.get(url).status_code, HTTPStatus.FORBIDDEN)
+
+        client.force_login(MetricsTests.staff)
+        response = client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        views = {row['view'] for row in response.json()['views']}
+        self.assertIn('index', views)
+
+        out = StringIO()
+        call_command('metrics', stdout=out)
+        self.assertIn('api:metrics', out.getvalue())
+        call_command('metrics', reset=True, stdout=StringIO())
+        self.assertEqual(self.stats(), {})
+
+    def test_cached_default_is_a_hit(self):
+        """Проверка, что None в кеше - попадание, а не промах."""
+        metrics.install()
+        sample = metrics.RequestSample()
+        metrics._local.sample = sample
+        try:
+            cache.set_many({'metrics:none': None, 'metrics:value': 1})
+            self.assertIsNone(cache.get('metrics:none'))
+            self.assertEqual(cache.get('metrics:missing', 'нет'), 'нет')
+            cache.get_many(['metrics:value', 'metrics:missing'])
+        finally:
+            metrics._local.sample = None
+        self.assertEqual((sample.cache_hits, sample.cache_misses), (2, 2))
+
+    def test_local_cache_warning(self):
+        locmem = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }}
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'
+        }}
+        with override_settings(DEBUG=True, CACHES=locmem):
+            self.assertEqual(checks.check_shared_cache(None), [])
+        with override_settings(DEBUG=False, CACHES=shared):
+            self.assertEqual(checks.check_shared_cache(None), [])
+        with override_settings(DEBUG=False, CACHES=locmem):
+            self.assertEqual(
+                [error.id for error in checks.check_shared_cache(None)],
+                ['posts.W001']
+            )
@@ -1,7 +1,14 @@
+from contextlib import nullcontext
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
 
-from posts.models import Comment, Follow, Group, Post
+from posts.management.commands import explain_feeds
+from posts.models import Comment, Follow, Group, Post, UserCounters
 
 User = get_user_model()
 
@@ -52,3 +59,107 @@ class ModelsStrTests(TestCase):
         for model_name, str_value in ModelsStrTests.test_model_response:
             with self.subTest(model_name=model_name):
                 self.assertEqual(str(model_name), str_value)
+
+
+class CountersTests(TestCase):
+    """Проверка денормализованных счётчиков записей, подписок, комментариев."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='CountedAuthor')
+        cls.reader = User.objects.create_user(username='CountedReader')
+
+    def counters(self, user):
+        counters = UserCounters.objects.get(user=user)
+        return (counters.posts_count, counters.followers_count,
+                counters.following_count)
+
+    def test_counters_follow_changes(self):
+        """Проверка, что счётчики меняются вместе с таблицами."""
+        author = CountersTests.author
+        reader = CountersTests.reader
+        self.assertEqual(self.counters(author), (0, 0, 0))
+
+        post = Post.objects.create(text='Counted post', author=author)
+        follow = Follow.objects.create(user=reader, author=author)
+        comment = Comment.objects.create(
+            post=post, author=reader, text='Counted comment'
+        )
+        self.assertEqual(self.counters(author), (1, 1, 0))
+        self.assertEqual(self.counters(reader), (0, 0, 1))
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.delete()
+        self.assertEqual(self.counters(author), (0, 0, 0))
+        self.assertEqual(self.counters(reader), (0, 0, 0))
+
+    def test_rebuild_counters_command(self):
+        """Проверка, что команда находит и исправляет расхождения."""
+        post = Post.objects.create(
+            text='Counted post', author=CountersTests.author
+        )
+        Comment.objects.create(
+            post=post, author=CountersTests.reader, text='Counted comment'
+        )
+        Post.objects.update(comments_count=5)
+        UserCounters.objects.filter(user=CountersTests.reader).delete()
+        UserCounters.objects.filter(user=CountersTests.author).update(
+            posts_count=0
+        )
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', check=True, stdout=StringIO())
+        call_command('rebuild_counters', stdout=StringIO())
+        call_command('rebuild_counters', check=True, stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.counters(CountersTests.author), (1, 0, 0))
+        self.assertEqual(self.counters(CountersTests.reader), (0, 0, 0))
+
+
+class ExplainFeedsTests(TestCase):
+    """Проверка команды explain_feeds на схеме последней миграции."""
+
+    def test_explain_feeds_command(self):
+        out = StringIO()
+        steps = []
+        command = explain_feeds.Command
+
+        def recorded(method, step=None):
+            def wrapper(self, *args):
+                steps.append(step or args[0])
+                return method(self, *args)
+            return wrapper
+
+        # Вместо временной БД - тестовая, её схема та же
+        with mock.patch.object(explain_feeds, 'throwaway_database',
+                               nullcontext), \
+                mock.patch.object(command, 'analyze',
+                                  recorded(command.analyze, 'ANALYZE')), \
+                mock.patch.object(command, 'report',
+                                  recorded(command.report)):
+            call_command('explain_feeds', posts=60, authors=5, groups=2,
+                         repeat=1, stdout=out)
+        # Оба прохода - со свежей статистикой планировщика
+        self.assertEqual(steps, ['ANALYZE', 'До индексов',
+                                 'ANALYZE', 'После индексов'])
+        output = out.getvalue()
+        self.assertIn('До индексов', output)
+        self.assertIn('После индексов', output)
+        self.assertIn('post_author_pub_date_idx', output)
+        # После замера схема снова как у последней миграции
+        with connection.cursor() as cursor:
+            indexes = set(connection.introspection.get_constraints(
+                cursor, Post._meta.db_table
+            ))
+        self.assertLessEqual({index.name for index in Post._meta.indexes},
+                             indexes)
+        self.assertFalse([name for name in indexes
+                          if name.startswith('explain_')])
@@ -0,0 +1,145 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class StemTests(TestCase):
+    """Проверка приведения слов к основе."""
+
+    def test_word_forms_share_stem(self):
+        """Проверка, что формы одного слова дают одну основу."""
+        groups = (
+            ('кот', 'коты', 'котами', 'кота'),
+            ('книга', 'книги', 'книгами', 'книгой'),
+            ('красивый', 'красивые', 'красивая', 'красивого'),
+            ('читать', 'читала', 'читаю', 'читали'),
+            ('ёлка', 'елки', 'Ёлкой'),
+        )
+        for forms in groups:
+            with self.subTest(forms=forms):
+                self.assertEqual(len({search.stem(word) for word in forms}),
+                                 1)
+
+    def test_non_cyrillic_words_are_kept(self):
+        self.assertEqual(search.terms('Django 2.2, Python!'),
+                         ['django', '2', '2', 'python'])
+
+    def test_query_terms_are_quoted(self):
+        """Проверка, что операторы FTS5 в запросе не работают."""
+        self.assertEqual(search.query_terms('коты OR "NEAR(*'),
+                         ['"кот"', '"or"', '"near"'])
+        self.assertEqual(search.query_terms(' -- * '), [])
+
+
+class SearchTests(TestCase):
+    """Проверка поиска по записям и комментариям.
+
+    - индекс обновляется при создании, правке и удалении записей
+      и комментариев
+    - слова запроса ищутся сразу в записи и всех её комментариях,
+      комментарий индексируется без перестройки записи
+    - совпадения в тексте записи выше совпадений в комментариях
+    - результаты листаются с сохранением запроса в ссылках
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='search_author')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def found(self, query):
+        response = self.guest_client.get(reverse('search'), {'q': query})
+        return list(response.context['page'])
+
+    def test_index_follows_posts_and_comments(self):
+        """Проверка обновления индекса сигналами."""
+        post = Post.objects.create(
+            text='Рыжие коты спят на подоконнике',
+            author=SearchTests.author
+        )
+        self.assertEqual(self.found('рыжий кот'), [post])
+        self.assertEqual(self.found('собака'), [])
+
+        post.text = 'Собаки гуляют во дворе'
+        post.save()
+        self.assertEqual(self.found('рыжий кот'), [])
+        self.assertEqual(self.found('собаками'), [post])
+
+        comment = Comment.objects.create(
+            text='Отличные фотографии', author=SearchTests.author, post=post
+        )
+        self.assertEqual(self.found('фотография'), [post])
+        comment.delete()
+        self.assertEqual(self.found('фотография'), [])
+
+        post.delete()
+        self.assertEqual(self.found('собака'), [])
+
+    def test_words_from_post_and_comments(self):
+        """Проверка, что слова запроса ищутся в записи и комментариях
+        вместе, а новый комментарий не перечитывает остальные."""
+        post = Post.objects.create(text='Рыжий кот', author=SearchTests.author)
+        Comment.objects.create(text='Спит на крыше',
+                               author=SearchTests.author, post=post)
+        with self.assertNumQueries(3):
+            # INSERT комментария, сдвиг счётчика, строка индекса
+            Comment.objects.create(text='Очень пушистый',
+                                   author=SearchTests.author, post=post)
+        self.assertEqual(self.found('рыжий крыша пушистый'), [post])
+        self.assertEqual(self.found('рыжий собака'), [])
+        self.assertEqual(list(search.filter_posts(Post.objects.all(),
+                                                  'кот крыша')), [post])
+
+    def test_ranking_prefers_post_text(self):
+        """Проверка, что совпадение в записи важнее, чем в комментарии."""
+        commented = Post.objects.create(
+            text='Прогулка по городу', author=SearchTests.author
+        )
+        Comment.objects.create(
+            text='Какие красивые мосты', author=SearchTests.author,
+            post=commented
+        )
+        about_bridges = Post.objects.create(
+            text='Мосты через реку', author=SearchTests.author
+        )
+        Post.objects.create(text='Просто запись', author=SearchTests.author)
+        self.assertEqual(self.found('мост'), [about_bridges, commented])
+
+    @override_settings(PAGINATOR_DEFAULT_SIZE=2)
+    def test_results_are_paginated(self):
+        """Проверка страниц результатов и ссылок на них."""
+        posts = Post.objects.bulk_create(
+            Post(text=f'Заметка номер {number}', author=SearchTests.author)
+            for number in range(5)
+        )
+        # bulk_create не отправляет сигналов
+        self.assertEqual(self.found('заметка'), [])
+        call_command('search_index', stdout=StringIO())
+
+        response = self.guest_client.get(
+            reverse('search'), {'q': 'заметки', 'page': 2}
+        )
+        page = response.context['page']
+        self.assertEqual(page.paginator.count, len(posts))
+        self.assertEqual(len(page), 2)
+        self.assertContains(response, 'href="?q=%D0%B7%D0%B0%D0%BC%D0%B5'
+                                      '%D1%82%D0%BA%D0%B8&amp;page=3"')
+
+    def test_empty_query(self):
+        Post.objects.create(text='Любая запись', author=SearchTests.author)
+        response = self.guest_client.get(reverse('search'), {'q': ' !? '})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page'].paginator.count, 0)
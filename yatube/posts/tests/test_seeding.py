@@ -0,0 +1,89 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count, F
+from django.test import TestCase
+
+from posts import search
+from posts.models import Comment, Follow, Post, TimelineEntry, UserCounters
+from posts.seeding import Seeder
+
+User = get_user_model()
+
+
+class SeedingTests(TestCase):
+    """Проверка наполнения БД и нагрузочного прогона.
+
+    - строки вставляются с заданными датами и неравномерно по авторам
+    - счётчики, ленты подписок и поисковый индекс пересобираются
+    - набор не зависит от числа процессов
+    """
+
+    def seed(self, **options):
+        params = dict(users=20, groups=3, posts=600, comments=300,
+                      follows=3, days=30, stdout=StringIO())
+        params.update(options)
+        call_command('seed_yatube', **params)
+
+    def test_seed_fills_tables(self):
+        """Проверка таблиц, дат и производных данных."""
+        self.seed()
+        posts = Post.objects.filter(author__username__startswith='seed_')
+        self.assertEqual(posts.count(), 600)
+        self.assertEqual(Comment.objects.count(), 300)
+
+        dates = posts.order_by('pub_date').values_list('pub_date', flat=True)
+        self.assertGreater(dates.last() - dates.first(), timedelta(days=7))
+        self.assertFalse(Comment.objects.filter(
+            created__lt=F('post__pub_date')
+        ).exists())
+        top = posts.values('author').annotate(
+            total=Count('pk')
+        ).order_by('-total')
+        self.assertGreater(top[0]['total'], 600 / 20 * 3)
+
+        self.assertFalse(posts.annotate(total=Count('comments')).exclude(
+            comments_count=F('total')
+        ).exists())
+        author = User.objects.get(username='seed_0')
+        counters = UserCounters.objects.get(user=author)
+        actual = UserCounters.actual(author.pk)
+        for field in ('posts_count', 'followers_count', 'following_count'):
+            self.assertEqual(getattr(counters, field), getattr(actual, field))
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user_id=follow.user_id).count(),
+            Post.objects.filter(
+                author__following__user_id=follow.user_id
+            ).count()
+        )
+        if search.is_available():
+            self.assertTrue(search.search(posts.first().text.split()[0]))
+
+    def test_seed_does_not_depend_on_workers(self):
+        self.seed(prefix='one', posts=100, comments=0)
+        self.seed(prefix='two', posts=100, comments=0, workers=2)
+        texts = [
+            list(Post.objects.filter(
+                author__username__startswith=f'{prefix}_'
+            ).order_by('pub_date').values_list('text', flat=True))
+            for prefix in ('one', 'two')
+        ]
+        self.assertEqual(texts[0], texts[1])
+
+    def test_prefix_collision(self):
+        self.seed(posts=10, comments=0)
+        with self.assertRaises(CommandError):
+            self.seed(posts=10, comments=0)
+
+    def test_loadtest_reports_every_kind(self):
+        Seeder(users=10, groups=2, posts=50, comments=50, follows=2).run()
+        out = StringIO()
+        call_command('loadtest', requests=50, stdout=out)
+        for kind in ('index', 'group', 'profile', 'post', 'api'):
+            with self.subTest(kind=kind):
+                self.assertIn(f'\n{kind} ', out.getvalue())
+        self.assertIn('50 запросов', out.getvalue())
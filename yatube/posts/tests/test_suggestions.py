@@ -0,0 +1,95 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import suggestions
+from posts.models import Follow, Group, Post, SuggestedAuthor
+
+User = get_user_model()
+
+
+class SuggestionsTests(TestCase):
+    """Проверка блока "Кого читать".
+
+    - друзья друзей и авторы общих подборок выше остальных
+    - сам читатель и его авторы не предлагаются
+    - страница читает предложения одним запросом
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.friend, cls.fof, cls.grouped, cls.other = [
+            User.objects.create(username=f'suggest_{name}')
+            for name in ('reader', 'friend', 'fof', 'grouped', 'other')
+        ]
+        group = Group.objects.create(title='Кошки', slug='suggest-cats')
+        Post.objects.create(text='Моя', author=cls.reader, group=group)
+        Post.objects.create(text='Его', author=cls.grouped, group=group)
+        Post.objects.create(text='Без подборки', author=cls.other)
+        Follow.objects.create(user=cls.reader, author=cls.friend)
+        Follow.objects.create(user=cls.friend, author=cls.fof)
+        Follow.objects.create(user=cls.friend, author=cls.reader)
+        Follow.objects.create(user=cls.other, author=cls.fof)
+
+    def setUp(self):
+        cache.clear()
+
+    def suggested(self, user):
+        return list(SuggestedAuthor.objects.filter(user=user).order_by(
+            'rank'
+        ).values_list('author__username', flat=True))
+
+    def test_scoring(self):
+        call_command('suggest_authors', workers=1, stdout=StringIO())
+        suggested = self.suggested(SuggestionsTests.reader)
+        self.assertEqual(suggested[:2], ['suggest_grouped', 'suggest_fof'])
+        self.assertNotIn('suggest_reader', suggested)
+        self.assertNotIn('suggest_friend', suggested)
+        # Новичку без подписок и записей - популярные авторы
+        newcomer = User.objects.create(username='suggest_newcomer')
+        suggestions.rebuild(workers=1)
+        self.assertEqual(self.suggested(newcomer)[0], 'suggest_fof')
+
+    def test_pool_matches_single_process(self):
+        suggestions.rebuild(workers=1)
+        single = list(SuggestedAuthor.objects.values_list(
+            'user_id', 'author_id', 'rank'
+        ).order_by('user_id', 'rank'))
+        users = User.objects.bulk_create(
+            User(username=f'suggest_bulk_{i}') for i in range(600)
+        )
+        self.assertTrue(users)
+        suggestions.rebuild(workers=2)
+        pooled = list(SuggestedAuthor.objects.filter(
+            user_id__in=[user_id for user_id, _, _ in single]
+        ).values_list('user_id', 'author_id', 'rank').order_by(
+            'user_id', 'rank'
+        ))
+        self.assertEqual(pooled, single)
+
+    def test_block_on_pages(self):
+        suggestions.rebuild(workers=1)
+        client = Client()
+        client.force_login(SuggestionsTests.reader)
+        response = client.get(reverse('follow_index'))
+        names = [author.username
+                 for author in response.context['suggested_authors']]
+        self.assertEqual(names[:2], ['suggest_grouped', 'suggest_fof'])
+        self.assertContains(response, 'Кого читать')
+
+        # Подписка убирает автора из блока до пересчёта
+        client.get(reverse('profile_follow', args=('suggest_grouped',)))
+        response = client.get(reverse('profile', args=('suggest_fof',)))
+        names = [author.username
+                 for author in response.context['suggested_authors']]
+        self.assertNotIn('suggest_grouped', names)
+        self.assertNotIn('suggest_fof', names)
+
+        self.assertNotIn('Кого читать', Client().get(
+            reverse('profile', args=('suggest_fof',))
+        ).content.decode())
@@ -0,0 +1,320 @@
+import io
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import thumbnails
+from posts.models import ImageVariant, Post, StoredFile
+from posts.thumbnail_store import SQLiteKVStore
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x01\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ThumbnailPipelineTests(TestCase):
+    """Проверка фоновой подготовки копий картинок.
+
+    - сохранение картинки через PostForm ставит её копии в очередь
+    - пока копий картинки нет, карточка выводит заглушку
+    - готовые копии сменяют заглушку без ожидания кеша
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='thumbnail_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_author = Client()
+        self.authorized_author.force_login(ThumbnailPipelineTests.author)
+
+    def uploaded(self, name='small.gif'):
+        return SimpleUploadedFile(
+            name=name, content=SMALL_GIF, content_type='image/gif'
+        )
+
+    def uploaded_jpeg(self, name='photo.jpg', size=(1200, 600)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 120, 40)).save(buffer, 'JPEG')
+        return SimpleUploadedFile(
+            name=name, content=buffer.getvalue(), content_type='image/jpeg'
+        )
+
+    def test_form_save_schedules_thumbnail(self):
+        """Проверка, что копии ставятся в очередь при новой картинке."""
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            self.authorized_author.post(
+                reverse('new_post'),
+                data={'text': 'thumbnail_text', 'image': self.uploaded()}
+            )
+        post = Post.objects.get(text='thumbnail_text')
+        schedule.assert_called_once_with(post)
+
+        edit_url = reverse(
+            'post_edit', args=(ThumbnailPipelineTests.author.username,
+                               post.pk)
+        )
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            self.authorized_author.post(
+                edit_url, data={'text': 'edited_thumbnail_text'}
+            )
+        schedule.assert_not_called()
+
+    def test_placeholder_until_variants_ready(self):
+        """Проверка заглушки и её замены копиями картинки."""
+        post = Post.objects.create(
+            text='thumbnail_text', author=ThumbnailPipelineTests.author,
+            image=self.uploaded_jpeg()
+        )
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            content = self.client.get(reverse('index')).content.decode()
+        schedule.assert_called_once_with(post)
+        self.assertIn('card-img bg-light', content)
+        self.assertNotIn('<picture>', content)
+
+        self.assertTrue(thumbnails.generate(post.pk))
+        self.assertFalse(thumbnails.generate(post.pk))
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            content = self.client.get(reverse('index')).content.decode()
+        schedule.assert_not_called()
+        self.assertIn('<picture>', content)
+        self.assertLess(content.index('type="image/webp"'),
+                        content.index('type="image/jpeg"'))
+        for width in (320, 640, 960):
+            with self.subTest(width=width):
+                self.assertIn(f'.webp {width}w', content)
+                self.assertIn(f'.jpeg {width}w', content)
+
+    def test_variants_follow_image(self):
+        """Проверка копий: одна пара форматов на ширину, замена картинки."""
+        post = Post.objects.create(
+            text='thumbnail_text', author=ThumbnailPipelineTests.author,
+            image=self.uploaded_jpeg()
+        )
+        thumbnails.generate(post.pk)
+        old_variants = list(post.variants.all())
+        self.assertEqual(
+            sorted((v.format, v.width, v.height) for v in old_variants),
+            [(format_, width, round(width * 339 / 960))
+             for format_ in ('jpeg', 'webp') for width in (320, 640, 960)]
+        )
+
+        post.image = self.uploaded_jpeg('other.jpg', size=(500, 500))
+        post.save()
+        self.assertTrue(thumbnails.generate(post.pk))
+        new_variants = list(post.variants.all())
+        self.assertEqual([v.width for v in new_variants], [320, 320])
+        self.assertTrue(all(v.source == post.image.name
+                            for v in new_variants))
+        # Картинки одноцветные, поэтому копии шириной 320 совпадают
+        # байт в байт и остаются общими; остальные освобождены, их
+        # удалит collect_media
+        new_names = {v.image.name for v in new_variants}
+        released = [v.image.name for v in old_variants
+                    if v.image.name not in new_names]
+        self.assertEqual(len(released), 4)
+        self.assertFalse(StoredFile.objects.filter(
+            name__in=released, refcount__gt=0
+        ).exists())
+        call_command('collect_media', grace=0, stdout=StringIO())
+        storage = post.image.storage
+        for name in released:
+            with self.subTest(name=name):
+                self.assertFalse(storage.exists(name))
+        for variant in new_variants:
+            with self.subTest(variant=variant):
+                self.assertTrue(
+                    variant.image.storage.exists(variant.image.name)
+                )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentStorageTests(TestCase):
+    """Проверка хранения картинок по содержимому.
+
+    - одинаковые загрузки делят один файл и один набор копий
+    - счётчик ссылок следует за записями
+    - collect_media удаляет только файлы без ссылок
+    - хранилище пишет в текущий MEDIA_ROOT, даже заданный присваиванием
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='storage_author')
+
+    def uploaded(self, name='photo.jpg', color=(200, 120, 40)):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 200), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile(
+            name=name, content=buffer.getvalue(), content_type='image/jpeg'
+        )
+
+    def refcount(self, name):
+        return StoredFile.objects.get(name=name).refcount
+
+    def test_duplicates_share_file_and_variants(self):
+        """Проверка, что повторная загрузка не создаёт новых файлов."""
+        first = Post.objects.create(
+            text='first', author=ContentStorageTests.author,
+            image=self.uploaded('first.jpg')
+        )
+        second = Post.objects.create(
+            text='second', author=ContentStorageTests.author,
+            image=self.uploaded('second.jpg')
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}'
+                                           r'\.jpg$')
+        self.assertEqual(self.refcount(first.image.name), 2)
+
+        thumbnails.generate(first.pk)
+        with mock.patch('posts.variants.render') as render:
+            thumbnails.generate(second.pk)
+        render.assert_not_called()
+        self.assertEqual(
+            list(first.variants.values_list('image', flat=True)),
+            list(second.variants.values_list('image', flat=True))
+        )
+        variant = ImageVariant.objects.filter(post=first).first()
+        self.assertEqual(self.refcount(variant.image.name), 2)
+
+    def test_collect_media_removes_orphans_only(self):
+        """Проверка сборки файлов удалённых и изменённых записей."""
+        kept = Post.objects.create(
+            text='kept', author=ContentStorageTests.author,
+            image=self.uploaded()
+        )
+        edited = Post.objects.create(
+            text='edited', author=ContentStorageTests.author,
+            image=self.uploaded(color=(0, 0, 255))
+        )
+        old_name = edited.image.name
+        edited.image = self.uploaded(color=(0, 255, 0))
+        edited.save()
+        self.assertEqual(self.refcount(old_name), 0)
+
+        deleted = Post.objects.create(
+            text='deleted', author=ContentStorageTests.author,
+            image=self.uploaded()
+        )
+        deleted.delete()
+        self.assertEqual(self.refcount(kept.image.name), 1)
+
+        call_command('collect_media', grace=0, stdout=StringIO())
+        storage = kept.image.storage
+        self.assertFalse(storage.exists(old_name))
+        self.assertTrue(storage.exists(kept.image.name))
+        self.assertTrue(storage.exists(edited.image.name))
+        self.assertFalse(StoredFile.objects.filter(name=old_name).exists())
+
+        # Файл без счётчика и без записи (например, брошенная загрузка)
+        # и потерянные счётчики находит только обход каталогов
+        orphan = storage.save('posts/orphan.jpg',
+                              self.uploaded(color=(1, 2, 3)))
+        StoredFile.objects.all().delete()
+        call_command('collect_media', scan=True, grace=0, stdout=StringIO())
+        self.assertFalse(storage.exists(orphan))
+        self.assertTrue(storage.exists(kept.image.name))
+        self.assertEqual(self.refcount(kept.image.name), 1)
+
+    def test_media_root_assigned_directly(self):
+        """Проверка, что хранилище не запоминает прежний MEDIA_ROOT."""
+        storage = Post._meta.get_field('image').storage
+        self.assertEqual(storage.location, MEDIA_ROOT)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings():
+            # Присваивание не отправляет сигнала setting_changed
+            settings.MEDIA_ROOT = directory
+            name = storage.save('posts/direct.jpg',
+                                self.uploaded(color=(7, 7, 7)))
+        self.assertTrue(os.path.exists(os.path.join(directory, name)))
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, name)))
+
+
+class SQLiteKVStoreTests(TestCase):
+    """Проверка файлового хранилища метаданных миниатюр.
+
+    - записанное одним процессом видно другому через файл
+    - файл открывается при первом обращении, а не при запуске
+    - после загрузки поиск отвечает из памяти
+    - счётчики попаданий считают память, файл и отсутствие ключа
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'kvstore.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_store_shared_through_file(self):
+        """Проверка чтения из памяти и из файла."""
+        writer = SQLiteKVStore(self.path)
+        writer._set_raw('sorl-thumbnail||image||card', '{"name": "card"}')
+
+        reader = SQLiteKVStore(self.path)
+        self.assertEqual(reader.load(), 1)
+        writer._set_raw('sorl-thumbnail||image||late', '{"name": "late"}')
+
+        self.assertEqual(reader._get_raw('sorl-thumbnail||image||card'),
+                         '{"name": "card"}')
+        self.assertEqual(reader._get_raw('sorl-thumbnail||image||late'),
+                         '{"name": "late"}')
+        self.assertEqual(reader._get_raw('sorl-thumbnail||image||late'),
+                         '{"name": "late"}')
+        self.assertIsNone(reader._get_raw('sorl-thumbnail||image||none'))
+        stats = reader.stats()
+        self.assertEqual(
+            (stats['hits'], stats['misses'], stats['absent']), (2, 1, 1)
+        )
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_file_is_opened_on_first_use(self):
+        """Проверка, что хранилище не трогает файл до обращения."""
+        store = SQLiteKVStore(self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNone(store._get_raw('sorl-thumbnail||image||none'))
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_find_and_delete_keys(self):
+        """Проверка поиска ключей по префиксу и удаления."""
+        store = SQLiteKVStore(self.path)
+        store._set_raw('sorl-thumbnail||image||a', '1')
+        store._set_raw('sorl-thumbnail||thumbnails||a', '[]')
+        store._set_raw('sorl_thumbnail||image||b', '2')
+        self.assertEqual(
+            store._find_keys_raw('sorl-thumbnail||image||'),
+            ['sorl-thumbnail||image||a']
+        )
+        store._delete_raw('sorl-thumbnail||image||a')
+        self.assertIsNone(store._get_raw('sorl-thumbnail||image||a'))
+        self.assertEqual(SQLiteKVStore(self.path).load(), 2)
@@ -0,0 +1,127 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.counts import SCOPE_FOLLOW, count_key
+from posts.models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    """Проверка материализованной ленты подписок.
+
+    - новая запись раскладывается по лентам подписчиков
+    - при подписке лента дополняется записями автора
+    - при отписке записи автора из ленты удаляются
+    - записи авторов с большим числом подписчиков читаются напрямую
+    - переход автора через предел подписчиков не теряет и не удваивает
+      его записи
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='timeline_author')
+        cls.reader = User.objects.create(username='timeline_reader')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_reader = Client()
+        self.authorized_reader.force_login(TimelineTests.reader)
+
+    def follow_feed(self):
+        response = self.authorized_reader.get(reverse('follow_index'))
+        return list(response.context['page'])
+
+    def test_timeline_follows_posts_and_subscriptions(self):
+        """Проверка раскладки, дополнения и очистки ленты."""
+        old_post = Post.objects.create(
+            text='old timeline post', author=TimelineTests.author
+        )
+        follow = Follow.objects.create(
+            user=TimelineTests.reader, author=TimelineTests.author
+        )
+        self.assertEqual(self.follow_feed(), [old_post])
+
+        new_post = Post.objects.create(
+            text='new timeline post', author=TimelineTests.author
+        )
+        self.assertEqual(self.follow_feed(), [new_post, old_post])
+
+        follow.delete()
+        self.assertEqual(self.follow_feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_posts_read_on_request(self):
+        """Проверка, что записи популярного автора не раскладываются."""
+        Follow.objects.create(
+            user=TimelineTests.reader, author=TimelineTests.author
+        )
+        posts = [
+            Post.objects.create(
+                text=f'popular post {i}', author=TimelineTests.author
+            ) for i in range(3)
+        ]
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_feed(), posts[::-1])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_post_keeps_follow_counts(self):
+        """Проверка, что запись популярного автора не перебирает его
+        подписчиков ради сброса их счётчиков."""
+        Follow.objects.create(
+            user=TimelineTests.reader, author=TimelineTests.author
+        )
+        key = count_key(SCOPE_FOLLOW, TimelineTests.reader.pk)
+        cache.set(key, 0)
+        with CaptureQueriesContext(connection) as queries:
+            Post.objects.create(text='popular', author=TimelineTests.author)
+        self.assertEqual(cache.get(key), 0)
+        self.assertFalse([query for query in queries
+                          if 'posts_follow' in query['sql']])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_crossing_fanout_limit(self):
+        """Проверка ленты, когда автор становится популярным и обратно."""
+        author = TimelineTests.author
+        Follow.objects.create(user=TimelineTests.reader, author=author)
+        first = Post.objects.create(text='before limit', author=author)
+        other = Follow.objects.create(
+            user=User.objects.create(username='timeline_other'),
+            author=author
+        )
+        self.assertFalse(TimelineEntry.objects.exists())
+        second = Post.objects.create(text='over limit', author=author)
+        self.assertEqual(self.follow_feed(), [second, first])
+        response = self.authorized_reader.get(reverse('follow_index'))
+        self.assertEqual(response.context['page'].paginator.count, 2)
+
+        other.delete()
+        cache.clear()
+        self.assertEqual(self.follow_feed(), [second, first])
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('post_id', flat=True)
+                 .order_by('post_id')),
+            [first.pk, second.pk]
+        )
+
+    def test_rebuild_timelines_command(self):
+        """Проверка, что команда восстанавливает ленты по подпискам."""
+        Follow.objects.create(
+            user=TimelineTests.reader, author=TimelineTests.author
+        )
+        post = Post.objects.create(
+            text='rebuilt timeline post', author=TimelineTests.author
+        )
+        TimelineEntry.objects.all().delete()
+
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.follow_feed(), [post])
@@ -1,10 +1,20 @@
+import re
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
+from posts.counts import SCOPE_ALL, cached_count, count_key
 from posts.forms import PostForm
-from posts.models import Follow, Group, Post
+from posts.models import Comment, Follow, Group, Post
+from posts.templatetags.paginator_window import page_window
 
 User = get_user_model()
 
@@ -335,6 +345,10 @@ class PaginatorWorkRight(TestCase):
         )
         Post.objects.bulk_create(posts_12)
 
+    def setUp(self):
+        # bulk_create обходит сигналы, счётчик ленты надо пересчитать
+        cache.clear()
+
     def test_item_posts_per_page(self):
         """Проверка, что все посты правильно разбиваются на страницы.
 
@@ -356,6 +370,431 @@ class PaginatorWorkRight(TestCase):
         )
 
 
+class CachedCountPaginatorTest(TestCase):
+    """Проверка кешированных счётчиков записей для пагинатора."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='count_author')
+        cls.reader = User.objects.create(username='count_reader')
+        cls.group = Group.objects.create(
+            title='Count group',
+            description='Count group description',
+            slug='count-group'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_reader = Client()
+        self.authorized_reader.force_login(CachedCountPaginatorTest.reader)
+        Follow.objects.create(
+            user=CachedCountPaginatorTest.reader,
+            author=CachedCountPaginatorTest.author
+        )
+        for i in range(3):
+            Post.objects.create(
+                text=f'count_text_{i}',
+                author=CachedCountPaginatorTest.author,
+                group=CachedCountPaginatorTest.group
+            )
+        self.urls = (
+            reverse('index'),
+            reverse('group', args=(CachedCountPaginatorTest.group.slug,)),
+            reverse('profile',
+                    args=(CachedCountPaginatorTest.author.username,)),
+            reverse('follow_index'),
+        )
+
+    def get_count(self, url):
+        response = self.authorized_reader.get(url)
+        return response.context['page'].paginator.count
+
+    def test_count_query_runs_once(self):
+        """Проверка, что COUNT(*) выполняется только при промахе кеша."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.get_count(url)
+                with CaptureQueriesContext(connection) as queries:
+                    self.get_count(url)
+                self.assertFalse(
+                    [query for query in queries
+                     if 'COUNT(*)' in query['sql']]
+                )
+
+    def test_counts_follow_post_changes(self):
+        """Проверка, что сигналы поддерживают счётчики в актуальном виде."""
+        for url in self.urls:
+            self.assertEqual(self.get_count(url), 3)
+
+        post = Post.objects.create(
+            text='count_text_new',
+            author=CachedCountPaginatorTest.author,
+            group=CachedCountPaginatorTest.group
+        )
+        for url in self.urls:
+            with self.subTest(url=url, action='create'):
+                self.assertEqual(self.get_count(url), 4)
+
+        post.group = None
+        post.save()
+        self.assertEqual(self.get_count(self.urls[1]), 3)
+
+        post.delete()
+        for url in self.urls:
+            with self.subTest(url=url, action='delete'):
+                self.assertEqual(self.get_count(url), 3)
+
+        Follow.objects.filter(user=CachedCountPaginatorTest.reader).delete()
+        self.assertEqual(self.get_count(reverse('follow_index')), 0)
+
+    def test_change_during_count_is_not_lost(self):
+        """Проверка, что запись, созданная во время подсчёта, не теряется
+        из счётчика."""
+        objects = Post.objects.all()
+        key = count_key(SCOPE_ALL)
+
+        def count():
+            # COUNT(*) уже выполнен, кеша ещё нет: сдвиг пропускается
+            result = Post.objects.count()
+            Post.objects.create(text='count_text_race',
+                                author=CachedCountPaginatorTest.author)
+            return result
+
+        with mock.patch.object(objects, 'count', side_effect=count):
+            self.assertEqual(cached_count(key, objects), 3)
+        self.assertEqual(cached_count(key, Post.objects.all()), 4)
+
+    @override_settings(PAGINATOR_PAGE_WINDOW=3)
+    def test_paginator_page_window(self):
+        """Проверка, что выводится только окно номеров страниц."""
+        paginator = Paginator(range(100), 1)
+        page_windows = (
+            (1, range(1, 5)),
+            (50, range(47, 54)),
+            (100, range(97, 101)),
+        )
+        for number, window in page_windows:
+            with self.subTest(page=number):
+                self.assertEqual(
+                    page_window(paginator.page(number)), window
+                )
+
+
+class PostCardCacheTest(TestCase):
+    """Проверка кеша карточек записей.
+
+    Карточка отрисовывается один раз для всех лент и перерисовывается
+    после правки записи, нового комментария и переименования подборки.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='card_author')
+        cls.group = Group.objects.create(
+            title='Card group',
+            description='Card group description',
+            slug='card-group'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='card_text', author=PostCardCacheTest.author,
+            group=PostCardCacheTest.group
+        )
+        self.authorized_author = Client()
+        self.authorized_author.force_login(PostCardCacheTest.author)
+
+    def get_content(self, client, url=None):
+        return client.get(url or reverse('index')).content.decode()
+
+    def test_card_rendered_once_for_all_feeds(self):
+        """Проверка, что лента подборки берёт карточку из кеша."""
+        self.get_content(self.client)
+        Post.objects.filter(pk=self.post.pk).update(text='hidden_text')
+        content = self.get_content(
+            self.client,
+            reverse('group', args=(PostCardCacheTest.group.slug,))
+        )
+        self.assertIn('card_text', content)
+
+    def test_card_changes_with_post_version(self):
+        """Проверка, что карточка обновляется вместе с записью."""
+        self.get_content(self.client)
+
+        self.post.text = 'edited_card_text'
+        self.post.save()
+        self.assertIn('edited_card_text', self.get_content(self.client))
+
+        Comment.objects.create(
+            post=self.post, author=PostCardCacheTest.author, text='comment'
+        )
+        self.assertIn('Комментариев: 1', self.get_content(self.client))
+
+        group = PostCardCacheTest.group
+        group.title = 'Renamed card group'
+        group.save()
+        self.assertIn('Renamed card group', self.get_content(self.client))
+
+    def test_card_depends_on_viewer(self):
+        """Проверка, что кнопку правки видит только автор."""
+        edit_url = reverse(
+            'post_edit', args=(PostCardCacheTest.author.username,
+                               self.post.pk)
+        )
+        self.assertIn(edit_url, self.get_content(self.authorized_author))
+        self.assertNotIn(edit_url, self.get_content(self.client))
+
+
+class PageCacheInvalidationTest(TestCase):
+    """Проверка кеша страниц гостей с инвалидацией по поколениям.
+
+    Страница отдаётся из кеша, пока в её области ничего не изменилось,
+    и перестраивается после записей, комментариев и подписок.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='page_author')
+        cls.reader = User.objects.create(username='page_reader')
+        cls.group = Group.objects.create(
+            title='Page group',
+            description='Page group description',
+            slug='page-group'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='page_text', author=PageCacheInvalidationTest.author,
+            group=PageCacheInvalidationTest.group
+        )
+        self.urls = (
+            reverse('index'),
+            reverse('group', args=(PageCacheInvalidationTest.group.slug,)),
+            reverse('profile',
+                    args=(PageCacheInvalidationTest.author.username,)),
+        )
+
+    def get_content(self, url):
+        return self.client.get(url).content.decode()
+
+    def test_page_served_from_cache(self):
+        """Проверка, что повторный запрос гостя не идёт в базу."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.get_content(url)
+                with self.assertNumQueries(0):
+                    self.client.get(url)
+
+    def test_page_changes_after_writes(self):
+        """Проверка, что запись и комментарий обновляют свои страницы."""
+        for url in self.urls:
+            self.get_content(url)
+        Post.objects.create(
+            text='new_page_text', author=PageCacheInvalidationTest.author,
+            group=PageCacheInvalidationTest.group
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertIn('new_page_text', self.get_content(url))
+
+        Comment.objects.create(
+            post=self.post, author=PageCacheInvalidationTest.reader,
+            text='comment'
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertIn('Комментариев: 1', self.get_content(url))
+
+    def test_post_moved_to_other_group(self):
+        """Проверка, что запись пропадает со страницы прежней подборки."""
+        url = self.urls[1]
+        self.get_content(url)
+        self.post.group = None
+        self.post.save()
+        self.assertNotIn('page_text', self.get_content(url))
+
+    def test_profile_changes_after_follow(self):
+        """Проверка, что подписка обновляет счётчики в профиле."""
+        url = self.urls[2]
+        self.assertIn('Подписчиков: 0', self.get_content(url))
+        Follow.objects.create(
+            user=PageCacheInvalidationTest.reader,
+            author=PageCacheInvalidationTest.author
+        )
+        self.assertIn('Подписчиков: 1', self.get_content(url))
+
+    def test_pages_change_after_rename(self):
+        """Проверка, что новый логин автора виден на страницах и в
+        карточках, а сохранение без смены имени кеш не сбрасывает."""
+        author = User.objects.get(pk=PageCacheInvalidationTest.author.pk)
+        for url in self.urls[:2]:
+            self.get_content(url)
+        author.last_login = timezone.now()
+        author.save()
+        with self.assertNumQueries(0):
+            self.client.get(self.urls[0])
+
+        author.username = 'renamed_author'
+        author.save()
+        urls = self.urls[:2] + (reverse('profile', args=(author.username,)),)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIn('@renamed_author', self.get_content(url))
+
+    def test_authorized_pages_not_cached(self):
+        """Проверка, что страницы пользователей не берутся из кеша."""
+        self.get_content(self.urls[0])
+        self.client.force_login(PageCacheInvalidationTest.reader)
+        # bulk_create не отправляет сигналов и не сдвигает поколения
+        Post.objects.bulk_create([Post(
+            text='hidden_text', author=PageCacheInvalidationTest.author
+        )])
+        self.assertIn('hidden_text', self.get_content(self.urls[0]))
+
+
+class ConditionalGetTest(TestCase):
+    """Проверка ответов 304 по ETag страницы.
+
+    - повторный запрос с If-None-Match получает 304 без запросов
+      за страницей и без отрисовки шаблона
+    - ETag меняется после изменений в области страницы
+    - у разных пользователей разные ETag
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='etag_author')
+        cls.reader = User.objects.create(username='etag_reader')
+        cls.group = Group.objects.create(
+            title='Etag group', description='Etag group', slug='etag-group'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='etag_text', author=ConditionalGetTest.author,
+            group=ConditionalGetTest.group
+        )
+        self.urls = (
+            reverse('index'),
+            reverse('group', args=(ConditionalGetTest.group.slug,)),
+            reverse('profile', args=(ConditionalGetTest.author.username,)),
+            reverse('post', args=(ConditionalGetTest.author.username,
+                                  self.post.pk)),
+        )
+
+    def assert_not_modified(self, client, url, queries):
+        etag = client.get(url)['ETag']
+        with self.assertNumQueries(queries):
+            with self.assertTemplateNotUsed('base.html'):
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_not_modified_without_queries(self):
+        """Проверка пути 304: гость - без запросов, пользователь -
+        только загрузка сессии и пользователя."""
+        authorized_client = Client()
+        authorized_client.force_login(ConditionalGetTest.reader)
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assert_not_modified(self.client, url, 0)
+                self.assert_not_modified(authorized_client, url, 2)
+
+    def test_etag_changes_after_writes(self):
+        """Проверка, что изменения в области страницы меняют ETag."""
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Comment.objects.create(
+            post=self.post, author=ConditionalGetTest.reader, text='comment'
+        )
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_profile_etag_changes_after_reader_follows(self):
+        """Проверка, что подписка читателя обновляет блок "Кого читать"
+        на чужом профиле."""
+        other = User.objects.create(username='etag_other')
+        self.client.force_login(ConditionalGetTest.reader)
+        url = self.urls[2]
+        etag = self.client.get(url)['ETag']
+        Follow.objects.create(user=ConditionalGetTest.reader, author=other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(ConditionalGetTest.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(ConditionalGetTest.reader.username,
+                      response.content.decode())
+
+
+@override_settings(PAGINATOR_CURSOR_VIEWS=['index'])
+class CursorPaginatorWorkRight(TestCase):
+    """Проверка пагинации по курсору для главной страницы."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_test = User.objects.create(
+            username='cursor_test_user'
+        )
+        Post.objects.bulk_create(
+            Post(text='cursor_text_%s' % i,
+                 author=cls.user_test) for i in range(25)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_page(self, cursor=None):
+        data = {'cursor': cursor} if cursor else {}
+        return self.client.get(reverse('index'), data).context['page']
+
+    def test_cursor_walks_all_posts_forward_and_back(self):
+        """Проверка, что по курсору лента проходится без пропусков.
+
+        25 постов по 10 на странице: вперёд 10, 10, 5, затем назад.
+        """
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        pages = [self.get_page()]
+        self.assertFalse(pages[0].has_previous())
+        while pages[-1].has_next():
+            pages.append(self.get_page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(
+            [post.pk for page in pages for post in page], expected
+        )
+
+        back = self.get_page(pages[-1].previous_cursor)
+        self.assertEqual(list(back), list(pages[1]))
+        back = self.get_page(back.previous_cursor)
+        self.assertEqual(list(back), list(pages[0]))
+        self.assertFalse(back.has_previous())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Проверка, что испорченный токен отдаёт первую страницу."""
+        first_page = self.get_page()
+        self.assertEqual(list(self.get_page('not-a-cursor')),
+                         list(first_page))
+
+
 class FollowingRightWorkTest(TestCase):
     """Проверка работы системы подписок."""
 
@@ -420,3 +859,182 @@ class FollowingRightWorkTest(TestCase):
             author=FollowingRightWorkTest.author,
             user=FollowingRightWorkTest.follower)
         self.assertFalse(follows)
+
+
+class FeedQueriesCountTest(TestCase):
+    """Проверка, что число запросов ленты не зависит от размера страницы.
+
+    Карточка записи не должна обращаться к БД за автором, подборкой
+    и комментариями, поэтому страница из 3 и из 12 записей должна
+    стоить одинаковое количество запросов.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='feed_reader')
+        cls.group = Group.objects.create(
+            title='Feed group',
+            description='Feed group description',
+            slug='feed-group'
+        )
+        authors = [
+            User.objects.create(username=f'feed_author_{i}')
+            for i in range(3)
+        ]
+        cls.author = authors[0]
+        Post.objects.bulk_create(
+            Post(text=f'feed_text_{i}', author=authors[i % 3],
+                 group=cls.group) for i in range(36)
+        )
+        for author in authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for post in Post.objects.all():
+            Comment.objects.create(
+                post=post, author=cls.reader, text='feed comment'
+            )
+
+    def setUp(self):
+        self.authorized_reader = Client()
+        self.authorized_reader.force_login(FeedQueriesCountTest.reader)
+
+    def count_queries(self, url, page_size):
+        cache.clear()
+        with override_settings(PAGINATOR_DEFAULT_SIZE=page_size):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_reader.get(url)
+        self.assertEqual(len(response.context['page']), page_size)
+        return len(queries)
+
+    def test_feed_queries_count_not_depend_on_page_size(self):
+        """Проверка ленты на отсутствие N+1 запросов."""
+        urls = (
+            reverse('index'),
+            reverse('group', args=(FeedQueriesCountTest.group.slug,)),
+            reverse('profile', args=(FeedQueriesCountTest.author.username,)),
+            reverse('follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.count_queries(url, 3),
+                    self.count_queries(url, 12)
+                )
+
+    def test_feed_post_has_comments_count(self):
+        """Проверка, что записи ленты несут количество комментариев."""
+        response = self.client.get(reverse('index'))
+        for post in response.context['page']:
+            with self.subTest(post=post.id):
+                self.assertEqual(post.comments_count, 1)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=10)
+class CommentPagesTest(TestCase):
+    """Проверка порций комментариев на странице записи.
+
+    - комментарии выбираются одним запросом вместе с авторами
+    - "Показать ещё" отдаёт следующую порцию HTML или JSON
+    - первая порция берётся из кеша до нового комментария
+    - после отправки комментария читатель видит его порцию
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='comments_author')
+        cls.readers = [
+            User.objects.create(username=f'comments_reader_{number}')
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(text='Запись',
+                                        author=CommentPagesTest.author)
+        self.url = reverse('post', args=(CommentPagesTest.author.username,
+                                         self.post.pk))
+        self.authorized_client = Client()
+        self.authorized_client.force_login(CommentPagesTest.readers[0])
+
+    def add_comments(self, count):
+        return [
+            Comment.objects.create(
+                post=self.post, text=f'Комментарий {number}',
+                author=CommentPagesTest.readers[number % 3]
+            )
+            for number in range(count)
+        ]
+
+    def shown_ids(self, response):
+        return [int(pk) for pk in re.findall(r'name="comment_(\d+)"',
+                                             response.content.decode())]
+
+    def post_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(self.url)
+        return len(queries)
+
+    def test_queries_do_not_grow(self):
+        """Проверка, что авторы комментариев не выбираются по одному."""
+        self.add_comments(2)
+        few = self.post_queries()
+        self.add_comments(20)
+        self.assertEqual(self.post_queries(), few)
+
+    def test_load_more(self):
+        """Проверка прохода по всем порциям: HTML и JSON."""
+        comments = self.add_comments(25)
+        response = self.authorized_client.get(self.url)
+        shown = self.shown_ids(response)
+        self.assertEqual(shown, [comment.pk for comment in comments[:10]])
+        fragment = re.search(r'data-fragment="([^"]+)"',
+                             response.content.decode()).group(1)
+        while fragment:
+            response = self.client.get(fragment.replace('&amp;', '&'))
+            self.assertTemplateNotUsed(response, 'base.html')
+            shown += self.shown_ids(response)
+            found = re.search(r'data-fragment="([^"]+)"',
+                              response.content.decode())
+            fragment = found and found.group(1)
+        self.assertEqual(shown, [comment.pk for comment in comments])
+
+        url = reverse('post_comments',
+                      args=(CommentPagesTest.author.username, self.post.pk))
+        data = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual([item['id'] for item in data['results']],
+                         shown[:10])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([item['id'] for item in data['results']],
+                         shown[10:20])
+        self.assertIn('comment_', data['html'])
+
+    def test_first_page_is_cached(self):
+        """Проверка кеша первой порции и его сброса комментарием."""
+        self.add_comments(3)
+        self.authorized_client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(self.url)
+        self.assertFalse(any('posts_comment' in query['sql']
+                             for query in queries))
+
+        comment = Comment.objects.create(
+            post=self.post, text='Свежий',
+            author=CommentPagesTest.readers[1]
+        )
+        response = self.authorized_client.get(self.url)
+        self.assertIn(comment.pk, self.shown_ids(response))
+
+    def test_redirect_to_new_comment(self):
+        """Проверка, что новый комментарий виден после перехода."""
+        self.add_comments(25)
+        response = self.authorized_client.post(
+            reverse('add_comment', args=(CommentPagesTest.author.username,
+                                         self.post.pk)),
+            {'text': 'Двадцать шестой'}
+        )
+        comment = Comment.objects.get(text='Двадцать шестой')
+        self.assertTrue(response.url.endswith(f'#comment_{comment.pk}'))
+        response = self.authorized_client.get(response.url)
+        self.assertIn(comment.pk, self.shown_ids(response))
@@ -0,0 +1,115 @@
+"""Хранилище метаданных миниатюр sorl-thumbnail в файле SQLite.
+
+Штатное хранилище sorl (cached_db_kvstore) держит метаданные в таблице
+базы сайта и кеширует их в LocMemCache, то есть отдельно в каждом
+процессе: каждый процесс заново прогревает кеш запросами к базе.
+Здесь метаданные лежат в общем для всех процессов файле SQLite в режиме
+WAL и при первом обращении целиком загружаются в память процесса. Поиск
+миниатюры (im.url) отвечает из памяти; в файл идёт только запрос ключа,
+которого в памяти нет (его мог записать другой процесс). Файл открывается
+только при обращении: команды и тесты, не выводящие карточек, его не
+трогают.
+"""
+import sqlite3
+import threading
+
+from django.conf import settings
+from sorl.thumbnail.kvstores.base import KVStoreBase
+
+
+class SQLiteKVStore(KVStoreBase):
+    """KV-хранилище sorl-thumbnail в файле THUMBNAIL_KVSTORE_PATH."""
+
+    def __init__(self, path=None):
+        super().__init__()
+        self._path = path
+        self._local = threading.local()
+        self._data = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.absent = 0
+
+    @property
+    def path(self):
+        return self._path or settings.THUMBNAIL_KVSTORE_PATH
+
+    @property
+    def connection(self):
+        # Соединение sqlite3 нельзя делить между потоками
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS kvstore '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.load()
+        return self._data
+
+    def load(self):
+        """Загрузить все метаданные из файла в память одним запросом."""
+        rows = self.connection.execute('SELECT key, value FROM kvstore')
+        with self._lock:
+            self._data = dict(rows)
+        return len(self._data)
+
+    def stats(self):
+        """Счётчики поиска с запуска процесса.
+
+        hits - найдено в памяти, misses - найдено только в файле,
+        absent - ключа нет нигде (миниатюра ещё не создана).
+        """
+        lookups = self.hits + self.misses + self.absent
+        return {
+            'keys': len(self.data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'absent': self.absent,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _get_raw(self, key):
+        value = self.data.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        row = self.connection.execute(
+            'SELECT value FROM kvstore WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            self.absent += 1
+            return None
+        self.misses += 1
+        self.data[key] = row[0]
+        return row[0]
+
+    def _set_raw(self, key, value):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO kvstore (key, value) VALUES (?, ?)',
+                (key, value)
+            )
+        self.data[key] = value
+
+    def _delete_raw(self, *keys):
+        with self.connection:
+            self.connection.executemany(
+                'DELETE FROM kvstore WHERE key = ?', ((key,) for key in keys)
+            )
+        for key in keys:
+            self.data.pop(key, None)
+
+    def _find_keys_raw(self, prefix):
+        rows = self.connection.execute(
+            "SELECT key FROM kvstore WHERE key LIKE ? ESCAPE '\\'",
+            (prefix.replace('\\', '\\\\').replace('%', '\\%')
+             .replace('_', '\\_') + '%',)
+        )
+        return [key for key, in rows]
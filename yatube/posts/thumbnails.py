@@ -0,0 +1,141 @@
+"""Фоновая подготовка картинок для карточек записей.
+
+Тег {% thumbnail %} создавал миниатюру при первой отрисовке карточки,
+прямо в запросе, и страница с десятком новых картинок ждала секунды.
+Здесь копии картинки для srcset (variants.py) создаются заранее, в пуле
+потоков процесса, сразу после сохранения записи с новой картинкой.
+Пока копий нет, карточка выводит миниатюру, если sorl-thumbnail создал
+её раньше, или заглушку; когда копии готовы, запись сохраняется заново,
+чтобы сменились ключи кеша её карточки и страниц (см. signals.py).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import variants
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+CARD_GEOMETRY = '960x339'
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class CardThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который умеет искать миниатюру, не создавая.
+
+    Нужен для записей, картинки которых попали на сайт до появления
+    копий для srcset: их миниатюры уже лежат в хранилище sorl.
+
+    lookup() повторяет разбор параметров из get_thumbnail(), чтобы имя
+    миниатюры совпало с тем, под которым её сохранит get_thumbnail().
+    """
+
+    def lookup(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(thumbnail_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = CardThumbnailBackend()
+
+
+def card_thumbnail(image):
+    """Миниатюра карточки, созданная sorl-thumbnail, или None."""
+    if not image:
+        return None
+    return backend.lookup(image, CARD_GEOMETRY, **CARD_OPTIONS)
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+    return _executor
+
+
+def generate(post_id):
+    """Создать копии картинки записи, если их ещё нет или они устарели.
+
+    return - True, если копии созданы этим вызовом.
+    """
+    post = Post.objects.prefetch_related('variants').filter(
+        pk=post_id
+    ).first()
+    if post is None or not post.image or variants.is_fresh(post):
+        return False
+    variants.build_variants(post)
+    # Версия записи меняется, и карточка с заглушкой уходит из кеша
+    post.save(update_fields=('updated',))
+    return True
+
+
+def build(post_id):
+    """generate(), ошибки которого пишутся в лог, а не теряются."""
+    try:
+        return generate(post_id)
+    except Exception:
+        logger.exception('Thumbnail for post %s failed', post_id)
+        return False
+
+
+def run(post_id):
+    """build() для потока пула."""
+    try:
+        return build(post_id)
+    finally:
+        with _lock:
+            _pending.discard(post_id)
+        # Соединение с базой у каждого потока пула своё
+        connection.close()
+
+
+def submit(post_id):
+    """Поставить запись в очередь пула, если её там ещё нет.
+
+    return - Future задачи или None, если запись уже в очереди.
+    """
+    with _lock:
+        if post_id in _pending:
+            return None
+        _pending.add(post_id)
+    return get_executor().submit(run, post_id)
+
+
+def schedule(post):
+    """Поставить копии картинки записи в очередь после фиксации транзакции.
+
+    До фиксации поток пула не увидит запись или её новую картинку.
+    С THUMBNAIL_SYNC копии создаются сразу после фиксации в текущем
+    потоке: так их видят тесты, база которых не терпит второго писателя.
+    """
+    if not post.image:
+        return
+    if settings.THUMBNAIL_SYNC:
+        transaction.on_commit(lambda: build(post.pk))
+    else:
+        transaction.on_commit(lambda: submit(post.pk))
@@ -0,0 +1,212 @@
+"""Материализованная лента подписок (fan-out on write).
+
+При публикации запись раскладывается в TimelineEntry каждого подписчика
+автора, при подписке лента читателя дополняется записями автора, при
+отписке из неё удаляются записи автора. Авторы, у которых подписчиков
+больше TIMELINE_FANOUT_LIMIT, записи не раскладывают: такие записи
+подмешиваются в ленту при чтении (fan-out on read).
+
+Популярность автора и при записи, и при чтении определяет один
+источник - счётчик UserCounters.followers_count. Когда подписка
+переводит автора через предел, его записи убираются из всех лент
+(дальше они читаются напрямую), а когда отписка возвращает его под
+предел - раскладываются по лентам всех подписчиков заново.
+"""
+from heapq import merge
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import (Follow, Post, TimelineEntry, UserCounters,
+                     bulk_batch_size)
+
+BATCH_SIZE = 1000
+
+
+def followers_count(author_id):
+    counts = UserCounters.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    )
+    return next(iter(counts), 0)
+
+
+def is_pulled_author(author_id):
+    """Записи автора не раскладываются по лентам, а читаются напрямую."""
+    return followers_count(author_id) > settings.TIMELINE_FANOUT_LIMIT
+
+
+def fan_out(post):
+    """Разложить новую запись по лентам подписчиков автора."""
+    if is_pulled_author(post.author_id):
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    )
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post.pk,
+                       pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=bulk_batch_size(TimelineEntry, BATCH_SIZE),
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту читателя все записи автора, на которого подписался.
+
+    Вызывается после того, как сигнал увеличил счётчик подписчиков.
+    """
+    followers = followers_count(author_id)
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if followers == limit + 1:
+        # Автор только что стал популярным
+        unmaterialize(author_id)
+    if followers > limit:
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date'
+    )
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts.iterator()),
+        batch_size=bulk_batch_size(TimelineEntry, BATCH_SIZE),
+        ignore_conflicts=True
+    )
+
+
+def unmaterialize(author_id):
+    """Убрать записи автора из всех лент: дальше они читаются напрямую."""
+    TimelineEntry.objects.filter(post__author_id=author_id).delete()
+
+
+def materialize(author_id):
+    """Разложить все записи автора по лентам всех его подписчиков."""
+    unmaterialize(author_id)
+    insert_entries(Follow.objects.order_by().filter(author_id=author_id))
+
+
+def rebuild(user_ids=None):
+    """Собрать ленты читателей user_ids (всех - при None) заново.
+
+    Строки вставляются одним INSERT ... SELECT по подпискам, без выборки
+    записей в Python: после массовой загрузки лент бывают миллионы.
+    Популярных авторов определяют счётчики: после загрузки в обход
+    сигналов сначала нужен rebuild_counters.
+    """
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.order_by()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    entries.delete()
+    pulled = UserCounters.objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).values('user_id')
+    insert_entries(follows.exclude(author_id__in=pulled))
+
+
+def insert_entries(follows):
+    """Записи авторов подписок follows - в ленты их читателей.
+
+    Строки вставляются одним INSERT ... SELECT, без выборки в Python.
+    """
+    rows = follows.filter(author__posts__isnull=False).values_list(
+        'user_id', 'author__posts__id', 'author__posts__pub_date'
+    )
+    select, params = rows.query.sql_with_params()
+    connection = connections[router.db_for_write(TimelineEntry)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(TimelineEntry._meta.get_field(name).column)
+        for name in ('user', 'post', 'pub_date')
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(TimelineEntry._meta.db_table)} '
+            f'({columns}) {select}', params
+        )
+
+
+def trim(user_id, author_id):
+    """Убрать из ленты читателя записи автора, от которого он отписался.
+
+    Вызывается после того, как сигнал уменьшил счётчик подписчиков.
+    """
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+    if followers_count(author_id) == settings.TIMELINE_FANOUT_LIMIT:
+        # Автор только что перестал быть популярным
+        materialize(author_id)
+
+
+class TimelineFeed:
+    """Лента подписок читателя для пагинатора.
+
+    Ведёт себя как последовательность записей: поддерживает count() и
+    срезы. Срез [a:b] читает не больше b ключей (pub_date, id) из
+    материализованной ленты и из записей авторов с fan-out on read,
+    сливает их и загружает только записи нужной страницы.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.entries = TimelineEntry.objects.filter(
+            user=user
+        ).order_by('-pub_date', '-post_id')
+
+    @cached_property
+    def pulled_authors(self):
+        return list(Follow.objects.filter(
+            user=self.user,
+            author__counters__followers_count__gt=(
+                settings.TIMELINE_FANOUT_LIMIT
+            )
+        ).values_list('author_id', flat=True))
+
+    def pulled_posts(self):
+        return Post.objects.filter(
+            author_id__in=self.pulled_authors
+        ).order_by('-pub_date', '-pk')
+
+    def count(self):
+        if not self.pulled_authors:
+            return self.entries.count()
+        # Записи читаемых напрямую авторов, оставшиеся в ленте, не
+        # считаются дважды
+        return self.entries.exclude(
+            post__author_id__in=self.pulled_authors
+        ).count() + self.pulled_posts().count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('TimelineFeed supports only plain slices.')
+        start, stop = key.start or 0, key.stop
+        keys = self.entries.values_list('pub_date', 'post_id')[:stop]
+        if self.pulled_authors:
+            keys = merge(
+                keys,
+                self.pulled_posts().values_list('pub_date', 'pk')[:stop],
+                reverse=True
+            )
+        ids = []
+        for _, pk in keys:
+            # Запись автора, который перешёл в fan-out on read, может
+            # оказаться и в ленте, и среди читаемых напрямую.
+            if not ids or ids[-1] != pk:
+                ids.append(pk)
+        ids = ids[start:stop]
+        posts = Post.objects.feed().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+    def as_queryset(self):
+        """Та же лента одним QuerySet (для пагинации по курсору)."""
+        return Post.objects.filter(
+            Q(pk__in=self.entries.values('post'))
+            | Q(author_id__in=self.pulled_authors)
+        ).feed()
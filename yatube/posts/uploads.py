@@ -0,0 +1,122 @@
+"""Проверка и нормализация картинок, загружаемых к записям.
+
+Размеры и формат картинки читаются из заголовка файла, без полного
+декодирования, поэтому "декомпрессионная бомба" (крошечный файл с
+огромным кадром) отклоняется до выделения памяти под пиксели.
+Картинка, которая больше UPLOAD_IMAGE_MAX_SIDE или несёт EXIF,
+декодируется один раз (JPEG - сразу в уменьшенном масштабе через
+Image.draft), поворачивается по тегу Orientation и сохраняется заново,
+уже без метаданных. Остальные картинки сохраняются как есть, байт в байт.
+"""
+import io
+import os
+import warnings
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+ORIENTATION = 0x0112
+
+
+def read_header(file_):
+    """Открыть картинку, прочитав только заголовок.
+
+    Превышение UPLOAD_IMAGE_MAX_PIXELS и предупреждение Pillow о
+    декомпрессионной бомбе считаются ошибкой проверки.
+    """
+    file_.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(file_)
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        raise forms.ValidationError(
+            'Слишком большое разрешение картинки.', code='image_too_large'
+        )
+    except (OSError, SyntaxError, ValueError):
+        raise forms.ValidationError(
+            'Загрузите правильное изображение.', code='invalid_image'
+        )
+    if image.format not in ALLOWED_FORMATS:
+        raise forms.ValidationError(
+            'Поддерживаются картинки JPEG, PNG, GIF и WebP.',
+            code='image_format'
+        )
+    width, height = image.size
+    if width * height > settings.UPLOAD_IMAGE_MAX_PIXELS:
+        raise forms.ValidationError(
+            'Слишком большое разрешение картинки.', code='image_too_large'
+        )
+    return image
+
+
+def needs_normalizing(image):
+    too_big = max(image.size) > settings.UPLOAD_IMAGE_MAX_SIDE
+    if getattr(image, 'is_animated', False):
+        # Кадры анимации не перекодируются, поэтому её размер ограничен
+        if too_big:
+            raise forms.ValidationError(
+                f'Анимированная картинка должна быть не больше '
+                f'{settings.UPLOAD_IMAGE_MAX_SIDE} точек по каждой стороне.',
+                code='image_too_large'
+            )
+        return False
+    return too_big or 'exif' in image.info
+
+
+def normalize(image):
+    """Уменьшить, повернуть по EXIF и перекодировать картинку.
+
+    Цветовой профиль сохраняется, остальные метаданные отбрасываются.
+    return - (байты, формат) новой картинки.
+    """
+    max_side = settings.UPLOAD_IMAGE_MAX_SIDE
+    icc_profile = image.info.get('icc_profile')
+    has_alpha = (image.mode in ('RGBA', 'LA')
+                 or 'transparency' in image.info)
+    orientation = image.getexif().get(ORIENTATION, 1)
+    width, height = image.size
+    scale = min(1, max_side / max(width, height))
+    # Рамка для draft сохраняет пропорции кадра, иначе JPEG декодируется
+    # без уменьшения
+    image.draft('RGB', (round(width * scale), round(height * scale)))
+    # Уменьшение и поворот - на месте или уже на малом кадре, чтобы
+    # в памяти не было лишних копий полного размера
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if orientation != 1:
+        image = ImageOps.exif_transpose(image)
+    format_, mode, params = (
+        ('PNG', 'RGBA', {'optimize': True}) if has_alpha
+        else ('JPEG', 'RGB', {'quality': 90, 'optimize': True})
+    )
+    if image.mode != mode:
+        image = image.convert(mode)
+    if icc_profile:
+        params['icc_profile'] = icc_profile
+    buffer = io.BytesIO()
+    image.save(buffer, format_, **params)
+    return buffer.getvalue(), format_
+
+
+def clean_upload(uploaded):
+    """Проверить загруженную картинку и при необходимости нормализовать.
+
+    return - исходный файл или новый SimpleUploadedFile.
+    """
+    # Image.close() закрыл бы и сам загруженный файл, поэтому кадр
+    # не закрывается, а только перематывается файл
+    image = read_header(uploaded)
+    try:
+        if not needs_normalizing(image):
+            return uploaded
+        content, format_ = normalize(image)
+    finally:
+        uploaded.seek(0)
+    stem = os.path.splitext(os.path.basename(uploaded.name))[0]
+    extension = 'png' if format_ == 'PNG' else 'jpg'
+    return SimpleUploadedFile(
+        f'{stem}.{extension}', content, content_type=f'image/{format_.lower()}'
+    )
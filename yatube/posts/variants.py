@@ -0,0 +1,169 @@
+"""Уменьшенные копии картинки записи для <picture>/srcset карточки.
+
+Картинка декодируется один раз: кадр обрезается по центру до пропорций
+карточки 960x339, и из него каскадом, от большей ширины к меньшей,
+получаются копии VARIANT_WIDTHS. Каждая копия кодируется в WebP и JPEG.
+У JPEG декодер сразу уменьшает картинку (Image.draft) до размера,
+которого хватает на самую широкую копию.
+"""
+import io
+import math
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
+
+from .models import ImageVariant, StoredFile
+
+VARIANT_WIDTHS = (320, 640, 960, 1920)
+CARD_RATIO = 960 / 339
+ENCODERS = {
+    ImageVariant.WEBP: ('WEBP', {'quality': 80, 'method': 4}),
+    ImageVariant.JPEG: ('JPEG', {'quality': 85, 'optimize': True,
+                                 'progressive': True}),
+}
+MIME_TYPES = {
+    ImageVariant.WEBP: 'image/webp',
+    ImageVariant.JPEG: 'image/jpeg',
+}
+
+
+def crop_box(width, height, ratio=CARD_RATIO):
+    """Рамка по центру кадра с пропорциями ratio."""
+    if width / height > ratio:
+        crop_width = round(height * ratio)
+        left = (width - crop_width) // 2
+        return left, 0, left + crop_width, height
+    crop_height = round(width / ratio)
+    top = (height - crop_height) // 2
+    return 0, top, width, top + crop_height
+
+
+def target_widths(width):
+    """Ширины копий для кадра шириной width.
+
+    Копии шире исходника не делаются, кроме самой узкой: маленькая
+    картинка растягивается до неё, как раньше делал upscale=True.
+    """
+    return [w for w in VARIANT_WIDTHS if w <= width] or [VARIANT_WIDTHS[0]]
+
+
+def decode(file_):
+    """Открыть картинку и обрезать до пропорций карточки (RGB)."""
+    image = Image.open(file_)
+    width, height = image.size
+    left, top, right, bottom = crop_box(width, height)
+    scale = max(target_widths(right - left)) / (right - left)
+    if scale < 1:
+        image.draft('RGB', (math.ceil(width * scale),
+                            math.ceil(height * scale)))
+        # draft уменьшает кадр в целое число раз: пересчитываем рамку
+        width, height = image.size
+        left, top, right, bottom = crop_box(width, height)
+    return image.convert('RGB').crop((left, top, right, bottom))
+
+
+def render(file_):
+    """Копии картинки: кортежи (формат, ширина, высота, байты)."""
+    frame = decode(file_)
+    for width in sorted(target_widths(frame.width), reverse=True):
+        height = max(1, round(width / CARD_RATIO))
+        frame = frame.resize((width, height), Image.LANCZOS)
+        for format_, (pil_format, params) in ENCODERS.items():
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, **params)
+            yield format_, width, height, buffer.getvalue()
+
+
+def is_fresh(post):
+    """Копии записи сделаны из её текущей картинки."""
+    variants = post.variants.all()
+    return bool(variants) and all(
+        variant.source == post.image.name for variant in variants
+    )
+
+
+def render_variants(post):
+    """Новые (несохранённые) копии картинки записи."""
+    post.image.open('rb')
+    try:
+        rendered = list(render(post.image))
+    finally:
+        post.image.close()
+    stem = post.image.name.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+    variants = []
+    for format_, width, height, content in rendered:
+        variant = ImageVariant(post=post, source=post.image.name,
+                               format=format_, width=width, height=height)
+        variant.image.save(f'{stem}_{width}.{format_}', ContentFile(content),
+                           save=False)
+        variants.append(variant)
+    return variants
+
+
+def shared_variants(post):
+    """Копии той же картинки у другой записи, если они уже сделаны.
+
+    Картинки хранятся по содержимому, поэтому одинаковые загрузки имеют
+    одно имя файла, и готовые копии можно взять без декодирования.
+    """
+    donor = ImageVariant.objects.filter(source=post.image.name).exclude(
+        post=post
+    ).values_list('post_id', flat=True).first()
+    if donor is None:
+        return []
+    return [
+        ImageVariant(post=post, source=variant.source, format=variant.format,
+                     width=variant.width, height=variant.height,
+                     image=variant.image.name)
+        for variant in ImageVariant.objects.filter(post_id=donor)
+    ]
+
+
+def build_variants(post):
+    """Создать копии картинки записи взамен устаревших.
+
+    return - список созданных ImageVariant.
+    """
+    variants = shared_variants(post) or render_variants(post)
+    with transaction.atomic():
+        # delete() отправляет post_delete для каждой копии, и сигнал
+        # освобождает ссылку на её файл
+        ImageVariant.objects.filter(post=post).delete()
+        ImageVariant.objects.bulk_create(variants)
+        for variant in variants:
+            StoredFile.acquire(variant.image.name)
+    return variants
+
+
+def picture(post):
+    """Данные для <picture> карточки или None, если копий ещё нет.
+
+    Берёт копии из post.variants.all(), которые лента подгружает
+    prefetch_related, поэтому не обращается к БД. Источники идут в
+    порядке ENCODERS: браузер берёт первый формат, который понимает.
+    """
+    if not post.image or not is_fresh(post):
+        return None
+    by_format = {format_: [] for format_ in ENCODERS}
+    for variant in post.variants.all():
+        by_format[variant.format].append(variant)
+    jpegs = by_format[ImageVariant.JPEG]
+    if not jpegs:
+        return None
+    # Для браузеров без <picture> - копия шириной карточки
+    fallback = max(
+        (variant for variant in jpegs if variant.width <= 960),
+        key=lambda variant: variant.width, default=jpegs[0]
+    )
+    return {
+        'sources': [
+            {'type': MIME_TYPES[format_],
+             'srcset': ', '.join(f'{variant.image.url} {variant.width}w'
+                                 for variant in variants)}
+            for format_, variants in by_format.items() if variants
+        ],
+        'src': fallback.image.url,
+        'width': fallback.width,
+        'height': fallback.height,
+    }
@@ -2,12 +2,23 @@ from http import HTTPStatus
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.views.decorators.http import require_safe
 
+from . import (comment_buffer, follow_graph, invalidation, search,
+               suggestions, thumbnails)
+from .api import json_response
+from .counts import (SCOPE_ALL, SCOPE_AUTHOR, SCOPE_FOLLOW, SCOPE_GROUP,
+                     SCOPE_GROUPS, count_key)
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
+from .paginators import (CURSOR_NEXT, CountingPaginator, CursorPaginator,
+                         encode_cursor)
+from .timeline import TimelineFeed
 
 
 def page_not_found(request, exception):
@@ -23,24 +34,39 @@ def server_error(request):
         status=HTTPStatus.INTERNAL_SERVER_ERROR)
 
 
-def pagination(request, objects):
+def pagination(request, objects, cursor=None, count_key=None):
     """Рутина подготовки Пагинатора для страниц.
 
     аргументы:
-    request - HttpRequest от запрошенной страницы, содержит номер страницы,
-              для которой нужно вывести порцию объектов
+    request - HttpRequest от запрошенной страницы, содержит номер страницы
+              или токен курсора, для которых нужно вывести порцию объектов
     objects - набор объектов, которые надо разбить постранично
+    cursor - режим пагинации по курсору вместо номеров страниц, по
+             умолчанию включается для view из PAGINATOR_CURSOR_VIEWS
+    count_key - ключ кешированного счётчика objects (см. counts.py)
     return - порция объектов для номера страницы из request
     """
-    paginator = Paginator(objects, settings.PAGINATOR_DEFAULT_SIZE)
+    if cursor is None:
+        url_name = getattr(request.resolver_match, 'url_name', None)
+        cursor = url_name in settings.PAGINATOR_CURSOR_VIEWS
+    if cursor:
+        paginator = CursorPaginator(objects, settings.PAGINATOR_DEFAULT_SIZE)
+        return paginator.get_page(request.GET.get('cursor'))
+
+    paginator = CountingPaginator(
+        objects, settings.PAGINATOR_DEFAULT_SIZE, count_key=count_key
+    )
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return page
 
 
+@invalidation.cache_page_by_generations(
+    lambda request: [(invalidation.SCOPE_FEED, None)]
+)
 def index(request):
-    post_list = Post.objects.all()
-    page = pagination(request, post_list)
+    post_list = Post.objects.feed()
+    page = pagination(request, post_list, count_key=count_key(SCOPE_ALL))
     return render(
         request,
         'posts/index.html',
@@ -48,21 +74,36 @@ def index(request):
     )
 
 
+@invalidation.cache_page_by_generations(
+    lambda request, slug: [(invalidation.SCOPE_GROUP, slug)]
+)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page = pagination(request, post_list)
+    post_list = group.posts.feed()
+    page = pagination(request, post_list,
+                      count_key=count_key(SCOPE_GROUP, group.pk))
 
     return render(request, 'posts/group.html',
                   {'group': group, 'page': page})
 
 
+@invalidation.cache_page_by_generations(
+    lambda request: [(invalidation.SCOPE_GROUPS, None)]
+)
 def group_index(request):
     groups_list = Group.objects.all()
-    page = pagination(request, groups_list)
+    page = pagination(request, groups_list,
+                      count_key=count_key(SCOPE_GROUPS))
     return render(request, 'posts/group_index.html', {'page': page})
 
 
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page = pagination(request, search.search(query), cursor=False)
+    return render(request, 'posts/search.html',
+                  {'page': page, 'query': query})
+
+
 @login_required
 def new_post(request):
     """For post-obj create form, render and check it, then save model-obj."""
@@ -73,39 +114,142 @@ def new_post(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        thumbnails.schedule(new_post)
         return redirect('index')
 
     return render(request, 'posts/new_post.html',
                   {'form': form, 'edit_flag': False})
 
 
+def profile_scopes(request, username):
+    scopes = [
+        (invalidation.SCOPE_AUTHOR, username),
+        (invalidation.SCOPE_SUGGESTIONS, None),
+    ]
+    if request.user.is_authenticated:
+        # Блок "Кого читать" зависит от подписок читателя: подписка
+        # сдвигает его поколение, но не поколение чужого профиля
+        scopes.append((invalidation.SCOPE_AUTHOR, request.user.username))
+    return scopes
+
+
+@invalidation.cache_page_by_generations(profile_scopes)
 def profile(request, username):
-    profile_user = get_object_or_404(User, username=username)
+    profile_user = get_object_or_404(
+        User.objects.select_related('counters'), username=username
+    )
 
-    user_posts = profile_user.posts.all()
-    page = pagination(request, user_posts)
+    user_posts = profile_user.posts.feed()
+    page = pagination(request, user_posts,
+                      count_key=count_key(SCOPE_AUTHOR, profile_user.pk))
 
-    follow_flag = False
-    if ((request.user.is_authenticated)
-        and Follow.objects.filter(
-            user=request.user, author=profile_user).exists()):
-        follow_flag = True
+    follow_flag = (request.user.is_authenticated
+                   and follow_graph.is_following(request.user.pk,
+                                                 profile_user.pk))
 
     return render(request, 'posts/profile.html',
                   {'profile_user': profile_user,
-                   'page': page, 'following': follow_flag})
-
-
+                   'page': page, 'following': follow_flag,
+                   'suggested_authors': suggestions.suggested_authors(
+                       request.user, exclude=(profile_user.pk,)
+                   )})
+
+
+@invalidation.cache_page_by_generations(
+    lambda request, username, post_id, *args, **kwargs: [
+        (invalidation.SCOPE_AUTHOR, username),
+        (invalidation.SCOPE_POST, post_id),
+    ]
+)
 def post_view(request, username, post_id, anchor=None):
-    post = get_object_or_404(Post, author__username=username, id=post_id)
+    post = get_object_or_404(
+        Post.objects.feed().select_related('author__counters'),
+        author__username=username, id=post_id
+    )
     form = CommentForm(None)
+    cursor = request.GET.get('comments')
+    comments_page = comment_page(post, cursor) if cursor else None
     return render(request, 'posts/post.html',
                   {'post': post,
                    'form': form,
-                   'comments': post.comments.all(),
+                   'comments_page': comments_page,
+                   'comments': rendered_comments(post, comments_page),
+                   'pending_comments': comment_buffer.pending_comments(
+                       request.user, post
+                   ),
                    'anchor': anchor})
 
 
+def comment_page(post, cursor=None):
+    """Порция комментариев записи от старых к новым после курсора."""
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PAGE_SIZE, date_field='created', newest_first=False
+    )
+    return paginator.get_page(cursor)
+
+
+def rendered_comments(post, page=None):
+    """HTML порции комментариев со ссылкой "Показать ещё".
+
+    Первая порция (page=None) одинакова для всех читателей и хранится
+    в кеше до нового или удалённого комментария записи.
+    """
+    def render_page(page):
+        return render_to_string('includes/comment_list.html',
+                                {'post': post, 'page': page})
+
+    if page is not None:
+        return render_page(page)
+    return invalidation.cached_fragment(
+        f'comments:{post.pk}', [(invalidation.SCOPE_POST, post.pk)],
+        lambda: render_page(comment_page(post))
+    )
+
+
+@require_safe
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев для "Показать ещё": HTML или,
+    с ?format=json, JSON с тем же HTML и данными комментариев."""
+    post = get_object_or_404(Post.objects.select_related('author'),
+                             author__username=username, id=post_id)
+    cursor = request.GET.get('cursor')
+    page = comment_page(post, cursor) if cursor else None
+    html = rendered_comments(post, page)
+    if request.GET.get('format') != 'json':
+        return HttpResponse(html)
+    if page is None:
+        page = comment_page(post)
+    next_url = None
+    if page.has_next():
+        next_url = (f'{reverse("post_comments", args=(username, post_id))}'
+                    f'?format=json&cursor={page.next_cursor}')
+    return json_response({
+        'html': html,
+        'results': [
+            {'id': comment.pk, 'text': comment.text,
+             'created': comment.created, 'author': comment.author.username}
+            for comment in page
+        ],
+        'next': next_url,
+    })
+
+
+def comment_url(post, comment):
+    """Адрес страницы записи с порцией комментариев, в которой виден
+    comment."""
+    url = reverse('post', args=(post.author.username, post.pk))
+    earlier = post.comments.filter(
+        Q(created__lt=comment.created)
+        | Q(created=comment.created, pk__lt=comment.pk)
+    ).order_by('-created', '-pk')
+    size = settings.COMMENTS_PAGE_SIZE
+    if earlier[size - 1:size].exists():
+        cursor = encode_cursor(CURSOR_NEXT, earlier.first(), 'created')
+        url = f'{url}?comments={cursor}'
+    return f'{url}#comment_{comment.pk}'
+
+
 @login_required
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, id=post_id)
@@ -117,6 +261,8 @@ def post_edit(request, username, post_id):
                     files=request.FILES or None, instance=post)
     if form.is_valid():
         post.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('post', username=post.author.username,
                         post_id=post_id)
 
@@ -126,30 +272,34 @@ def post_edit(request, username, post_id):
 
 @login_required
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, id=post_id)
+    post = get_object_or_404(Post.objects.select_related('author'),
+                             author__username=username, id=post_id)
     form = CommentForm(request.POST or None)
+    if form.is_valid() and comment_buffer.is_enabled():
+        comment_buffer.buffer.add(post, request.user,
+                                  form.cleaned_data['text'])
+        url = reverse('post', args=(post.author.username, post.pk))
+        return redirect(f'{url}#pending-comments')
     if form.is_valid():
         new_comment = form.save(commit=False)
         new_comment.author = request.user
         new_comment.post = post
         new_comment.save()
-        comment_anchor = f'#comment_{new_comment.id}'
-        post_reverse = reverse('post', args=(post.author.username, post.id))
-        post_with_anchor = f'{post_reverse}{comment_anchor}'
-        return redirect(post_with_anchor, username=post.author.username,
-                        post_id=post.id)
+        return redirect(comment_url(post, new_comment))
     return redirect('post', username=post.author.username,
                     post_id=post.id)
 
 
 @login_required
 def follow_index(request):
-    posts_list = Post.objects.filter(author__following__user=request.user)
-    page = pagination(request, posts_list)
+    posts_list = TimelineFeed(request.user)
+    page = pagination(request, posts_list,
+                      count_key=count_key(SCOPE_FOLLOW, request.user.pk))
     return render(
         request,
         'posts/follow.html',
-        {'page': page},
+        {'page': page,
+         'suggested_authors': suggestions.suggested_authors(request.user)},
     )
 
 
@@ -157,14 +307,20 @@ def follow_index(request):
 def profile_follow(request, username):
     profile_user = get_object_or_404(User, username=username)
     if (request.user != profile_user):
-        Follow.objects.get_or_create(
+        _, created = Follow.objects.get_or_create(
             user=request.user, author=profile_user
         )
+        if not created:
+            # Подписка уже была: массивы в кеше могли её не знать
+            follow_graph.forget(request.user.pk, profile_user.pk)
     return redirect('profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     profile_user = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=profile_user).delete()
+    deleted, _ = Follow.objects.filter(user=request.user,
+                                       author=profile_user).delete()
+    if not deleted:
+        follow_graph.forget(request.user.pk, profile_user.pk)
     return redirect('profile', username=username)
@@ -0,0 +1,124 @@
+"""Настройки базы данных из переменных окружения.
+
+YATUBE_DB_ENGINE         sqlite (по умолчанию) или postgresql
+YATUBE_DB_NAME           файл SQLite (по умолчанию db.sqlite3 проекта)
+                         или имя базы PostgreSQL (по умолчанию yatube)
+YATUBE_DB_USER, YATUBE_DB_PASSWORD, YATUBE_DB_HOST, YATUBE_DB_PORT
+                         подключение к PostgreSQL
+YATUBE_DB_CONN_MAX_AGE   сколько секунд держать соединение между
+                         запросами (0 - закрывать после каждого,
+                         none - не закрывать), по умолчанию 60
+YATUBE_SQLITE_PROFILE    PRAGMA каждого нового соединения SQLite: none
+                         (по умолчанию) или tuned - WAL, synchronous=
+                         NORMAL, mmap и ожидание блокировки вместо
+                         ошибки "database is locked"
+YATUBE_SQLITE_MMAP_SIZE, YATUBE_SQLITE_BUSY_TIMEOUT
+                         байт mmap и мс ожидания блокировки для tuned
+
+PRAGMA выполняет обработчик connection_created: Django открывает
+соединение SQLite без них, а mmap_size, synchronous и busy_timeout
+действуют только в пределах соединения. WAL записывается в файл базы
+и остаётся включённым и без профиля.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+SQLITE_PROFILES = {
+    'none': {},
+    'tuned': {
+        # Читатели не ждут писателя, писатель - читателей
+        'journal_mode': 'WAL',
+        # В WAL fsync только при контрольной точке: после сбоя питания
+        # можно потерять последние транзакции, но не испортить файл
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def env(name, default=None):
+    value = os.environ.get(name, '').strip()
+    return value or default
+
+
+def conn_max_age():
+    value = env('YATUBE_DB_CONN_MAX_AGE', '60')
+    if value.lower() == 'none':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(
+            f'YATUBE_DB_CONN_MAX_AGE: ожидалось число или none, а не '
+            f'"{value}".'
+        )
+
+
+def sqlite_pragmas():
+    profile = env('YATUBE_SQLITE_PROFILE', 'none')
+    if profile not in SQLITE_PROFILES:
+        raise ImproperlyConfigured(
+            f'YATUBE_SQLITE_PROFILE: допустимы '
+            f'{", ".join(SQLITE_PROFILES)}, а не "{profile}".'
+        )
+    pragmas = dict(SQLITE_PROFILES[profile])
+    if pragmas:
+        for name in ('mmap_size', 'busy_timeout'):
+            value = env(f'YATUBE_SQLITE_{name.upper()}')
+            if value is None:
+                continue
+            try:
+                pragmas[name] = int(value)
+            except ValueError:
+                raise ImproperlyConfigured(
+                    f'YATUBE_SQLITE_{name.upper()}: ожидалось число, а не '
+                    f'"{value}".'
+                )
+    return pragmas
+
+
+def from_env(base_dir):
+    """Настройки базы default для DATABASES."""
+    engine = env('YATUBE_DB_ENGINE', 'sqlite')
+    if engine == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': env('YATUBE_DB_NAME',
+                        os.path.join(base_dir, 'db.sqlite3')),
+            'CONN_MAX_AGE': conn_max_age(),
+            'PRAGMAS': sqlite_pragmas(),
+        }
+    if engine == 'postgresql':
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env('YATUBE_DB_NAME', 'yatube'),
+            'USER': env('YATUBE_DB_USER', 'yatube'),
+            'PASSWORD': env('YATUBE_DB_PASSWORD', ''),
+            'HOST': env('YATUBE_DB_HOST', 'localhost'),
+            'PORT': env('YATUBE_DB_PORT', '5432'),
+            'CONN_MAX_AGE': conn_max_age(),
+            'OPTIONS': {'connect_timeout': 5},
+        }
+    raise ImproperlyConfigured(
+        f'YATUBE_DB_ENGINE: допустимы sqlite и postgresql, а не "{engine}".'
+    )
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS') or {}
+    if pragmas:
+        with connection.cursor() as cursor:
+            execute_pragmas(cursor, pragmas)
+
+
+def execute_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 import os
 from typing import List
 
+from yatube import database
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 SECRET_KEY = '5$%wy)^64z_*^ys)$k@l*2dl#t0s(6zpg-gf3bai)mqy03)nxt'
@@ -40,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,11 +74,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Движок, подключение, постоянные соединения и PRAGMA SQLite задаются
+# переменными окружения YATUBE_DB_*, см. yatube/database.py
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    'default': database.from_env(BASE_DIR),
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -115,11 +117,84 @@ LOGIN_REDIRECT_URL = 'index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Кеш должен быть общим для всех процессов сервера. Через него процессы
+# видят смену поколений страниц и версий карточек (posts/invalidation.py),
+# комментарии в очереди (posts/comment_buffer.py), граф подписок
+# (posts/follow_graph.py) и сводки замеров друг друга (posts/metrics.py).
+# LocMemCache живёт в одном процессе и годится только для runserver и
+# тестов: при нескольких процессах страницы и сводки расходятся. В бою
+# задайте YATUBE_CACHE_BACKEND и YATUBE_CACHE_LOCATION (memcached или,
+# на одном сервере, FileBasedCache), иначе check выдаст posts.W001.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-someobject'
+        'BACKEND': os.environ.get(
+            'YATUBE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('YATUBE_CACHE_LOCATION',
+                                   'unique-someobject'),
     }
 }
 
 PAGINATOR_DEFAULT_SIZE = 10
+# Сколько номеров страниц выводить по каждую сторону от текущей
+PAGINATOR_PAGE_WINDOW = 3
+# Время жизни кешированного общего количества записей ленты, секунд
+PAGINATOR_COUNT_TIMEOUT = 60 * 10
+# Комментариев на странице записи и в каждой подгрузке "Показать ещё"
+COMMENTS_PAGE_SIZE = 20
+# Ленты, которые листаются курсором (?cursor=) вместо номеров страниц
+PAGINATOR_CURSOR_VIEWS: List[str] = []
+
+# Сколько хранить страницы лент для гостей, секунд (0 - не кешировать).
+# Устаревшие страницы отсекаются сменой поколения, см. posts/invalidation.py
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Загружаемые картинки: большая сторона сохраняемого оригинала и предел
+# разрешения, выше которого файл отклоняется без декодирования
+UPLOAD_IMAGE_MAX_SIDE = 2560
+UPLOAD_IMAGE_MAX_PIXELS = 40_000_000
+
+# Потоков фоновой генерации копий картинок записей (posts/thumbnails.py)
+THUMBNAIL_WORKERS = 2
+# Создавать копии в потоке запроса сразу после фиксации, без пула.
+# Для тестов: второй писатель из пула ломает их базу SQLite в памяти
+THUMBNAIL_SYNC = False
+# Метаданные миниатюр sorl-thumbnail: общий для процессов файл SQLite,
+# загружаемый в память при первом обращении (posts/thumbnail_store.py)
+THUMBNAIL_KVSTORE = 'posts.thumbnail_store.SQLiteKVStore'
+THUMBNAIL_KVSTORE_PATH = os.path.join(BASE_DIR, 'thumbnails.sqlite3')
+
+# Тесты пишут метаданные миниатюр во временный файл, см. yatube/testing.py
+TEST_RUNNER = 'yatube.testing.TemporaryFilesRunner'
+
+# Авторы, у которых подписчиков больше этого числа, не раскладывают новые
+# записи по лентам подписчиков: их записи подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько хранить в кеше подписки и подписчиков пользователя
+# (posts/follow_graph.py), секунд
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
+# Блок "Кого читать" (posts/suggestions.py): сколько предложений на
+# читателя хранит команда suggest_authors и сколько выводится на странице
+SUGGESTIONS_TOP = 20
+SUGGESTIONS_SHOWN = 5
+
+# Замеры стоимости запросов по именам URL (posts/metrics.py): доля
+# замеряемых запросов (0 - выключено), порог медленного SQL-запроса, мс,
+# сколько самых медленных запросов хранить и раз во сколько секунд
+# копировать сводку процесса в кеш
+METRICS_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+METRICS_SLOW_QUERY_MS = 100
+METRICS_SLOW_QUERIES = 20
+METRICS_FLUSH_INTERVAL = 10
+
+# Отложенная запись комментариев (posts/comment_buffer.py): 'sync' - в
+# запросе, 'memory' - очередь в памяти процесса, 'journal' - очередь и
+# журнал на диске, дописанный с fsync до ответа. Очередь записывается
+# раз в COMMENT_BUFFER_INTERVAL секунд (0 - без потока, в запросе,
+# заполнившем очередь) или как только в ней COMMENT_BUFFER_SIZE
+# комментариев
+COMMENT_BUFFER_DURABILITY = 'sync' if DEBUG else 'journal'
+COMMENT_BUFFER_INTERVAL = 1.0
+COMMENT_BUFFER_SIZE = 200
+COMMENT_BUFFER_JOURNAL_DIR = os.path.join(BASE_DIR, 'comment_journal')
@@ -0,0 +1,28 @@
+"""Запуск тестов manage.py test с временными файлами вместо рабочих."""
+import os
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def temporary_files(directory):
+    """Настройки файлов, которые тесты не должны писать в проект."""
+    return override_settings(
+        THUMBNAIL_KVSTORE_PATH=os.path.join(directory, 'thumbnails.sqlite3')
+    )
+
+
+class TemporaryFilesRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.mkdtemp()
+        self.files = temporary_files(self.directory)
+        self.files.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.files.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
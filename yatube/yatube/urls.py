@@ -24,6 +24,7 @@ handler500 = 'posts.views.server_error'
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/v1/', include('posts.api_urls', namespace='api')),
     path('', include('posts.urls')),
     path('about/', include('about.urls', namespace='about')),
     path('auth/', include('django.contrib.auth.urls')),